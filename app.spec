@@ -22,7 +22,7 @@ a = Analysis(
     pathex=[backend_folder],
     binaries=[],
     datas=backend_data + frontend_build,
-    hiddenimports=['models', 'utils', 'webbrowser', 'flask', 'flask_cors', 'pandas', 'sqlalchemy', 'sqlite3', 'openpyxl'] + collect_submodules('backend'), 
+    hiddenimports=['models', 'utils', 'snapshots', 'comparison', 'report_cache', 'timeseries', 'search_index', 'pagination', 'autocomplete', 'fuzzy_search', 'facets', 'search_explain', 'bulk_updates', 'relocations', 'change_log', 'change_events', 'edit_batches', 'deletions', 'clones', 'serving', 'replicas', 'webbrowser', 'flask', 'flask_cors', 'pandas', 'sqlalchemy', 'sqlite3', 'openpyxl'] + collect_submodules('backend'), 
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -1,25 +1,51 @@
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import Flask, Response, g, request, jsonify, send_from_directory, send_file, stream_with_context
 from flask_cors import CORS
-from models import (Folder, Table, DataEntry, get_session, 
+from models import (Folder, Table, DataEntry, SEARCH_INDEX_TABLE, get_session, 
                     dispose_db, create_new_db, init_db, set_db_path, 
-                    check_db_schema, is_valid_sqlite_db)
+                    check_db_schema, is_valid_sqlite_db,
+                    bind_request_database, release_request_database, database_options, get_database)
 from utils import (process_excel_data, 
                    insert_data_entries, get_org_chart, 
-                   get_department_structure, get_age_distribution, export_excel_data, generate_hierarchical_structure)
+                   get_department_structure, get_age_distribution, export_excel_data)
+from snapshots import (STORAGE_MODES, snapshot_select, tables_snapshot_select,
+                       snapshot_contains, folder_snapshots)
+from comparison import NULL_PERSON_IDS
+from report_cache import get_or_build_report, precompute_consecutive_reports
+from timeseries import get_folder_timeseries
+from search_index import candidate_ids, tables_candidate_ids, compile_fts_query, BROAD_QUERY_CANDIDATES
+from autocomplete import COMPLETION_FIELDS, MAX_COMPLETIONS, complete, completion_stats
+from fuzzy_search import (SEARCH_MODES, FUZZY_FIELDS, MAX_EDIT_DISTANCE, FUZZY_RESULT_LIMIT,
+                          fuzzy_search_table, precompute_fuzzy_indexes)
+from facets import FACET_FIELDS, facet_counts
+from bulk_updates import bulk_update_person
+from change_log import current_version, changes_since
+from change_events import RECONNECT_MILLISECONDS, broker, latest_version, stream_changes
+from relocations import UPDATE_TYPES, relocate_across_tables, move_subtree_across_tables
+from edit_batches import read_edit_batch, apply_edit_batch
+from deletions import delete_tables, reclaim_space
+from clones import CLONE_MODES, clone_table
+from serving import DEFAULT_WORKERS, make_pooled_server
+from search_explain import PhaseTimer, count_vm_steps, literal_sql, query_plan
+from pagination import TOTAL_MODES, MAX_PAGE_SIZE, decode_cursor, keyset_page, split_page, count_results
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 from datetime import datetime
 import os
 import time
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
+from contextvars import copy_context
+from functools import lru_cache
+from itertools import groupby
 from sqlalchemy import func
 import webbrowser
 import threading
 import sys
 import re
-from sqlalchemy import and_, or_, not_, inspect
+from sqlalchemy import and_, or_, not_, inspect, select, case, literal
 from datetime import datetime, date
 import subprocess
+import json
+import argparse
 
 def resource_path(relative_path):
     try:
@@ -68,6 +94,18 @@ def validate_input(**expected_args):
         return wrapper
     return decorator
 
+@app.before_request
+def bind_database():
+    # Selecting another database (/folders, /check_existing_db) only affects later requests;
+    # GET requests may read from the database's replica
+    g.database_token = bind_request_database(read_only=request.method == 'GET')
+
+@app.teardown_request
+def release_database(exception=None):
+    token = g.pop('database_token', None)
+    if token is not None:
+        release_request_database(token)
+
 @contextmanager
 def session_scope():
     session = get_session()
@@ -113,8 +151,8 @@ def check_existing_db():
     if not schema_valid:
         return jsonify({"error": f"Invalid database schema: {schema_message}"}), 400
 
-    dispose_db()
     set_db_path(db_path)
+    init_db()
 
     has_data = check_if_db_has_data()
 
@@ -142,7 +180,8 @@ def create_new_db_route():
     db_path = os.path.join(folder_path, db_name)
     logger.info(f"Attempting to create new database at: {db_path}")
     
-    dispose_db()
+    # Only this file's connections are closed; requests on another database carry on
+    dispose_db(db_path)
 
     if os.path.exists(db_path):
         try:
@@ -169,7 +208,7 @@ def create_new_db_route():
 
     if has_data:
         with session_scope() as session:
-            first_table = session.query(Table).first()
+            first_table = session.query(Table).filter_by(deleting=False).first()
             if first_table:
                 first_table_id = first_table.id
 
@@ -196,13 +235,17 @@ def upload_file(folder_name, upload_date):
     if file_extension not in ["csv", "xlsx"]:
         return jsonify({"error": "Unsupported file type. Please upload CSV or XLSX files."}), 400
 
+    storage_mode = request.form.get('storage_mode')
+    if storage_mode is not None and storage_mode not in STORAGE_MODES:
+        return jsonify({"error": f"Invalid storage_mode. Use one of: {', '.join(STORAGE_MODES)}"}), 400
+
     new_folder_created = False
     new_folder_id = None
     with session_scope() as session:
         try:
             # Attempt to retrieve or create the folder
             logger.info(f"Checking for existing folder: {folder_name}")
-            folder = session.query(Folder).filter_by(name=folder_name).first()
+            folder = session.query(Folder).filter_by(name=folder_name, deleting=False).first()
             if not folder:
                 logger.info(f"Folder {folder_name} not found. Creating new folder.")
                 folder = Folder(name=folder_name)
@@ -210,6 +253,8 @@ def upload_file(folder_name, upload_date):
                 session.flush()  # Flush to get the folder ID
                 new_folder_created = True
                 new_folder_id = folder.id
+            if storage_mode:
+                folder.storage_mode = storage_mode
             logger.info(f"Using folder: {folder.name} (ID: {folder.id}), new folder created: {new_folder_created}")
 
             # Process file and create table
@@ -228,11 +273,17 @@ def upload_file(folder_name, upload_date):
             logger.info(f"File processed and data inserted successfully for table ID: {table.id}")
             session.commit()
             logger.info(f"Upload completed successfully for folder: {folder_name}, table ID: {table.id}")
+
+            # Reports against the neighbouring snapshots are built off the request path
+            # on the database of this request, even if another one is selected meanwhile
+            threading.Thread(target=copy_context().run, args=(precompute_consecutive_reports, table.id), daemon=True).start()
+            threading.Thread(target=copy_context().run, args=(precompute_fuzzy_indexes, table.id), daemon=True).start()
             
             return jsonify({
                 "message": "File uploaded and processed successfully",
                 "table_id": table.id,
-                "folder_id": folder.id
+                "folder_id": folder.id,
+                "storage_mode": table.storage_mode
             }), 200
 
         except Exception as e:
@@ -255,10 +306,58 @@ def upload_file(folder_name, upload_date):
             
             return jsonify({"error": str(e)}), 500
 
+def stream_deletion(description, table_ids, folder_id=None):
+    """
+    Delete tables (and a folder) and reclaim the freed space, streaming the progress as
+    newline-delimited JSON, followed by a summary line with "done": true and the timings.
+    With vacuum=full, a database older than incremental vacuum is compacted with VACUUM.
+    """
+    full_vacuum = request.args.get('vacuum') == 'full'
+    session = get_session()
+
+    def generate():
+        start = time.perf_counter()
+        timings = {}
+        try:
+            for progress in delete_tables(session, table_ids, folder_id):
+                timings['delete_ms'] = progress['elapsed_ms']
+                yield json.dumps(progress) + '\n'
+            reclaimed_bytes = 0
+            for progress in reclaim_space(session.get_bind(), full=full_vacuum):
+                timings['vacuum_ms'] = progress['elapsed_ms']
+                reclaimed_bytes = progress['reclaimed_bytes']
+                yield json.dumps(progress) + '\n'
+            timings['total_ms'] = round((time.perf_counter() - start) * 1000, 2)
+            logger.info(f"Deleted {description}: {timings}")
+            yield json.dumps({"done": True, "table_ids": table_ids, "reclaimed_bytes": reclaimed_bytes, **timings}) + '\n'
+        except Exception as e:
+            session.rollback()
+            logger.exception(f"Error deleting {description}: {str(e)}")
+            yield json.dumps({"error": f"An error occurred while deleting {description}; run the deletion again to finish it"}) + '\n'
+        finally:
+            session.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route("/delete_table/<int:folder_id>/<int:table_id>", methods=["DELETE"])
+def delete_table(folder_id, table_id):
+    with session_scope() as session:
+        if not session.query(Table.id).filter_by(id=table_id, folder_id=folder_id).first():
+            return jsonify({"error": f"Table with id {table_id} not found in folder {folder_id}"}), 404
+    return stream_deletion(f"table {table_id}", [table_id])
+
+@app.route("/delete_folder/<int:folder_id>", methods=["DELETE"])
+def delete_folder(folder_id):
+    with session_scope() as session:
+        if not session.get(Folder, folder_id):
+            return jsonify({"error": f"Folder with id {folder_id} not found"}), 404
+        table_ids = [table_id for table_id, in session.query(Table.id).filter_by(folder_id=folder_id).order_by(Table.id)]
+    return stream_deletion(f"folder {folder_id}", table_ids, folder_id)
+
 @app.route("/folder_structure", methods=["GET"])
 def fetch_folder_structure():
     with session_scope() as session:
-        folders = session.query(Folder).all()
+        folders = session.query(Folder).filter_by(deleting=False).all()
         folder_structure = []
 
         for folder in folders:
@@ -267,8 +366,9 @@ def fetch_folder_structure():
                     "id": table.id,
                     "name": table.name,
                     "upload_date": (table.upload_date.isoformat() if table.upload_date else None),
+                    "clone_of_id": table.clone_of_id,
                 }
-                for table in folder.tables
+                for table in folder.tables if not table.deleting
             ]
             folder_structure.append({
                 "id": folder.id,
@@ -282,14 +382,17 @@ def fetch_folder_structure():
 @app.route("/view_tables", methods=["GET"])
 def view_tables():
     with session_scope() as session:
-        tables = session.query(Table).all()
+        tables = session.query(Table).filter_by(deleting=False).all()
         return jsonify([{"id": t.id, "name": t.name} for t in tables]), 200
 
 @app.route("/org_data", methods=["GET"], endpoint='get_org_data')
 @validate_input(table_id=int)
 def get_org_data(table_id):
+    # Read before the tree, so changes made while it is built are also returned by /changes
+    with session_scope() as session:
+        version = current_version(session, table_id)
     org_chart, log = get_org_chart(table_id)
-    response = {"org_chart": org_chart}
+    response = {"org_chart": org_chart, "version": version}
     if log:
         response["log"] = log
     return jsonify(response), 200
@@ -372,12 +475,7 @@ def get_timeline(folder_id):
     
     try:
         with session_scope() as session:
-            tables = (
-                session.query(Table)
-                .filter_by(folder_id=folder_id)
-                .order_by(Table.upload_date)
-                .all()
-            )
+            tables = folder_snapshots(session, folder_id)
             
             if not tables:
                 return jsonify({"error": f"No tables found in folder {folder_id}"}), 404
@@ -486,13 +584,12 @@ def get_folders_list():
     if not is_valid_sqlite_db(db_path):
         return jsonify({"error": "Invalid SQLite database file"}), 400
 
-    dispose_db()
     set_db_path(db_path)
     init_db()
 
     session = get_session()
     try:
-        folders = session.query(Folder).all()
+        folders = session.query(Folder).filter_by(deleting=False).all()
         folders_list = [{"id": folder.id, "name": folder.name} for folder in folders]
         return jsonify(folders_list), 200
     except SQLAlchemyError as e:
@@ -508,282 +605,28 @@ def get_folders_list():
 @validate_input(table1_id=int, table2_id=int)
 def compare_tables(folder_id, table1_id, table2_id):
     with session_scope() as session:
-        table1 = session.query(Table).filter_by(id=table1_id, folder_id=folder_id).first()
-        table2 = session.query(Table).filter_by(id=table2_id, folder_id=folder_id).first()
+        table1 = session.query(Table).filter_by(id=table1_id, folder_id=folder_id, deleting=False).first()
+        table2 = session.query(Table).filter_by(id=table2_id, folder_id=folder_id, deleting=False).first()
         
         if not table1 or not table2:
             return jsonify({"error": "One or both tables not found in the specified folder"}), 404
         
-        data1 = session.query(DataEntry).filter_by(table_id=table1.id).all()
-        data2 = session.query(DataEntry).filter_by(table_id=table2.id).all()
-        
-        changes = compare_org_data(data1, data2)
-        aggregated_report = generate_aggregated_report(changes, data1, data2)
-        
-        report = {
-            "table1": {
-                "id": table1.id,
-                "name": table1.name,
-                "upload_date": table1.upload_date.isoformat()
-            },
-            "table2": {
-                "id": table2.id,
-                "name": table2.name,
-                "upload_date": table2.upload_date.isoformat()
-            },
-            "changes": changes,
-            "aggregated_report": aggregated_report
-        }
+        report = get_or_build_report(session, table1, table2)
         
         return jsonify(report), 200
 
-def compare_org_data(data1, data2):
-    changes = {
-        "added": [],
-        "removed": [],
-        "changed": [],
-        "department_changes": {},
-        "role_changes": {},
-        "rank_changes": {},
-        "reporting_line_changes": {}
-    }
-    
-    data1_dict = {entry.person_id: entry for entry in data1}
-    data2_dict = {entry.person_id: entry for entry in data2}
-    
-    for person_id, entry2 in data2_dict.items():
-        if person_id not in data1_dict:
-            changes["added"].append(entry_to_dict(entry2))
-        else:
-            entry1 = data1_dict[person_id]
-            if entry1.department != entry2.department:
-                changes["department_changes"][person_id] = {
-                    "name": entry2.name,
-                    "old": entry1.department,
-                    "new": entry2.department
-                }
-            if entry1.role != entry2.role:
-                changes["role_changes"][person_id] = {
-                    "name": entry2.name,
-                    "old": entry1.role,
-                    "new": entry2.role
-                }
-            if entry1.rank != entry2.rank:
-                changes["rank_changes"][person_id] = {
-                    "name": entry2.name,
-                    "old": entry1.rank,
-                    "new": entry2.rank
-                }
-            if entry1.hierarchical_structure != entry2.hierarchical_structure:
-                changes["reporting_line_changes"][person_id] = {
-                    "name": entry2.name,
-                    "old": entry1.hierarchical_structure,
-                    "new": entry2.hierarchical_structure
-                }
-            if any([
-                entry1.department != entry2.department,
-                entry1.role != entry2.role,
-                entry1.rank != entry2.rank,
-                entry1.hierarchical_structure != entry2.hierarchical_structure
-            ]):
-                changes["changed"].append({
-                    "person_id": person_id,
-                    "name": entry2.name,
-                    "changes": {
-                        "department": (entry1.department, entry2.department),
-                        "role": (entry1.role, entry2.role),
-                        "rank": (entry1.rank, entry2.rank),
-                        "hierarchical_structure": (entry1.hierarchical_structure, entry2.hierarchical_structure)
-                    }
-                })
-    
-    for person_id, entry1 in data1_dict.items():
-        if person_id not in data2_dict:
-            changes["removed"].append(entry_to_dict(entry1))
-    
-    return changes
-
-def generate_aggregated_report(changes, data1, data2):
-    return {
-        "total_employees": {
-            "before": len(data1),
-            "after": len(data2),
-            "difference": len(data2) - len(data1)
-        },
-        "department_changes": summarize_changes(changes["department_changes"]),
-        "role_changes": summarize_changes(changes["role_changes"]),
-        "rank_changes": summarize_changes(changes["rank_changes"]),
-        "reporting_line_changes": summarize_changes(changes["reporting_line_changes"]),
-        "structural_changes": len(changes["changed"]),
-        "new_employees": len(changes["added"]),
-        "departed_employees": len(changes["removed"]),
-        "age_distribution_change": compare_age_distributions(data1, data2),
-        "rank_distribution_change": compare_rank_distributions(data1, data2),
-        "department_size_changes": compare_department_sizes(data1, data2),
-        "role_diversity": compare_role_diversity(data1, data2),
-        "org_depth_analysis": compare_org_depths(data1, data2),
-        "span_of_control_changes": compare_span_of_control(data1, data2),
-        "turnover_rate": calculate_turnover_rate(changes, data1),
-        "promotion_rate": calculate_promotion_rate(changes, data1)
-    }
-
-def summarize_changes(changes):
-    return {
-        "total": len(changes),
-        "details": changes
-    }
-
-def compare_age_distributions(data1, data2):
-    def get_age_distribution(data):
-        current_year = datetime.now().year
-        ages = []
-        for entry in data:
-            if isinstance(entry.birth_date, str):
-                try:
-                    birth_year = datetime.strptime(entry.birth_date, "%Y-%m-%d").year
-                except ValueError:
-                    continue  # Skip if the string is not in the correct format
-            elif isinstance(entry.birth_date, date):
-                birth_year = entry.birth_date.year
-            else:
-                continue  # Skip if birth_date is neither string nor date
-            ages.append(current_year - birth_year)
-        
-        if not ages:
-            return {"average": 0, "min": 0, "max": 0, "median": 0}
-        
-        return {
-            "average": sum(ages) / len(ages),
-            "min": min(ages),
-            "max": max(ages),
-            "median": sorted(ages)[len(ages) // 2]
-        }
-    
-    dist1 = get_age_distribution(data1)
-    dist2 = get_age_distribution(data2)
-    
-    return {
-        "before": dist1,
-        "after": dist2,
-        "average_change": dist2["average"] - dist1["average"],
-        "median_change": dist2["median"] - dist1["median"]
-    }
-
-def compare_rank_distributions(data1, data2):
-    def get_rank_distribution(data):
-        ranks = [entry.rank for entry in data]
-        return {rank: ranks.count(rank) for rank in set(ranks)}
-    
-    dist1 = get_rank_distribution(data1)
-    dist2 = get_rank_distribution(data2)
-    
-    all_ranks = set(list(dist1.keys()) + list(dist2.keys()))
-    
-    changes = {}
-    for rank in all_ranks:
-        before = dist1.get(rank, 0)
-        after = dist2.get(rank, 0)
-        if before != after:
-            changes[rank] = after - before
-    
-    return changes
-
-def compare_department_sizes(data1, data2):
-    def get_department_sizes(data):
-        departments = [entry.department for entry in data]
-        return {dept: departments.count(dept) for dept in set(departments)}
-    
-    sizes1 = get_department_sizes(data1)
-    sizes2 = get_department_sizes(data2)
-    
-    all_departments = set(list(sizes1.keys()) + list(sizes2.keys()))
-    
-    changes = {}
-    for dept in all_departments:
-        before = sizes1.get(dept, 0)
-        after = sizes2.get(dept, 0)
-        if before != after:
-            percent_change = ((after - before) / before * 100) if before > 0 else None
-            changes[dept] = {
-                "before": before,
-                "after": after,
-                "change": after - before,
-                "percent_change": percent_change
-            }
-    
-    return changes
-
-def compare_role_diversity(data1, data2):
-    def get_role_diversity(data):
-        roles = [entry.role for entry in data]
-        unique_roles = len(set(roles))
-        return {
-            "unique_roles": unique_roles,
-            "role_to_employee_ratio": unique_roles / len(data) if data else 0
-        }
-    
-    div1 = get_role_diversity(data1)
-    div2 = get_role_diversity(data2)
-    
-    return {
-        "before": div1,
-        "after": div2,
-        "unique_roles_change": div2["unique_roles"] - div1["unique_roles"],
-        "ratio_change": div2["role_to_employee_ratio"] - div1["role_to_employee_ratio"]
-    }
-
-def compare_org_depths(data1, data2):
-    def get_max_depth(data):
-        return max(len(entry.hierarchical_structure.split('/')) for entry in data)
-    
-    depth1 = get_max_depth(data1)
-    depth2 = get_max_depth(data2)
-    
-    return {
-        "before": depth1,
-        "after": depth2,
-        "change": depth2 - depth1
-    }
-
-def compare_span_of_control(data1, data2):
-    def get_avg_span(data):
-        manager_counts = {}
-        for entry in data:
-            manager = '/'.join(entry.hierarchical_structure.split('/')[:-1])
-            if manager:
-                manager_counts[manager] = manager_counts.get(manager, 0) + 1
-        return sum(manager_counts.values()) / len(manager_counts) if manager_counts else 0
-    
-    span1 = get_avg_span(data1)
-    span2 = get_avg_span(data2)
-    
-    return {
-        "before": span1,
-        "after": span2,
-        "change": span2 - span1
-    }
-
-def calculate_turnover_rate(changes, data1):
-    departed = len(changes["removed"])
-    total_before = len(data1)
-    return (departed / total_before) * 100 if total_before > 0 else 0
-
-def calculate_promotion_rate(changes, data1):
-    promotions = sum(1 for change in changes["rank_changes"].values() if change["old"] < change["new"])
-    total_before = len(data1)
-    return (promotions / total_before) * 100 if total_before > 0 else 0
+@app.route("/timeseries/<int:folder_id>", methods=["GET"])
+def get_timeseries(folder_id):
+    """
+    Return headcount, joins, departures, promotions and department sizes for every
+    snapshot of a folder, as series aligned with the snapshots in upload order.
+    """
+    with session_scope() as session:
+        if not session.query(Folder.id).filter_by(id=folder_id, deleting=False).first():
+            return jsonify({"error": "Folder not found"}), 404
 
-def entry_to_dict(entry):
-    return {
-        "person_id": entry.person_id,
-        "name": entry.name,
-        "role": entry.role,
-        "department": entry.department,
-        "rank": entry.rank,
-        "hierarchical_structure": entry.hierarchical_structure
-    }
+        return jsonify(get_folder_timeseries(session, folder_id)), 200
 
-    
 @app.route("/highlight_nodes", methods=["GET"], endpoint='highlight_nodes')
 @validate_input(hierarchical_structure=str, table_id=int)
 def highlight_nodes(hierarchical_structure, table_id):
@@ -825,7 +668,7 @@ def get_available_columns(folder_id, table_id):
         with session_scope() as session:
             table = (
                 session.query(Table)
-                .filter_by(id=table_id, folder_id=folder_id)
+                .filter_by(id=table_id, folder_id=folder_id, deleting=False)
                 .first()
             )
             
@@ -847,18 +690,213 @@ def get_available_columns(folder_id, table_id):
         logger.exception(f"Error fetching columns for folder {folder_id}, table {table_id}: {str(e)}")
         return jsonify({"error": "An unexpected error occurred while fetching columns"}), 500
 
+@app.route("/changes/<int:folder_id>/<int:table_id>", methods=["GET"])
+def get_table_changes(folder_id, table_id):
+    """
+    Return the node-level changes of a table after the version given by since, so a client
+    holding the tree from /org_data (which reports its version) can patch it. Without
+    since, only the current version is returned.
+    """
+    since = request.args.get('since', type=int)
+    if since is not None and since < 0:
+        return jsonify({"error": "since must be a non-negative version"}), 400
+
+    with session_scope() as session:
+        if not session.query(Table.id).filter_by(id=table_id, folder_id=folder_id, deleting=False).first():
+            return jsonify({"error": f"Table with id {table_id} not found in folder {folder_id}"}), 404
+
+        if since is None:
+            return jsonify({"table_id": table_id, "version": current_version(session, table_id)}), 200
+        return jsonify(changes_since(session, table_id, since)), 200
+
+@app.route("/events/<int:folder_id>", methods=["GET"])
+@app.route("/events/<int:folder_id>/<int:table_id>", methods=["GET"])
+def stream_change_events(folder_id, table_id=None):
+    """
+    Push the changes committed to a folder's tables, or to one table, as server-sent events.
+
+    Each "changes" event carries its version as id and lists the changed hierarchical
+    structures with their changed fields per table, or a reset flag when a table must be
+    fetched again. The stream resumes after the Last-Event-ID header or the since
+    parameter, and otherwise starts from the current version.
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', type=int)
+    if since is not None and since < 0:
+        return jsonify({"error": "since must be a non-negative version"}), 400
+
+    with session_scope() as session:
+        if not session.query(Folder.id).filter_by(id=folder_id, deleting=False).first():
+            return jsonify({"error": f"Folder with id {folder_id} not found"}), 404
+        if table_id is not None and not session.query(Table.id).filter_by(id=table_id, folder_id=folder_id, deleting=False).first():
+            return jsonify({"error": f"Table with id {table_id} not found in folder {folder_id}"}), 404
+
+        subscription = broker.subscribe(folder_id, table_id)
+        if subscription is None:
+            logger.warning(f"Refused event stream for folder {folder_id}: {broker.max_subscribers} streams already open")
+            response = jsonify({"error": "Too many open event streams, retry later"})
+            response.headers['Retry-After'] = str(RECONNECT_MILLISECONDS // 1000)
+            return response, 503
+        if since is None:
+            since = latest_version(session, subscription)
+
+    logger.info(f"Event stream opened for folder {folder_id}, table {table_id}, after version {since}")
+
+    def generate():
+        try:
+            yield from stream_changes(subscription, since)
+        except Exception as e:
+            logger.exception(f"Error streaming events for folder {folder_id}: {str(e)}")
+        finally:
+            broker.unsubscribe(subscription)
+            logger.info(f"Event stream closed for folder {folder_id}, table {table_id}")
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Also frees the slot if the client leaves before the stream starts
+    response.call_on_close(lambda: broker.unsubscribe(subscription))
+    return response
+
+@app.route("/autocomplete/<int:folder_id>/<int:table_id>", methods=["GET"])
+def autocomplete(folder_id, table_id):
+    """
+    Complete a typed prefix with the most frequent names, roles, departments and person IDs
+    of a table. The fields parameter narrows the completed fields (comma separated).
+    """
+    prefix = request.args.get('prefix', '')
+    fields = [field for field in request.args.get('fields', '').split(',') if field] or COMPLETION_FIELDS
+    limit = request.args.get('limit', 10, type=int)
+
+    invalid_fields = [field for field in fields if field not in COMPLETION_FIELDS]
+    if invalid_fields:
+        return jsonify({"error": f"Invalid fields: {', '.join(invalid_fields)}. Use any of: {', '.join(COMPLETION_FIELDS)}"}), 400
+    if not 1 <= limit <= MAX_COMPLETIONS:
+        return jsonify({"error": f"limit must be between 1 and {MAX_COMPLETIONS}"}), 400
+
+    with session_scope() as session:
+        if not session.query(Table.id).filter_by(id=table_id, folder_id=folder_id, deleting=False).first():
+            return jsonify({"error": f"Table with id {table_id} not found in folder {folder_id}"}), 404
+
+        start = time.perf_counter()
+        completions = complete(session, table_id, prefix, fields, limit)
+        return jsonify({
+            "prefix": prefix,
+            "completions": completions,
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+        }), 200
+
+@app.route("/autocomplete/stats", methods=["GET"])
+def autocomplete_stats():
+    """Report the autocomplete indexes held in memory and their approximate size."""
+    with session_scope() as session:
+        indexes = completion_stats(session)
+        return jsonify({
+            "indexes": indexes,
+            "memory_bytes": sum(index["memory_bytes"] for index in indexes)
+        }), 200
+
+@app.route("/replica/stats", methods=["GET"])
+def replica_stats():
+    """Report the memory use and refresh lag of the in-memory replica of the selected database."""
+    database = get_database()
+    if database is None:
+        return jsonify({"error": "No database selected"}), 404
+    if database.replica is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, "path": database.path, **database.replica.stats()}), 200
+
+def integer_argument(name, default=None):
+    """
+    Read an integer query parameter.
+
+    Unlike request.args.get(name, type=int), a value that is not an integer is an error
+    instead of silently becoming the default.
+
+    Args:
+    name (str): The parameter name.
+    default (int): The value when the parameter is missing or empty.
+
+    Returns:
+    int: The parameter value.
+
+    Raises:
+    ValueError: If the parameter is not an integer.
+    """
+    value = request.args.get(name, '')
+    if not value:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer")
+
 @app.route("/search/<int:folder_id>/<int:table_id>", methods=["GET"])
 def search_nodes(folder_id, table_id):
+    """
+    Search a table, or list all of its rows when the query is empty.
+
+    Without a limit every match is returned, as before. With limit, results come in
+    pages ordered by hierarchical_structure; pass the returned next_cursor as cursor to
+    get the next page. The total parameter picks 'exact', 'approximate' (capped at
+    APPROXIMATE_TOTAL_CAP, the default for pages) or 'none'.
+
+    With mode=fuzzy the query is matched against names and roles with typos tolerated
+    (up to max_distance edits per word), and the best limit results are returned ranked
+    by score.
+
+    facets=department,rank,role adds counts of every match by those fields, computed in
+    the database, so a page of rows can be shown with breakdowns of the whole result.
+
+    explain=true adds how the search ran: the parsed query, the SQL and SQLite's plan
+    for it, rows scanned and returned, SQLite VM steps and the time of each phase.
+    """
     query = request.args.get('query', '')
     columns = request.args.get('columns', '').split(',')
+    try:
+        limit = integer_argument('limit')
+        max_distance = integer_argument('max_distance', MAX_EDIT_DISTANCE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    cursor = request.args.get('cursor')
+    total_mode = request.args.get('total', 'exact' if limit is None else 'approximate')
+    mode = request.args.get('mode', 'exact')
+    facets = [field for field in request.args.get('facets', '').split(',') if field]
+    explain = request.args.get('explain', '').lower() in ('1', 'true')
     
-    logger.info(f"Search request received for folder_id: {folder_id}, table_id: {table_id}, query: '{query}', columns: {columns}")
+    logger.info(f"Search request received for folder_id: {folder_id}, table_id: {table_id}, query: '{query}', columns: {columns}, mode: {mode}")
+
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+    if total_mode not in TOTAL_MODES:
+        return jsonify({"error": f"total must be one of {', '.join(TOTAL_MODES)}"}), 400
+    if mode not in SEARCH_MODES:
+        return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    invalid_facets = [field for field in facets if field not in FACET_FIELDS]
+    if invalid_facets:
+        return jsonify({"error": f"Invalid facets: {', '.join(invalid_facets)}. Use any of: {', '.join(FACET_FIELDS)}"}), 400
+    if mode == 'fuzzy':
+        if not query:
+            return jsonify({"error": "A query is required for fuzzy search"}), 400
+        if cursor:
+            return jsonify({"error": "Fuzzy results are ranked by score and cannot be paged with a cursor"}), 400
+        if facets:
+            return jsonify({"error": "Facets are not available for fuzzy search"}), 400
+        if explain:
+            return jsonify({"error": "Explain is not available for fuzzy search"}), 400
+        if not 0 <= max_distance <= MAX_EDIT_DISTANCE:
+            return jsonify({"error": f"max_distance must be between 0 and {MAX_EDIT_DISTANCE}"}), 400
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     
     try:
         with session_scope() as session:
             table = (
                 session.query(Table)
-                .filter_by(id=table_id, folder_id=folder_id)
+                .filter_by(id=table_id, folder_id=folder_id, deleting=False)
                 .first()
             )
             
@@ -867,108 +905,381 @@ def search_nodes(folder_id, table_id):
                 return jsonify({"error": f"Table with id {table_id} not found in folder {folder_id}"}), 404
             
             logger.info(f"Searching table {table_id} in folder {folder_id} across specified columns: {columns}")
+
+            if mode == 'fuzzy':
+                fuzzy_columns = [column for column in columns if column in FUZZY_FIELDS] or FUZZY_FIELDS
+                results, total = fuzzy_search_table(session, table_id, query, fuzzy_columns, max_distance, limit or FUZZY_RESULT_LIMIT)
+                logger.info(f"Fuzzy search completed. Returned {len(results)} of {total} results")
+                return jsonify({
+                    "results": results,
+                    "total_results": total,
+                    "total_is_exact": len(fuzzy_columns) == 1,
+                    "query": query,
+                    "columns": fuzzy_columns,
+                    "mode": mode,
+                    "limit": limit or FUZZY_RESULT_LIMIT,
+                    "folder_id": folder_id,
+                    "table_id": table_id
+                }), 200
             
+            explain_info = {} if explain else None
             if query:
-                results = search_table_specified_columns(session, table_id, query, columns)
+                results = search_table_specified_columns(session, table_id, query, columns, after, limit, explain_info)
             else:
-                results = get_all_results(session, table_id)
+                results = get_all_results(session, table_id, after, limit, explain_info)
+            results, next_cursor = split_page(results, limit, lambda result: result['hierarchical_structure'])
             
             logger.info(f"Search completed. Total results: {len(results)}")
-            
-            return jsonify({
+
+            response = {
                 "results": results,
                 "total_results": len(results),
                 "query": query,
                 "columns": columns,
                 "folder_id": folder_id,
                 "table_id": table_id
-            }), 200
+            }
+            if limit is not None:
+                if total_mode == 'none':
+                    total, exact = None, False
+                elif after is None and next_cursor is None:
+                    # A first page without a next page holds every match
+                    total, exact = len(results), True
+                else:
+                    if query:
+                        count_query = build_search_query(session, table_id, query, columns, paginated=total_mode == 'approximate')[0]
+                    else:
+                        count_query = session.query(snapshot_select(session, table_id).subquery())
+                    total, exact = count_results(session, count_query, total_mode)
+                response.update({
+                    "total_results": total,
+                    "total_is_exact": exact,
+                    "next_cursor": next_cursor,
+                    "limit": limit
+                })
+            if facets:
+                if query:
+                    facet_query = build_search_query(session, table_id, query, columns)[0]
+                else:
+                    facet_query = session.query(snapshot_select(session, table_id).subquery())
+                response["facets"] = facet_counts(session, facet_query, facets)
+            if explain:
+                response["explain"] = explain_info
+            
+            return jsonify(response), 200
     
     except Exception as e:
         logger.exception(f"Error searching in folder {folder_id}, table {table_id}: {str(e)}")
         return jsonify({"error": "An unexpected error occurred while searching"}), 500
 
-def get_all_results(session, table_id):
+@app.route("/search/<int:folder_id>", methods=["GET"])
+def search_folder(folder_id):
+    """
+    Search every snapshot of a folder at once.
+
+    The response streams newline-delimited JSON: one line per person, with the
+    snapshots they matched in, followed by a summary line with "done": true. An error
+    after streaming has started is reported as a final line with an "error" key.
+    """
+    query = request.args.get('query', '')
+    columns = request.args.get('columns', '').split(',')
+
+    logger.info(f"Folder search request received for folder_id: {folder_id}, query: '{query}', columns: {columns}")
+
+    if not query:
+        return jsonify({"error": "A query is required to search a folder"}), 400
+
+    session = get_session()
+    folder = session.get(Folder, folder_id)
+    if not folder or folder.deleting:
+        session.close()
+        return jsonify({"error": f"Folder with id {folder_id} not found"}), 404
+    tables = session.query(Table).filter_by(folder_id=folder_id, deleting=False).order_by(Table.upload_date, Table.id).all()
+
+    def generate():
+        people, matches = 0, 0
+        try:
+            for group in search_folder_tables(session, tables, query, columns):
+                people += 1
+                matches += group['snapshot_count']
+                yield json.dumps(group, default=str) + '\n'
+            logger.info(f"Folder search completed. People: {people}, matches: {matches}")
+            yield json.dumps({"done": True, "people": people, "matches": matches, "tables_searched": len(tables)}) + '\n'
+        except Exception as e:
+            logger.exception(f"Error searching folder {folder_id}: {str(e)}")
+            yield json.dumps({"error": "An unexpected error occurred while searching"}) + '\n'
+        finally:
+            session.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def get_all_results(session, table_id, after=None, limit=None, explain=None):
     logger.info(f"Fetching all results for table with ID: {table_id}")
 
-    results = session.query(DataEntry).filter(DataEntry.table_id == table_id).all()
+    timer = PhaseTimer()
+    with timer.phase('build'):
+        snapshot = snapshot_select(session, table_id).subquery()
+        filtered_query = keyset_page(session.query(snapshot), snapshot.c.hierarchical_structure, after, limit)
+    with count_vm_steps(session) if explain is not None else nullcontext() as vm_steps, timer.phase('sql'):
+        results = filtered_query.all()
     logger.info(f"Query executed. Number of results found: {len(results)}")
 
-    search_results = []
-    for entry in results:
-        result = {
-            'person_id': entry.person_id,
-            'name': entry.name,
-            'role': entry.role,
-            'department': entry.department,
-            'rank': entry.rank,
-            'organization_id': entry.organization_id,
-            'matched_terms': [],
-            'hierarchical_structure': entry.hierarchical_structure
-        }
-        search_results.append(result)
-        logger.debug(f"Result added for person_id: {entry.person_id}")
+    with timer.phase('hydrate'):
+        search_results = [
+            {
+                'person_id': entry.person_id,
+                'name': entry.name,
+                'role': entry.role,
+                'department': entry.department,
+                'rank': entry.rank,
+                'organization_id': entry.organization_id,
+                'matched_terms': [],
+                'hierarchical_structure': entry.hierarchical_structure
+            }
+            for entry in results
+        ]
 
     logger.info("All results fetched and prepared.")
+    if explain is not None:
+        explain.update(describe_search_run(session, table_id, filtered_query, None, [], limit, results, vm_steps, timer))
     
     return search_results
 
-def search_table_specified_columns(session, table_id, query, columns):
-    logger.info(f"Starting search in table with ID: {table_id} for query: '{query}' across columns: {columns}")
-
-    parsed_query = parse_complex_query(query)
-    logger.info(f"Parsed query: {parsed_query}")
-
-    base_query = session.query(DataEntry).filter(DataEntry.table_id == table_id)
-    logger.info(f"Base query created for table_id: {table_id}")
-
+def resolve_search_columns(columns):
     all_columns = [column.key for column in DataEntry.__table__.columns if column.key not in ['id', 'table_id']]
     valid_columns = [col for col in columns if col in all_columns]
     
     if not valid_columns:
         valid_columns = all_columns  # If no valid columns specified, search all columns
+    return valid_columns
+
+def describe_matches(entry, columns, matcher, value_matches):
+    """
+    Return the matched terms and matched columns of one result row.
+
+    Args:
+    entry (Row): The result row.
+    columns (list): The columns searched.
+    matcher (function): The compiled matcher of the query.
+    value_matches (dict): Matches of column values seen so far; columns often repeat
+        values (departments, ranks), so each distinct value is matched once.
+
+    Returns:
+    tuple: The de-duplicated matched terms and the matched columns.
+    """
+    matched_terms = []
+    matched_columns = []
+
+    for column in columns:
+        column_value = str(getattr(entry, column))
+        column_matches = value_matches.get(column_value)
+        if column_matches is None:
+            column_matches = value_matches[column_value] = matcher(column_value)
+        
+        if column_matches:
+            matched_terms.extend(column_matches)
+            matched_columns.append(column)
+
+    return list(set(matched_terms)), matched_columns
+
+def build_search_query(session, table_id, query, columns, paginated=False):
+    """
+    Build the filtered query behind search_table_specified_columns, without ordering or limits.
+
+    Paginated searches skip the search index for broad queries: scanning in sort order
+    reaches a page of dense matches sooner than collecting every candidate first.
+
+    Returns:
+    tuple: The query, the snapshot subquery it reads, the matcher for matched terms and
+    the columns searched.
+    """
+    parsed_query, matcher = get_compiled_query(query)
+    logger.info(f"Parsed query: {parsed_query}")
+
+    # Delta-stored tables are reconstructed by the snapshot subquery, full tables read data_entries directly
+    snapshot = snapshot_select(session, table_id).subquery()
+    base_query = session.query(snapshot)
+    logger.info(f"Base query created for table_id: {table_id}")
+
+    valid_columns = resolve_search_columns(columns)
 
     # Build the main condition
-    main_condition = build_sqlalchemy_condition(parsed_query, valid_columns)
-    
-    # Log the SQL query
-    query_sql = str(base_query.filter(main_condition).statement.compile(compile_kwargs={"literal_binds": True}))
-    logger.info(f"SQL query: {query_sql}")
+    main_condition = build_sqlalchemy_condition(parsed_query, valid_columns, snapshot.c)
 
-    results = base_query.filter(main_condition).all()
-    logger.info(f"Query executed. Number of results found: {len(results)}")
+    # The search index narrows the rows to check; the condition above still decides the matches
+    candidates = candidate_ids(session, table_id, parsed_query, valid_columns,
+                               BROAD_QUERY_CANDIDATES if paginated else None)
+    if candidates is not None:
+        base_query = base_query.filter(snapshot.c.id.in_(candidates))
 
-    search_results = []
-    for entry in results:
-        matched_terms = []
-        matched_columns = []
+    return base_query.filter(main_condition), snapshot, matcher, valid_columns
 
-        for column in valid_columns:
-            column_value = str(getattr(entry, column))
-            column_matches = get_matched_terms(column_value, parsed_query)
-            
-            if column_matches:
-                matched_terms.extend(column_matches)
-                matched_columns.append(column)
-
-        result = {
-            'person_id': entry.person_id,
-            'name': entry.name,
-            'role': entry.role,
-            'department': entry.department,
-            'rank': entry.rank,
-            'organization_id': entry.organization_id,
-            'matched_terms': list(set(matched_terms)),  # Remove duplicates
-            'hierarchical_structure': entry.hierarchical_structure,
-            'matched_columns': matched_columns
-        }
-        search_results.append(result)
-        logger.debug(f"Result added: {result}")
+def search_table_specified_columns(session, table_id, query, columns, after=None, limit=None, explain=None):
+    """
+    Search a table and describe the matched terms and columns of each result.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+    query (str): The search query.
+    columns (list): The columns to search.
+    after (str): The hierarchical_structure the page starts after, or None.
+    limit (int): The page size, or None for every match.
+    explain (dict): If given, filled with how the search ran (see describe_search_run).
+
+    Returns:
+    list: The result rows.
+    """
+    logger.info(f"Starting search in table with ID: {table_id} for query: '{query}' across columns: {columns}")
+
+    timer = PhaseTimer()
+    cache_hits = get_compiled_query.cache_info().hits
+    with timer.phase('parse'):
+        parsed_query, _ = get_compiled_query(query)
+    parse_cached = get_compiled_query.cache_info().hits > cache_hits
+
+    with timer.phase('build'):
+        filtered_query, snapshot, matcher, valid_columns = build_search_query(session, table_id, query, columns, limit is not None)
+        filtered_query = keyset_page(filtered_query, snapshot.c.hierarchical_structure, after, limit)
+
+        # Log the SQL query
+        query_sql = literal_sql(filtered_query.statement)
+        logger.info(f"SQL query: {query_sql}")
+
+    with count_vm_steps(session) if explain is not None else nullcontext() as vm_steps, timer.phase('sql'):
+        results = filtered_query.all()
+    logger.info(f"Query executed. Number of results found: {len(results)}")
+
+    with timer.phase('match'):
+        value_matches = {}
+        matches = [describe_matches(entry, valid_columns, matcher, value_matches) for entry in results]
+
+    with timer.phase('hydrate'):
+        search_results = [
+            {
+                'person_id': entry.person_id,
+                'name': entry.name,
+                'role': entry.role,
+                'department': entry.department,
+                'rank': entry.rank,
+                'organization_id': entry.organization_id,
+                'matched_terms': matched_terms,
+                'hierarchical_structure': entry.hierarchical_structure,
+                'matched_columns': matched_columns
+            }
+            for entry, (matched_terms, matched_columns) in zip(results, matches)
+        ]
 
     logger.info(f"Search completed and results prepared. Total results: {len(search_results)}")
+    if explain is not None:
+        explain.update(describe_search_run(session, table_id, filtered_query, parsed_query, valid_columns, limit, results, vm_steps, timer))
+        explain["parse_cached"] = parse_cached
     
     return search_results
 
+def describe_search_run(session, table_id, filtered_query, parsed_query, columns, limit, results, vm_steps, timer):
+    """
+    Describe how a search ran, for the explain mode of /search.
+
+    Rows scanned are the search index candidates when the statement reads the index,
+    and every row of the snapshot otherwise. A page read in sort order can stop before
+    the end, so for such pages the figure is an upper bound and VM steps show the work
+    actually done. Rows returned leave out the extra row a page reads to find out whether
+    a next page exists, which split_page removes.
+
+    Returns:
+    dict: The parsed query, columns, SQL, search index use, query plan, rows scanned and
+    returned, SQLite VM steps and phase timings in milliseconds.
+    """
+    statement = filtered_query.statement
+    query_sql = literal_sql(statement)
+    index_used = SEARCH_INDEX_TABLE in query_sql
+    if index_used:
+        candidates = candidate_ids(session, table_id, parsed_query, columns)
+        rows_scanned = session.execute(select(func.count()).select_from(candidates.subquery())).scalar()
+    else:
+        snapshot = snapshot_select(session, table_id).subquery()
+        rows_scanned = session.execute(select(func.count()).select_from(snapshot)).scalar()
+
+    return {
+        "parsed_query": parsed_query,
+        "columns": columns,
+        "sql": query_sql,
+        "search_index": {
+            "used": index_used,
+            "match_expression": compile_fts_query(parsed_query, columns) if parsed_query is not None else None
+        },
+        "query_plan": query_plan(session, statement),
+        "rows_scanned": rows_scanned,
+        "rows_scanned_is_upper_bound": not index_used and limit is not None,
+        "rows_returned": len(results) if limit is None else min(len(results), limit),
+        "vm_steps": vm_steps["steps"],
+        "timings_ms": timer.report()
+    }
+
+def search_folder_tables(session, tables, query, columns):
+    """
+    Search several snapshots in one query and yield the matches grouped by person.
+
+    Rows are keyed like the table comparison: by person_id, or by hierarchical_structure
+    for rows without a usable person_id. They are ordered by that key and by upload date,
+    so each group is complete when the key changes and can be sent right away.
+
+    Args:
+    session (Session): The database session.
+    tables (list): The Table objects to search.
+    query (str): The search query.
+    columns (list): The columns to search.
+
+    Yields:
+    dict: One group per person, with the snapshots the person matched in.
+    """
+    parsed_query, matcher = get_compiled_query(query)
+    valid_columns = resolve_search_columns(columns)
+
+    # The search index narrows the rows of full-stored tables; delta tables are scanned
+    full_ids = [table.id for table in tables if table.storage_mode != 'delta']
+    candidates = tables_candidate_ids(session, full_ids, parsed_query, valid_columns)
+    rows = tables_snapshot_select(
+        session, tables, DataEntry.id.in_(candidates) if candidates is not None else None
+    ).subquery()
+
+    person_key = case(
+        (rows.c.person_id.notin_(NULL_PERSON_IDS), literal('p:') + rows.c.person_id),
+        else_=literal('s:') + rows.c.hierarchical_structure
+    ).label('person_key')
+    statement = (
+        select(rows, person_key, Table.name.label('table_name'), Table.upload_date.label('table_upload_date'))
+        .join(Table, Table.id == rows.c.table_id)
+        .where(build_sqlalchemy_condition(parsed_query, valid_columns, rows.c))
+        .order_by(person_key, Table.upload_date, Table.id)
+    )
+
+    value_matches = {}
+    for key, entries in groupby(session.execute(statement).yield_per(1000), key=lambda entry: entry.person_key):
+        matches = []
+        for entry in entries:
+            matched_terms, matched_columns = describe_matches(entry, valid_columns, matcher, value_matches)
+            matches.append({
+                'table_id': entry.table_id,
+                'table_name': entry.table_name,
+                'upload_date': entry.table_upload_date.isoformat(),
+                'hierarchical_structure': entry.hierarchical_structure,
+                'name': entry.name,
+                'role': entry.role,
+                'department': entry.department,
+                'rank': entry.rank,
+                'organization_id': entry.organization_id,
+                'matched_terms': matched_terms,
+                'matched_columns': matched_columns
+            })
+        yield {
+            'person_id': key[2:] if key.startswith('p:') else None,
+            'name': matches[-1]['name'],
+            'snapshot_count': len(matches),
+            'matches': matches
+        }
+
 def parse_complex_query(query):
     logger.info(f"Parsing complex query: '{query}'")
 
@@ -1015,7 +1326,7 @@ def parse_complex_query(query):
         logger.error(f"Error parsing query '{query}': {str(e)}")
         raise ValueError(f"Invalid query format: {str(e)}")
 
-def build_sqlalchemy_condition(parsed_query, columns):
+def build_sqlalchemy_condition(parsed_query, columns, source=DataEntry):
     logger.info(f"Building SQLAlchemy condition for parsed query: {parsed_query}")
     
     def build_condition(expr):
@@ -1035,9 +1346,9 @@ def build_sqlalchemy_condition(parsed_query, columns):
             column_conditions = []
             for column in columns:
                 if expr.startswith('"') and expr.endswith('"'):
-                    column_conditions.append(func.lower(getattr(DataEntry, column)) == func.lower(expr.strip('"')))
+                    column_conditions.append(func.lower(getattr(source, column)) == func.lower(expr.strip('"')))
                 else:
-                    column_conditions.append(func.lower(getattr(DataEntry, column)).like(f"%{expr.lower()}%"))
+                    column_conditions.append(func.lower(getattr(source, column)).like(f"%{expr.lower()}%"))
             return or_(*column_conditions)
 
     try:
@@ -1093,11 +1404,74 @@ def get_matched_terms(text, parsed_query):
         logger.info("No match found")
         return []
     
+def compile_matcher(parsed_query):
+    """
+    Compile a parsed query into a function that returns the same list as get_matched_terms.
+
+    The query tree is walked once here instead of once per value, terms are lowercased
+    up front and nothing is logged per node.
+
+    Args:
+    parsed_query (list): The result of parse_complex_query.
+
+    Returns:
+    function: Takes the text of a column and returns its matched terms.
+    """
+    def compile_expression(expr):
+        if isinstance(expr, list):
+            if expr[0] == 'NOT':
+                evaluate_operand = compile_expression(expr[1])
+                negated_explanation = f"NOT ({expr[1]})"
+
+                def evaluate_not(text):
+                    sub_result, _ = evaluate_operand(text)
+                    return (False, None) if sub_result else (True, negated_explanation)
+                return evaluate_not
+            elif 'AND' in expr:
+                operands = [compile_expression(e) for e in expr if e != 'AND']
+
+                def evaluate_and(text):
+                    results = [operand(text) for operand in operands]
+                    result = all(r for r, _ in results)
+                    explanations = [e for _, e in results if e is not None]
+                    return (result, " AND ".join(explanations) if result and explanations else None)
+                return evaluate_and
+            elif 'OR' in expr:
+                operands = [compile_expression(e) for e in expr if e != 'OR']
+
+                def evaluate_or(text):
+                    results = [operand(text) for operand in operands]
+                    result = any(r for r, _ in results)
+                    return (result, " OR ".join(e for r, e in results if r and e is not None) if result else None)
+                return evaluate_or
+            else:
+                return compile_expression(['AND'] + expr)
+
+        term = expr
+        lowered_term = expr.lower()
+
+        def evaluate_term(text):
+            return (True, term) if lowered_term in text else (False, None)
+        return evaluate_term
+
+    evaluate = compile_expression(parsed_query)
+
+    def matcher(text):
+        result, explanation = evaluate(text.lower())
+        return [explanation] if result and explanation else []
+    return matcher
+
+@lru_cache(maxsize=256)
+def get_compiled_query(query):
+    """Parse a search query and compile its matcher, cached by query string. Callers must not modify the parsed query."""
+    parsed_query = parse_complex_query(query)
+    return parsed_query, compile_matcher(parsed_query)
+
 @app.route("/export_excel/<int:table_id>", methods=["GET"])
 def export_excel(table_id):
     try:
         with session_scope() as session:
-            table = session.query(Table).filter_by(id=table_id).first()
+            table = session.query(Table).filter_by(id=table_id, deleting=False).first()
             if not table:
                 return jsonify({"error": f"Table with id {table_id} not found"}), 404
             
@@ -1134,21 +1508,28 @@ def fetch_relevant_tables_by_field(folder_id):
         with session_scope() as session:
             query = session.query(Table).filter(
                 Table.folder_id == folder_id,
+                Table.deleting.is_(False),
                 Table.upload_date.between(start_date, end_date)
             )
 
             if field_type == 'hierarchical_structure':
-                query = query.filter(Table.id.in_(
-                    session.query(DataEntry.table_id).filter(DataEntry.hierarchical_structure == field_value)
-                ))
+                match_value = field_value
             elif field_type == 'person_id':
-                query = query.filter(Table.id.in_(
-                    session.query(DataEntry.table_id).filter(DataEntry.person_id == int(field_value))
-                ))
+                match_value = int(field_value)
             else:
                 return jsonify({"error": "Invalid field_type. Use 'hierarchical_structure' or 'person_id'"}), 400
 
-            relevant_tables = query.all()
+            full_matches = set(
+                table_id for table_id, in session.query(DataEntry.table_id)
+                .filter(getattr(DataEntry, field_type) == match_value)
+                .distinct()
+            )
+            # Delta-stored tables have no data_entries rows of their own and are checked on their reconstruction
+            relevant_tables = [
+                table for table in query.all()
+                if (table.id in full_matches if table.storage_mode == 'full'
+                    else snapshot_contains(session, table.id, field_type, str(match_value)))
+            ]
 
             if not relevant_tables:
                 return jsonify({"message": f"No relevant tables found for the given {field_type} and date range",
@@ -1182,8 +1563,10 @@ def update_node_data_by_person(folder_id, person_id):
         update_results = []
 
         with session_scope() as session:
+            # One validation, one UPDATE and one commit for every table
+            outcomes = bulk_update_person(session, [table["id"] for table in relevant_tables], person_id, updates)
             for table in relevant_tables:
-                updated_data = update_person_data(session, table["id"], person_id, updates)
+                updated_data = outcomes[table["id"]]
 
                 if 'error' in updated_data:
                     update_results.append({
@@ -1208,70 +1591,6 @@ def update_node_data_by_person(folder_id, person_id):
     except Exception as e:
         return jsonify({"error": f"An unexpected error occurred while updating the nodes: {str(e)}"}), 500
 
-def update_person_data(session, table_id, person_id, updates):
-    """
-    Update a person's data in a specific table.
-
-    Args:
-    session (Session): The database session.
-    table_id (int): The ID of the table containing the person's data.
-    person_id (int): The ID of the person to update.
-    updates (dict): A dictionary containing the fields to update and their new values.
-
-    Returns:
-    dict: The updated person data or an error dictionary if the person was not found.
-    """
-    try:
-        # Find the person's data entry
-        data_entry = session.query(DataEntry).filter_by(
-            table_id=table_id,
-            person_id=person_id
-        ).first()
-
-        if not data_entry:
-            error_msg = f"Person with ID {person_id} not found in table {table_id}"
-            logger.warning(error_msg)
-            return {"error": error_msg}
-
-        # Update fields
-        for key, value in updates.items():
-            if hasattr(data_entry, key):
-                if key == 'birth_date' and value:
-                    # Convert string to datetime object
-                    try:
-                        value = datetime.strptime(value, '%Y-%m-%d').date()
-                    except ValueError:
-                        return {"error": f"Invalid date format for birth_date. Use YYYY-MM-DD"}
-                setattr(data_entry, key, value)
-            else:
-                return {"error": f"Invalid field: {key}"}
-
-        # Commit the changes
-        session.commit()
-
-        # Refresh the data entry to get the updated values
-        session.refresh(data_entry)
-
-        # Prepare the updated data to return
-        updated_data = {
-            "person_id": data_entry.person_id,
-            "name": data_entry.name,
-            "role": data_entry.role,
-            "department": data_entry.department,
-            "rank": data_entry.rank,
-            "birth_date": data_entry.birth_date.isoformat() if data_entry.birth_date else None,
-            "organization_id": data_entry.organization_id
-        }
-
-        logger.info(f"Successfully updated data for person with ID {person_id} in table {table_id}")
-        return updated_data
-
-    except Exception as e:
-        error_msg = f"Error updating data for person with ID {person_id} in table {table_id}: {str(e)}"
-        logger.error(error_msg)
-        session.rollback()
-        return {"error": error_msg}
-
 @app.route("/update_hierarchical_structure/<int:folder_id>", methods=["POST"])
 def update_hierarchical_structure(folder_id):
     data = request.json
@@ -1286,8 +1605,8 @@ def update_hierarchical_structure(folder_id):
     if not all([hierarchical_structure, update_type, target_hierarchical_structure, start_date, end_date]):
         return jsonify({"error": "Missing required parameters"}), 400
 
-    if update_type not in ['create_new', 'override']:
-        return jsonify({"error": "Invalid update type. Must be 'create_new' or 'override'"}), 400
+    if update_type not in UPDATE_TYPES:
+        return jsonify({"error": "Invalid update type. Must be 'create_new', 'override' or 'move_subtree'"}), 400
 
     if update_type == 'create_new' and not new_role:
         return jsonify({"error": "New role must be provided for create_new operation"}), 400
@@ -1301,145 +1620,169 @@ def update_hierarchical_structure(folder_id):
     if not relevant_tables:
         return jsonify({"error": "Hierarchical structure not found in any tables within the date range"}), 404
 
-    results = []
+    table_ids = [table["id"] for table in relevant_tables]
     with session_scope() as session:
-        for table in relevant_tables:
-            result = change_hierarchical_location(
+        if update_type == 'move_subtree':
+            outcomes, error = move_subtree_across_tables(session, table_ids, hierarchical_structure, target_hierarchical_structure)
+        else:
+            outcomes, error = relocate_across_tables(
                 session,
-                table["id"],
+                table_ids,
                 hierarchical_structure,
                 update_type,
                 target_hierarchical_structure,
                 new_role
             )
-            results.append({
-                "table_id": table["id"],
-                "upload_date": table["upload_date"],
-                "result": result
-            })
+    results = [
+        {
+            "table_id": table["id"],
+            "upload_date": table["upload_date"],
+            "result": outcomes[table["id"]]
+        }
+        for table in relevant_tables
+    ]
+
+    if error:
+        return jsonify({"error": error, "results": results}), 409
 
     return jsonify({
         "message": "Hierarchical location updated across relevant tables",
         "results": results
     }), 200
 
-def change_hierarchical_location(session, table_id, hierarchical_structure, update_type, target_hierarchical_structure, new_role=None):
-    hierarchical_update_params = {
-        'type': update_type,
-        'new_parent_structure' if update_type == 'create_new' else 'override_structure': target_hierarchical_structure
-    }
-
-    if update_type == 'create_new':
-        if not new_role:
-            return {"error": "New role must be provided for create_new operation"}
-        hierarchical_update_params['new_role'] = new_role
+@app.route("/edit_batch/<int:folder_id>/<int:table_id>", methods=["POST"])
+def upload_edit_batch(folder_id, table_id):
+    """
+    Apply a CSV or XLSX file of edits (field updates, subtree moves and new positions) to a
+    snapshot in one transaction. Every row is validated first; if any is invalid nothing
+    is applied and the per-row report says why.
+    """
+    if "file" not in request.files:
+        return jsonify({"error": "No file part"}), 400
+    file = request.files["file"]
 
-    changes = compute_hierarchical_changes(session, table_id, hierarchical_structure, hierarchical_update_params)
+    if file.filename == "":
+        return jsonify({"error": "No selected file"}), 400
 
-    if 'error' in changes:
-        return changes
+    file_extension = file.filename.rsplit(".", 1)[-1].lower()
+    if file_extension not in ["csv", "xlsx"]:
+        return jsonify({"error": "Unsupported file type. Please upload CSV or XLSX files."}), 400
 
     try:
-        # Find the original entry
-        original_entry = session.query(DataEntry).filter_by(table_id=table_id, hierarchical_structure=hierarchical_structure).first()
-        if not original_entry:
-            return {"error": f"No entry found with hierarchical_structure: {hierarchical_structure}"}
-
-        if update_type == 'create_new':
-            # Create a new entry
-            new_entry = DataEntry(**changes['new_node'])
-            session.add(new_entry)
-
-        elif update_type == 'override':
-            # Find the target entry
-            target_entry = session.query(DataEntry).filter_by(table_id=table_id, hierarchical_structure=target_hierarchical_structure).first()
-            if not target_entry:
-                return {"error": f"No entry found with hierarchical_structure: {target_hierarchical_structure}"}
-
-            # Update the target entry with the original entry's data
-            for key, value in changes['update_node'].items():
-                setattr(target_entry, key, value)
-
-        # Convert the original entry to a null node
-        for key, value in changes['null_node'].items():
-            setattr(original_entry, key, value)
-
-        session.commit()
-        return {"message": "Hierarchical location updated successfully", "changes": changes}
+        operations, error = read_edit_batch(file.read(), file_extension)
     except Exception as e:
-        session.rollback()
-        return {"error": f"An error occurred while updating the hierarchical location: {str(e)}"}
+        logger.error(f"Error reading edit batch {file.filename}: {str(e)}")
+        return jsonify({"error": f"Could not read the edit batch: {str(e)}"}), 400
+    if error:
+        return jsonify({"error": error}), 400
+    if not operations:
+        return jsonify({"error": "The edit batch has no rows"}), 400
 
-def compute_hierarchical_changes(session, table_id, hierarchical_structure, hierarchical_update_params):
-    current_entry = session.query(DataEntry).filter_by(table_id=table_id, hierarchical_structure=hierarchical_structure).first()
-    if not current_entry:
-        return {"error": f"Node with hierarchical structure {hierarchical_structure} not found in table {table_id}"}
+    with session_scope() as session:
+        if not session.query(Table.id).filter_by(id=table_id, folder_id=folder_id, deleting=False).first():
+            return jsonify({"error": f"Table with id {table_id} not found in folder {folder_id}"}), 404
 
-    changes = {}
+        start = time.perf_counter()
+        rows, error = apply_edit_batch(session, table_id, operations)
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
 
-    if hierarchical_update_params.get('type') == 'create_new':
-        new_parent_structure = hierarchical_update_params['new_parent_structure']
-        new_role = hierarchical_update_params.get('new_role')
-        
-        if not new_role:
-            return {"error": "New role must be provided for create_new operation"}
+    if error:
+        return jsonify({"error": error, "rows": rows, "time_ms": elapsed_ms}), 409
 
-        new_parent = session.query(DataEntry).filter_by(table_id=table_id, hierarchical_structure=new_parent_structure).first()
-        if not new_parent:
-            return {"error": f"New parent node with hierarchical structure {new_parent_structure} not found"}
+    return jsonify({
+        "message": "Edit batch applied successfully",
+        "table_id": table_id,
+        "rows": rows,
+        "time_ms": elapsed_ms
+    }), 200
 
+@app.route("/clone_table/<int:folder_id>/<int:table_id>", methods=["POST"])
+def clone_snapshot(folder_id, table_id):
+    """
+    Clone a snapshot inside the database, for what-if edits. The form fields are name,
+    mode ('copy' or 'reference', which shares the rows of delta-stored snapshots) and
+    target_folder_id. An optional edit batch file is applied to the clone in the same
+    transaction, so an invalid batch leaves no clone behind.
+    """
+    name = request.form.get('name') or None
+    mode = request.form.get('mode', 'copy')
+    target_folder_id = request.form.get('target_folder_id', type=int)
+    if mode not in CLONE_MODES:
+        return jsonify({"error": f"Invalid mode. Use one of: {', '.join(CLONE_MODES)}"}), 400
+
+    operations = None
+    file = request.files.get("file")
+    if file and file.filename:
+        file_extension = file.filename.rsplit(".", 1)[-1].lower()
+        if file_extension not in ["csv", "xlsx"]:
+            return jsonify({"error": "Unsupported file type. Please upload CSV or XLSX files."}), 400
         try:
-            new_hierarchy = generate_hierarchical_structure(session, table_id, new_parent.hierarchical_structure)
-        except ValueError as e:
-            return {"error": str(e)}
-
-        changes['new_node'] = {
-            "table_id": table_id,
-            "person_id": current_entry.person_id,
-            "upload_date": current_entry.upload_date,
-            "hierarchical_structure": new_hierarchy,
-            "name": current_entry.name,
-            "role": new_role,
-            "department": new_parent.department,
-            "birth_date": current_entry.birth_date,
-            "rank": current_entry.rank,
-            "organization_id": current_entry.organization_id
-        }
+            operations, error = read_edit_batch(file.read(), file_extension)
+        except Exception as e:
+            logger.error(f"Error reading edit batch {file.filename}: {str(e)}")
+            return jsonify({"error": f"Could not read the edit batch: {str(e)}"}), 400
+        if error:
+            return jsonify({"error": error}), 400
 
-    elif hierarchical_update_params.get('type') == 'override':
-        override_structure = hierarchical_update_params['override_structure']
-        override_entry = session.query(DataEntry).filter_by(table_id=table_id, hierarchical_structure=override_structure).first()
-        if not override_entry:
-            return {"error": f"Node to override with hierarchical structure {override_structure} not found in table {table_id}"}
-
-        changes['update_node'] = {
-            "person_id": current_entry.person_id,
-            "upload_date": current_entry.upload_date,
-            "hierarchical_structure": override_entry.hierarchical_structure,
-            "name": current_entry.name,
-            "role": override_entry.role,
-            "department": override_entry.department,
-            "birth_date": current_entry.birth_date,
-            "rank": current_entry.rank,
-            "organization_id": current_entry.organization_id
-        }
+    with session_scope() as session:
+        if not session.query(Table.id).filter_by(id=table_id, folder_id=folder_id, deleting=False).first():
+            return jsonify({"error": f"Table with id {table_id} not found in folder {folder_id}"}), 404
+        if target_folder_id is not None and not session.query(Folder.id).filter_by(id=target_folder_id, deleting=False).first():
+            return jsonify({"error": f"Folder with id {target_folder_id} not found"}), 404
+
+        start = time.perf_counter()
+        clone = clone_table(session, table_id, name, mode, target_folder_id)
+        clone_id, clone_folder_id, storage_mode = clone.id, clone.folder_id, clone.storage_mode
+        clone_ms = round((time.perf_counter() - start) * 1000, 2)
+
+        rows = []
+        if operations:
+            rows, error = apply_edit_batch(session, clone_id, operations)
+            if error:
+                return jsonify({"error": f"Table was not cloned. {error}", "rows": rows}), 409
+        else:
+            session.commit()
+        elapsed_ms = round((time.perf_counter() - start) * 1000, 2)
 
-    changes['null_node'] = {
-        "name": "nan",
-        "department": "nan",
-        "birth_date": None,
-        "rank": "nan",
-        "organization_id": "nan",
-        "person_id": "nan"
-    }
+    logger.info(f"Cloned table {table_id} into table {clone_id} ({storage_mode}) in {elapsed_ms} ms")
+    return jsonify({
+        "message": "Table cloned successfully",
+        "table_id": clone_id,
+        "folder_id": clone_folder_id,
+        "storage_mode": storage_mode,
+        "rows": rows,
+        "clone_ms": clone_ms,
+        "time_ms": elapsed_ms
+    }), 200
 
-    return changes
+def parse_arguments(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the org chart application.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Worker threads of the production server")
+    parser.add_argument("--dev", action="store_true", help="Use Flask's development server instead")
+    parser.add_argument("--replica", action="store_true",
+                        help="Serve GET requests from an in-memory copy of the database, refreshed after writes")
+    parser.add_argument("--no-browser", action="store_true", help="Do not open the application in a browser")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
+    arguments = parse_arguments()
     print("Starting application...")
     print(f"Current working directory: {os.getcwd()}")
     print(f"Static folder path: {app.static_folder}")
     print(f"MEIPASS (if packaged): {getattr(sys, '_MEIPASS', 'Not packaged')}")
     
-    threading.Thread(target=open_browser).start()
-    app.run(host='0.0.0.0', port=5000, use_reloader=False)
\ No newline at end of file
+    if arguments.replica:
+        database_options.update(replica=True)
+    if not arguments.no_browser:
+        threading.Thread(target=open_browser).start()
+    if arguments.dev:
+        app.run(host=arguments.host, port=arguments.port, use_reloader=False)
+    else:
+        server = make_pooled_server(app, arguments.host, arguments.port, arguments.workers)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
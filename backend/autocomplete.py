@@ -0,0 +1,275 @@
+from models import normalize_search_text
+from snapshots import snapshot_select
+from comparison import NULL_PERSON_IDS
+from sqlalchemy import select, func
+from collections import OrderedDict
+from array import array
+from bisect import bisect_left
+import heapq
+import sys
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_FIELDS = ['name', 'role', 'department', 'person_id']
+MAX_COMPLETIONS = 50
+# Prefix ranges up to this size are ranked by scanning them; larger ranges keep their top
+# completions precomputed, so a one-letter prefix costs the same as a full name
+SCAN_LIMIT = 256
+# Indexes live in process memory, keyed by database path and table ID; the least
+# recently used tables are dropped beyond this many tables
+MAX_CACHED_INDEXES = 16
+# ... or beyond this approximate size of all cached tables (see PrefixIndex.memory_bytes),
+# though the most recently used table is always kept
+MAX_CACHED_BYTES = 512 * 1024 * 1024
+
+_indexes = OrderedDict()
+# Approximate size of the indexes of each cached table, measured when built or extended
+_index_bytes = {}
+index_lock = threading.RLock()
+
+def index_key(session, table_id):
+    return str(session.get_bind().url), table_id
+
+def prefix_end(prefix):
+    """Return the smallest string greater than every string starting with the prefix."""
+    return prefix + '\U0010ffff'
+
+class PrefixIndex:
+    """
+    Sorted distinct values of one field with their frequencies.
+
+    Keys are the normalized values (see normalize_search_text), so completions ignore
+    case, diacritics and RTL marks the same way /search does. The three lists are kept
+    parallel and sorted by (key, value). A value that is already normalized shares its
+    string with its key, and counts are packed in an array, which keeps an index of
+    person IDs at about half the size of plain lists.
+    """
+
+    def __init__(self, counts):
+        entries = sorted((self.normalize(value), value, count) for value, count in counts.items())
+        self.keys = [key for key, _, _ in entries]
+        self.values = [value for _, value, _ in entries]
+        self.counts = array('q', (count for _, _, count in entries))
+        self.top = {}
+        # A fuzzy_search.TrigramIndex over the values, attached on first fuzzy search and
+        # kept in step by add()
+        self.trigrams = None
+        self.precompute_top()
+
+    @staticmethod
+    def normalize(value):
+        key = normalize_search_text(value)
+        return value if key == value else key
+
+    def range(self, prefix):
+        return bisect_left(self.keys, prefix), bisect_left(self.keys, prefix_end(prefix))
+
+    def rank_range(self, start, end):
+        best = heapq.nlargest(MAX_COMPLETIONS, range(start, end), key=lambda i: (self.counts[i], -i))
+        return [(self.values[i], self.counts[i]) for i in best]
+
+    def precompute_top(self):
+        """Rank every prefix whose range is too large to scan, shortest prefixes first."""
+        length, pending = 1, [(0, len(self.keys))]
+        while pending:
+            wide = []
+            for start, end in pending:
+                position = start
+                while position < end:
+                    key = self.keys[position]
+                    if len(key) < length:
+                        position += 1
+                        continue
+                    prefix = key[:length]
+                    group_end = bisect_left(self.keys, prefix_end(prefix), position, end)
+                    if group_end - position > SCAN_LIMIT:
+                        self.top[prefix] = self.rank_range(position, group_end)
+                        wide.append((position, group_end))
+                    position = group_end
+            length, pending = length + 1, wide
+
+    def complete(self, prefix, limit):
+        start, end = self.range(prefix)
+        if end - start <= SCAN_LIMIT:
+            return self.rank_range(start, end)[:limit]
+        if prefix not in self.top:
+            # A range can outgrow SCAN_LIMIT after edits; rank it once and keep it
+            self.top[prefix] = self.rank_range(start, end)
+        return self.top[prefix][:limit]
+
+    def add(self, value, delta):
+        key = self.normalize(value)
+        position = bisect_left(self.keys, key)
+        while position < len(self.keys) and self.keys[position] == key and self.values[position] < value:
+            position += 1
+        if position < len(self.keys) and self.keys[position] == key and self.values[position] == value:
+            self.counts[position] += delta
+            if self.counts[position] <= 0:
+                del self.keys[position], self.values[position], self.counts[position]
+        elif delta > 0:
+            self.keys.insert(position, key)
+            self.values.insert(position, value)
+            self.counts.insert(position, delta)
+        else:
+            return
+        if self.trigrams is not None:
+            self.trigrams.add(value, delta)
+        # Re-rank the cached prefixes of the changed key
+        for length in range(1, len(key) + 1):
+            prefix = key[:length]
+            if prefix in self.top:
+                self.top[prefix] = self.rank_range(*self.range(prefix))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def memory_bytes(self):
+        """Approximate size of the lists, strings, cached rankings and trigram index."""
+        size = sum(sys.getsizeof(items) for items in (self.keys, self.values, self.counts, self.top))
+        size += sum(sys.getsizeof(key) for key in self.keys)
+        size += sum(sys.getsizeof(value) for value, key in zip(self.values, self.keys) if value is not key)
+        size += sum(sys.getsizeof(prefix) + sys.getsizeof(ranking) + sum(map(sys.getsizeof, ranking))
+                    for prefix, ranking in self.top.items())
+        if self.trigrams is not None:
+            size += self.trigrams.memory_bytes()
+        return size
+
+def completion_values(entry):
+    """Return the completion fields of a DataEntry, for update_table_completions."""
+    return {field: getattr(entry, field) for field in COMPLETION_FIELDS}
+
+def is_completion_value(value):
+    return isinstance(value, str) and value.strip() != '' and value not in NULL_PERSON_IDS
+
+def count_field_values(session, table_id):
+    snapshot = snapshot_select(session, table_id).subquery()
+    counts = {}
+    for field in COMPLETION_FIELDS:
+        column = snapshot.c[field]
+        rows = session.execute(select(column, func.count()).where(column.isnot(None)).group_by(column)).all()
+        counts[field] = {value: count for value, count in rows if is_completion_value(value)}
+    return counts
+
+def build_table_completions(session, table_id):
+    """
+    Build the prefix indexes of a table and cache them in memory.
+
+    Values are counted with one grouped query per field, so the build reads the snapshot
+    once per field instead of loading its rows.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+
+    Returns:
+    dict: The prefix index of each field.
+    """
+    start = time.perf_counter()
+    indexes = {field: PrefixIndex(counts) for field, counts in count_field_values(session, table_id).items()}
+    size = sum(index.memory_bytes() for index in indexes.values())
+    with index_lock:
+        key = index_key(session, table_id)
+        _indexes[key] = indexes
+        _indexes.move_to_end(key)
+        _index_bytes[key] = size
+        evict_table_completions()
+    logger.info(f"Built autocomplete index for table {table_id} in {time.perf_counter() - start:.3f}s: "
+                f"{', '.join(f'{len(index)} {field} values' for field, index in indexes.items())}, {size} bytes")
+    return indexes
+
+def measure_table_completions(session, table_id):
+    """Measure a cached table again after its indexes grew, such as by a trigram index."""
+    with index_lock:
+        key = index_key(session, table_id)
+        indexes = _indexes.get(key)
+        if indexes is not None:
+            _index_bytes[key] = sum(index.memory_bytes() for index in indexes.values())
+            evict_table_completions()
+
+def evict_table_completions():
+    """Drop the least recently used tables until the cache fits MAX_CACHED_INDEXES and MAX_CACHED_BYTES."""
+    with index_lock:
+        while len(_indexes) > MAX_CACHED_INDEXES or (len(_indexes) > 1 and sum(_index_bytes.values()) > MAX_CACHED_BYTES):
+            key, _ = _indexes.popitem(last=False)
+            logger.info(f"Dropped the autocomplete index of table {key[1]} ({_index_bytes.pop(key, 0)} bytes)")
+
+def get_table_completions(session, table_id):
+    with index_lock:
+        indexes = _indexes.get(index_key(session, table_id))
+        if indexes is not None:
+            _indexes.move_to_end(index_key(session, table_id))
+            return indexes
+    return build_table_completions(session, table_id)
+
+def complete(session, table_id, prefix, fields=None, limit=10):
+    """
+    Return the most frequent values of the fields that start with a prefix.
+
+    Args:
+    session (Session): The database session, used only to build a missing index.
+    table_id (int): The ID of the table.
+    prefix (str): The typed prefix; matched after normalization.
+    fields (list): The fields to complete, defaulting to COMPLETION_FIELDS.
+    limit (int): The number of completions to return, at most MAX_COMPLETIONS.
+
+    Returns:
+    list: Completions as dicts with field, value and count, most frequent first.
+    """
+    indexes = get_table_completions(session, table_id)
+    key = normalize_search_text(prefix)
+    completions = []
+    with index_lock:
+        for field in fields or COMPLETION_FIELDS:
+            completions.extend(
+                {"field": field, "value": value, "count": count}
+                for value, count in indexes[field].complete(key, limit)
+            )
+    completions.sort(key=lambda completion: -completion["count"])
+    return completions[:limit]
+
+def update_table_completions(session, table_id, old_values=None, new_values=None):
+    """
+    Apply an edited row to a cached index; a table that is not cached is left to be built on demand.
+
+    Args:
+    session (Session): The database session of the edit.
+    table_id (int): The ID of the table.
+    old_values (dict): The completion fields before the edit, or None for a new row.
+    new_values (dict): The completion fields after the edit, or None for a removed row.
+    """
+    with index_lock:
+        indexes = _indexes.get(index_key(session, table_id))
+        if indexes is None:
+            return
+        for field, index in indexes.items():
+            old_value = (old_values or {}).get(field)
+            new_value = (new_values or {}).get(field)
+            if old_value == new_value:
+                continue
+            if is_completion_value(old_value):
+                index.add(old_value, -1)
+            if is_completion_value(new_value):
+                index.add(new_value, 1)
+
+def discard_table_completions(session, table_id):
+    with index_lock:
+        _indexes.pop(index_key(session, table_id), None)
+        _index_bytes.pop(index_key(session, table_id), None)
+
+def completion_stats(session):
+    """Return the values and approximate memory of the cached indexes of the open database."""
+    database = str(session.get_bind().url)
+    with index_lock:
+        return [
+            {
+                "table_id": table_id,
+                "values": {field: len(index) for field, index in indexes.items()},
+                "precomputed_prefixes": sum(len(index.top) for index in indexes.values()),
+                "memory_bytes": sum(index.memory_bytes() for index in indexes.values())
+            }
+            for (index_database, table_id), indexes in _indexes.items()
+            if index_database == database
+        ]
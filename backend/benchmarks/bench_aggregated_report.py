@@ -0,0 +1,112 @@
+"""
+Measure the aggregated comparison report metrics against the per-entry implementation they replaced.
+
+Both implementations run on the same generated snapshots and their results are checked
+for equality before timings are printed.
+
+Usage:
+python backend/benchmarks/bench_aggregated_report.py [rows ...]
+"""
+import os
+import sys
+import logging
+import random
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from snapshots import load_snapshot_entries
+from comparison import (profile_table, compare_age_distributions, compare_rank_distributions,
+                        compare_department_sizes, compare_role_diversity, compare_org_depths,
+                        compare_span_of_control)
+from bench_delta_storage import generate_rows, mutate, build_database
+
+def legacy_metrics(data1, data2):
+    """The per-entry helpers as they were before profile_table, kept as the baseline."""
+    def age_distribution(data):
+        current_year = datetime.now().year
+        ages = [current_year - entry.birth_date.year for entry in data if entry.birth_date]
+        if not ages:
+            return {"average": 0, "min": 0, "max": 0, "median": 0}
+        return {"average": sum(ages) / len(ages), "min": min(ages), "max": max(ages), "median": sorted(ages)[len(ages) // 2]}
+
+    def counts(values):
+        return {value: values.count(value) for value in set(values)}
+
+    def max_depth(data):
+        return max(len(entry.hierarchical_structure.split('/')) for entry in data)
+
+    def average_span(data):
+        manager_counts = {}
+        for entry in data:
+            manager = '/'.join(entry.hierarchical_structure.split('/')[:-1])
+            if manager:
+                manager_counts[manager] = manager_counts.get(manager, 0) + 1
+        return sum(manager_counts.values()) / len(manager_counts) if manager_counts else 0
+
+    ranks1, ranks2 = counts([entry.rank for entry in data1]), counts([entry.rank for entry in data2])
+    departments1, departments2 = counts([entry.department for entry in data1]), counts([entry.department for entry in data2])
+    return {
+        "ages": (age_distribution(data1), age_distribution(data2)),
+        "ranks": {rank: ranks2.get(rank, 0) - ranks1.get(rank, 0) for rank in set(ranks1) | set(ranks2) if ranks1.get(rank, 0) != ranks2.get(rank, 0)},
+        "departments": {dept: departments2.get(dept, 0) for dept in set(departments1) | set(departments2) if departments1.get(dept, 0) != departments2.get(dept, 0)},
+        "roles": (len(set(entry.role for entry in data1)), len(set(entry.role for entry in data2))),
+        "depth": (max_depth(data1), max_depth(data2)),
+        "span": (average_span(data1), average_span(data2))
+    }
+
+def profiled_metrics(profile1, profile2):
+    ages = compare_age_distributions(profile1, profile2)
+    roles = compare_role_diversity(profile1, profile2)
+    depth = compare_org_depths(profile1, profile2)
+    span = compare_span_of_control(profile1, profile2)
+    return {
+        "ages": (ages["before"], ages["after"]),
+        "ranks": compare_rank_distributions(profile1, profile2),
+        "departments": {dept: change["after"] for dept, change in compare_department_sizes(profile1, profile2).items()},
+        "roles": (roles["before"]["unique_roles"], roles["after"]["unique_roles"]),
+        "depth": (depth["before"], depth["after"]),
+        "span": (span["before"], span["after"])
+    }
+
+def main():
+    logging.disable(logging.INFO)
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10000, 50000, 100000, 200000]
+
+    print(f"{'rows':>8}{'legacy load (s)':>18}{'legacy metrics (s)':>20}{'profiled (s)':>14}{'speedup':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            rng = random.Random(size)
+            rows = generate_rows(size)
+            changed_rows, _ = mutate(rows, 0.02, rng, 10 ** 7)
+            path = os.path.join(directory, f'report_{size}.db')
+            table1_id, table2_id = build_database(path, 'full', [rows, changed_rows])
+
+            engine = create_engine(f'sqlite:///{path}')
+            session = sessionmaker(bind=engine)()
+
+            start = time.perf_counter()
+            data1, data2 = load_snapshot_entries(session, table1_id), load_snapshot_entries(session, table2_id)
+            load_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            legacy = legacy_metrics(data1, data2)
+            legacy_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            profiled = profiled_metrics(profile_table(session, table1_id), profile_table(session, table2_id))
+            profiled_time = time.perf_counter() - start
+
+            assert legacy == profiled, f"Metrics differ for {size} rows"
+            speedup = (load_time + legacy_time) / profiled_time
+            print(f"{size:>8}{load_time:>18.3f}{legacy_time:>20.3f}{profiled_time:>14.3f}{speedup:>9.1f}x")
+
+            session.close()
+            engine.dispose()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""
+Measure the set-based person update against the per-table loop it replaced.
+
+The same person is updated in every snapshot of a generated folder, once with a
+transaction per table (the first row of the person, as the endpoint used to do) and once
+with bulk_update_person, each on its own copy of the database. The per-table results are
+checked for equality before timings are printed.
+
+Usage:
+python backend/benchmarks/bench_bulk_update.py [snapshots ...]
+"""
+import os
+import sys
+import logging
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import DataEntry, upgrade_db_schema
+from search_index import index_updated_entries
+from report_cache import invalidate_table_reports
+from timeseries import invalidate_table_points
+from bulk_updates import RESULT_FIELDS, bulk_update_person, parse_person_updates
+from bench_delta_storage import generate_rows, build_database
+
+ROWS_PER_SNAPSHOT = 5000
+UPDATES = {'birth_date': '1980-02-29', 'role': 'Principal Engineer'}
+
+def open_session(path):
+    engine = create_engine(f'sqlite:///{path}')
+    return engine, sessionmaker(bind=engine)()
+
+def update_person_per_table(session, table_id, person_id, updates):
+    """Update the first row of a person in one table and commit, as the endpoint did per table."""
+    data_entry = session.query(DataEntry).filter_by(table_id=table_id, person_id=person_id).first()
+    values, _ = parse_person_updates(updates)
+    for key, value in values.items():
+        setattr(data_entry, key, value)
+    session.flush()
+    index_updated_entries(session)
+    invalidate_table_reports(session, table_id)
+    invalidate_table_points(session, table_id)
+    session.commit()
+    session.refresh(data_entry)
+    result = {field: getattr(data_entry, field) for field in RESULT_FIELDS}
+    result['birth_date'] = result['birth_date'].isoformat() if result['birth_date'] else None
+    return result
+
+def main():
+    logging.disable(logging.WARNING)
+    counts = [int(arg) for arg in sys.argv[1:]] or [10, 60]
+
+    print(f"{'snapshots':>10}{'per table (s)':>16}{'bulk (s)':>12}{'speedup':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in counts:
+            rows = generate_rows(ROWS_PER_SNAPSHOT)
+            person_id = rows[len(rows) // 2]['person_id']
+            path = os.path.join(directory, f'bulk_{count}.db')
+            table_ids = build_database(path, 'full', [rows] * count)
+            engine = create_engine(f'sqlite:///{path}')
+            upgrade_db_schema(engine)
+            engine.dispose()
+            shutil.copy(path, path + '.bulk')
+
+            engine, session = open_session(path)
+            start = time.perf_counter()
+            legacy = {table_id: update_person_per_table(session, table_id, person_id, UPDATES) for table_id in table_ids}
+            legacy_time = time.perf_counter() - start
+            session.close()
+            engine.dispose()
+
+            engine, session = open_session(path + '.bulk')
+            start = time.perf_counter()
+            bulk = bulk_update_person(session, table_ids, person_id, UPDATES)
+            bulk_time = time.perf_counter() - start
+            session.close()
+            engine.dispose()
+
+            assert legacy == bulk, f"Results differ for {count} snapshots"
+            print(f"{count:>10}{legacy_time:>16.3f}{bulk_time:>12.3f}{legacy_time / bulk_time:>9.1f}x")
+
+if __name__ == '__main__':
+    main()
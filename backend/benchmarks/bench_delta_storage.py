@@ -0,0 +1,119 @@
+"""
+Compare database size and read latency of full-copy and delta snapshot storage.
+
+Usage:
+python backend/benchmarks/bench_delta_storage.py [rows] [snapshots] [change_ratio]
+"""
+import os
+import sys
+import logging
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import Base, Folder, Table
+from snapshots import store_snapshot_records, load_snapshot_entries
+
+def generate_rows(count):
+    return [
+        {
+            'hierarchical_structure': '/1' + ''.join(f'/{digit}' for digit in str(index)) if index else '/1',
+            'upload_date': date(2024, 1, 1),
+            'person_id': str(100000 + index),
+            'name': f'Person {index}',
+            'birth_date': date(1960, 1, 1) + timedelta(days=index % 15000),
+            'role': f'Role {index % 300}',
+            'department': f'Department {index % max(40, count // 50)}',
+            'rank': str(index % 9),
+            'organization_id': f'ORG{index % 7}'
+        }
+        for index in range(count)
+    ]
+
+def mutate(rows, change_ratio, rng, next_person):
+    rows = [dict(row) for row in rows]
+    changes = max(1, int(len(rows) * change_ratio))
+    for _ in range(changes):
+        row = rows[rng.randrange(1, len(rows))]
+        action = rng.random()
+        if action < 0.6:
+            row['role'] = f'Role {rng.randrange(300)}'
+            row['rank'] = str(rng.randrange(9))
+        else:
+            row['person_id'] = str(next_person)
+            row['name'] = f'Person {next_person}'
+            next_person += 1
+    return rows, next_person
+
+def build_database(path, storage_mode, snapshots):
+    engine = create_engine(f'sqlite:///{path}')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+
+    folder = Folder(name='Benchmark', storage_mode=storage_mode)
+    session.add(folder)
+    session.flush()
+
+    table_ids = []
+    for index, rows in enumerate(snapshots):
+        table = Table(name=f'snapshot_{index}.csv', folder_id=folder.id, upload_date=date(2024, 1, 1) + timedelta(days=30 * index))
+        session.add(table)
+        session.flush()
+        store_snapshot_records(session, table.id, rows)
+        table_ids.append(table.id)
+    session.commit()
+    session.close()
+    engine.dispose()
+    return table_ids
+
+def measure_reads(path, table_ids, repeats=3):
+    engine = create_engine(f'sqlite:///{path}')
+    session = sessionmaker(bind=engine)()
+    timings = []
+    for table_id in table_ids:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            load_snapshot_entries(session, table_id)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        timings.append(best)
+    session.close()
+    engine.dispose()
+    return timings
+
+def main():
+    logging.disable(logging.INFO)
+    row_count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    snapshot_count = int(sys.argv[2]) if len(sys.argv) > 2 else 12
+    change_ratio = float(sys.argv[3]) if len(sys.argv) > 3 else 0.02
+
+    rng = random.Random(42)
+    rows = generate_rows(row_count)
+    snapshots = [rows]
+    next_person = 100000 + row_count
+    for _ in range(snapshot_count - 1):
+        rows, next_person = mutate(rows, change_ratio, rng, next_person)
+        snapshots.append(rows)
+
+    print(f"{snapshot_count} snapshots of {row_count} rows, {change_ratio:.1%} changed per snapshot")
+    print(f"{'mode':<8}{'size (MB)':>12}{'write (s)':>12}{'read avg (ms)':>16}{'read max (ms)':>16}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for storage_mode in ('full', 'delta'):
+            path = os.path.join(directory, f'{storage_mode}.db')
+            start = time.perf_counter()
+            table_ids = build_database(path, storage_mode, snapshots)
+            write_time = time.perf_counter() - start
+            timings = measure_reads(path, table_ids)
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+            print(f"{storage_mode:<8}{size_mb:>12.2f}{write_time:>12.2f}"
+                  f"{1000 * sum(timings) / len(timings):>16.1f}{1000 * max(timings):>16.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Compare read latency from the database file and from its in-memory replica.
+
+A generated folder is read through the app's test client, first with reads going to the
+file and then with the replica enabled. The responses of both runs are checked for
+equality before timings are printed, followed by the replica's memory use, the
+refreshes caused by the reads (their cache writes should cause none) and the lag of a
+refresh after a write.
+
+Usage:
+python backend/benchmarks/bench_replica.py [rows] [snapshots]
+"""
+import os
+import sys
+import logging
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import models
+from models import set_db_path, init_db, get_database, dispose_db
+from app import app
+from replicas import POLL_SECONDS
+from bench_delta_storage import generate_rows, build_database
+
+REPEATS = 5
+
+def requests_of(table_ids):
+    first, last = table_ids[0], table_ids[-1]
+    return {
+        'search': f'/search/1/{last}?query=Role%2012&columns=role&limit=50',
+        'compare_tables': f'/compare_tables/1?table1_id={first}&table2_id={last}',
+        'timeline': f'/timeline/1?hierarchical_structure=/1/1/2'
+    }
+
+def measure(client, requests):
+    timings, responses = {}, {}
+    for name, url in requests.items():
+        responses[name] = client.get(url).get_json()
+        start = time.perf_counter()
+        for _ in range(REPEATS):
+            assert client.get(url).status_code == 200
+        timings[name] = (time.perf_counter() - start) / REPEATS
+    return timings, responses
+
+def wait_until_current(replica):
+    while not replica.stats()['loaded'] or replica.stats()['pending_writes']:
+        time.sleep(0.01)
+
+def main():
+    logging.disable(logging.WARNING)
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    snapshots = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    models.database_options.update(echo=False)
+    client = app.test_client()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'replica.db')
+        table_ids = build_database(path, 'full', [generate_rows(rows)] * snapshots)
+        requests = requests_of(table_ids)
+        results = {}
+        for replica in (False, True):
+            models.database_options.update(replica=replica)
+            set_db_path(path)
+            init_db()
+            if replica:
+                wait_until_current(get_database().replica)
+                refreshes = get_database().replica.stats()['refreshes']
+            results[replica] = measure(client, requests)
+            if replica:
+                # Give the poller a chance to notice the cache writes of the reads
+                time.sleep(2 * POLL_SECONDS)
+                stats = get_database().replica.stats()
+                read_refreshes = stats['refreshes'] - refreshes
+                start = time.perf_counter()
+                response = client.post(f'/update_node_by_person/1/100012', json={
+                    'start_date': '2000-01-01', 'end_date': '2100-01-01', 'updates': {'role': 'Replicated'},
+                    'tables': [{'id': table_id, 'upload_date': 'x'} for table_id in table_ids]
+                })
+                assert response.status_code == 200, response.get_json()
+                wait_until_current(get_database().replica)
+                write_lag = time.perf_counter() - start
+                refresh_ms = get_database().replica.stats()['last_refresh_ms']
+            dispose_db(path)
+
+        assert results[False][1] == results[True][1], "Replica responses differ"
+        print(f"{rows} rows x {snapshots} snapshots, {os.path.getsize(path) / 1e6:.1f} MB on disk")
+        print(f"{'request':>16}{'file (ms)':>12}{'replica (ms)':>14}{'speedup':>10}")
+        for name in requests:
+            disk, memory = results[False][0][name], results[True][0][name]
+            print(f"{name:>16}{disk * 1000:>12.2f}{memory * 1000:>14.2f}{disk / memory:>9.2f}x")
+        print(f"replica memory: {stats['memory_bytes'] / 1e6:.1f} MB, refreshes caused by the reads: {read_refreshes}, "
+              f"refresh: {refresh_ms} ms, write to readable on the replica: {write_lag * 1000:.1f} ms")
+
+if __name__ == '__main__':
+    main()
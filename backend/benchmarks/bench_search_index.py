@@ -0,0 +1,85 @@
+"""
+Measure /search with and without the full-text search index.
+
+Builds a database of generated snapshots, runs a set of queries against the last
+snapshot with LIKE scans only, then creates the index and runs them again. Results of
+both runs are checked for equality before timings are printed.
+
+Usage:
+python backend/benchmarks/bench_search_index.py [rows per snapshot] [snapshots]
+"""
+import os
+import sys
+import logging
+import random
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from models import upgrade_db_schema
+from app import search_table_specified_columns
+from bench_delta_storage import generate_rows, mutate, build_database
+
+QUERIES = [
+    ('Person 123', ['name']),
+    ('"Person 4242"', ['name', 'role', 'department']),
+    ('Role 17 AND Department', ['name', 'role', 'department']),
+    ('Person 99999 OR Person 4711', ['name', 'person_id']),
+    ('ORG3 AND NOT Role', ['organization_id', 'role']),
+    ('nobody', ['name', 'role', 'department', 'rank', 'organization_id'])
+]
+
+def run_queries(session, table_id, repeats=3):
+    results, timings = [], []
+    for query, columns in QUERIES:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            found = search_table_specified_columns(session, table_id, query, columns)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        results.append(sorted(found, key=lambda result: result['hierarchical_structure']))
+        timings.append(best)
+    return results, timings
+
+def main():
+    logging.disable(logging.INFO)
+    rows_per_snapshot = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    snapshot_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    rng = random.Random(rows_per_snapshot)
+    snapshots = [generate_rows(rows_per_snapshot)]
+    for _ in range(snapshot_count - 1):
+        rows, _ = mutate(snapshots[-1], 0.02, rng, 10 ** 7 + len(snapshots) * rows_per_snapshot)
+        snapshots.append(rows)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'search.db')
+        table_ids = build_database(path, 'full', snapshots)
+        engine = create_engine(f'sqlite:///{path}')
+        session = sessionmaker(bind=engine)()
+
+        scan_results, scan_timings = run_queries(session, table_ids[-1])
+
+        start = time.perf_counter()
+        upgrade_db_schema(engine)
+        index_time = time.perf_counter() - start
+        session.expire_all()
+
+        index_results, index_timings = run_queries(session, table_ids[-1])
+        assert scan_results == index_results, "Indexed search returned different results"
+
+        print(f"{rows_per_snapshot * snapshot_count} rows, index built in {index_time:.1f}s, "
+              f"database {os.path.getsize(path) / 2 ** 20:.0f} MB")
+        print(f"{'query':<36}{'results':>9}{'scan (ms)':>12}{'index (ms)':>12}")
+        for (query, _), found, scan, indexed in zip(QUERIES, index_results, scan_timings, index_timings):
+            print(f"{query:<36}{len(found):>9}{scan * 1000:>12.1f}{indexed * 1000:>12.1f}")
+
+        session.close()
+        engine.dispose()
+
+if __name__ == '__main__':
+    main()
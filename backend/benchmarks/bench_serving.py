@@ -0,0 +1,119 @@
+"""
+Load test the pooled production server with a growing number of worker threads.
+
+A generated folder is served by a server process per worker count while client threads
+send a mix of searches, change log reads and (one in WRITE_EVERY) person updates for a
+fixed duration. Throughput and the 95th percentile latency of each kind of request are
+printed per worker count; every response must succeed. The number of CPUs is printed
+first, since the clients share them with the server. It has only been run on one CPU,
+where throughput did not grow with workers: about 99, 88 and 87 requests/s for 1, 4
+and 16 workers.
+
+Usage:
+python backend/benchmarks/bench_serving.py [workers ...]
+"""
+import os
+import sys
+import json
+import logging
+import multiprocessing
+import random
+import tempfile
+import threading
+import time
+from http.client import HTTPConnection
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_delta_storage import generate_rows, build_database
+
+ROWS_PER_SNAPSHOT = 20000
+SNAPSHOTS = 3
+CLIENTS = 32
+DURATION_SECONDS = 10
+WRITE_EVERY = 20
+KINDS = ('search', 'changes', 'update')
+
+def run_server(path, workers, ports):
+    logging.disable(logging.CRITICAL)
+    from app import app
+    from models import set_db_path, init_db
+    from serving import make_pooled_server
+
+    server = make_pooled_server(app, port=0, workers=workers)
+    set_db_path(path)
+    init_db()
+    ports.put(server.server_port)
+    server.serve_forever()
+
+def request(port, method, url, body=None):
+    connection = HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        connection.request(method, url, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+def client(port, table_ids, deadline, seed, latencies, failures):
+    rng = random.Random(seed)
+    sent = 0
+    while time.perf_counter() < deadline:
+        table_id = rng.choice(table_ids)
+        sent += 1
+        if sent % WRITE_EVERY == 0:
+            kind, method, url, body = 'update', 'POST', f'/update_node_by_person/1/{100000 + rng.randrange(ROWS_PER_SNAPSHOT)}', {
+                'start_date': '2024-01-01', 'end_date': '2024-12-31', 'updates': {'role': f'Role {rng.randrange(300)}'},
+                'tables': [{'id': table_id, 'upload_date': 'x'}]
+            }
+        elif sent % 2:
+            query = urlencode({'query': f'Role {rng.randrange(300)}', 'columns': 'role', 'limit': 20})
+            kind, method, url, body = 'search', 'GET', f'/search/1/{table_id}?{query}', None
+        else:
+            kind, method, url, body = 'changes', 'GET', f'/changes/1/{table_id}?since=0', None
+        start = time.perf_counter()
+        status = request(port, method, url, body)
+        latencies[kind].append(time.perf_counter() - start)
+        if status != 200:
+            failures.append((url, status))
+
+def measure(path, table_ids, workers):
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_server, args=(path, workers, ports), daemon=True)
+    server.start()
+    try:
+        port = ports.get(timeout=120)
+        latencies, failures = {kind: [] for kind in KINDS}, []
+        deadline = time.perf_counter() + DURATION_SECONDS
+        clients = [threading.Thread(target=client, args=(port, table_ids, deadline, seed, latencies, failures))
+                   for seed in range(CLIENTS)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+    finally:
+        server.terminate()
+        server.join()
+    assert not failures, f"{len(failures)} failed requests, the first {failures[0]}"
+    for values in latencies.values():
+        values.sort()
+    return sum(map(len, latencies.values())) / DURATION_SECONDS, {kind: values[int(len(values) * 0.95)] for kind, values in latencies.items()}
+
+def main():
+    logging.disable(logging.WARNING)
+    counts = [int(arg) for arg in sys.argv[1:]] or [1, 2, 4, 8]
+
+    print(f"{os.cpu_count()} CPUs, {CLIENTS} clients, p95 latency per request kind")
+    print(f"{'workers':>8}{'requests/s':>12}" + ''.join(f"{kind + ' (ms)':>14}" for kind in KINDS))
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'serving.db')
+        table_ids = build_database(path, 'full', [generate_rows(ROWS_PER_SNAPSHOT)] * SNAPSHOTS)
+        for workers in counts:
+            throughput, p95 = measure(path, table_ids, workers)
+            print(f"{workers:>8}{throughput:>12.1f}" + ''.join(f"{p95[kind] * 1000:>14.1f}" for kind in KINDS))
+
+if __name__ == '__main__':
+    main()
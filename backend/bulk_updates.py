@@ -0,0 +1,188 @@
+from models import Table, DataEntry, DeltaEntry, begin_write_transaction
+from snapshots import ROW_FIELDS, snapshot_select, tables_snapshot_select
+from report_cache import invalidate_tables_reports
+from timeseries import invalidate_tables_points
+from autocomplete import COMPLETION_FIELDS, update_table_completions
+from change_log import record_node_changes
+from search_index import index_updated_entries
+from sqlalchemy import select, update, insert, delete, func
+from datetime import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+EDITABLE_FIELDS = [column.key for column in DataEntry.__table__.columns if column.key not in ['id', 'table_id']]
+RESULT_FIELDS = ['person_id', 'name', 'role', 'department', 'rank', 'birth_date', 'organization_id']
+
+def parse_person_updates(updates):
+    """
+    Validate the fields of a person update and convert their values once for every table.
+
+    Returns:
+    tuple: The column values to set and None, or None and the error message.
+    """
+    values = {}
+    for key, value in updates.items():
+        if key not in EDITABLE_FIELDS:
+            return None, f"Invalid field: {key}"
+        if key == 'birth_date' and value:
+            # Convert string to datetime object
+            try:
+                value = datetime.strptime(value, '%Y-%m-%d').date()
+            except ValueError:
+                return None, "Invalid date format for birth_date. Use YYYY-MM-DD"
+        values[key] = value
+    return values, None
+
+def tables_with_person(session, table_ids, person_id):
+    tables = session.query(Table).filter(Table.id.in_(table_ids), Table.deleting.is_(False)).all()
+    rows = tables_snapshot_select(session, tables, DataEntry.person_id == person_id)
+    if rows is None:
+        return set()
+    rows = rows.subquery()
+    return set(session.execute(select(rows.c.table_id).where(rows.c.person_id == person_id).distinct()).scalars())
+
+def bulk_update_person(session, table_ids, person_id, updates):
+    """
+    Apply the same update to a person's row in many tables in one transaction.
+
+    The update is validated once and the person's rows are found with one lookup over
+    every table. Rows of full tables are changed by a single UPDATE; a delta table is not
+    materialized, its row is written as a delta row instead, as an edit batch does. A
+    delta table stored against an edited one, and not edited itself, keeps its contents
+    through delta rows pinning the structures that changed below it. Cached reports and
+    time series points of the edited tables are dropped in the same transaction, followed
+    by one commit. The first row of the person in each table is the one updated.
+
+    Args:
+    session (Session): The database session.
+    table_ids (list): The IDs of the tables to update.
+    person_id (str): The ID of the person to update.
+    updates (dict): The fields to update and their new values.
+
+    Returns:
+    dict: For each table ID, the updated person data, or an error dictionary if the
+    person was not found, the update was invalid or the transaction failed.
+    """
+    table_ids = list(dict.fromkeys(table_ids))
+    person_id = str(person_id)
+
+    def not_found(table_id):
+        error_msg = f"Person with ID {person_id} not found in table {table_id}"
+        logger.warning(error_msg)
+        return {"error": error_msg}
+
+    values, error = parse_person_updates(updates)
+    if error:
+        # A table without the person reports that first, as a per-table update would
+        found = tables_with_person(session, table_ids, person_id)
+        return {table_id: {"error": error} if table_id in found else not_found(table_id) for table_id in table_ids}
+
+    try:
+        begin_write_transaction(session)
+        tables = {table.id: table for table in
+                  session.query(Table).filter(Table.id.in_(table_ids), Table.deleting.is_(False)).all()}
+        previous_rows = person_rows(session, list(tables.values()), person_id)
+        new_rows = {table_id: {**row, **values} for table_id, row in previous_rows.items()}
+
+        # Structures each edited table writes, mapped to the new row or None where the person left
+        written = {}
+        for table_id, row in previous_rows.items() if values else ():
+            written[table_id] = {row['hierarchical_structure']: None, new_rows[table_id]['hierarchical_structure']: new_rows[table_id]}
+        if 'hierarchical_structure' in values:
+            taken = taken_structures(session, list(tables.values()), values['hierarchical_structure'])
+            for table_id, row in previous_rows.items():
+                if table_id in taken and row['hierarchical_structure'] != values['hierarchical_structure']:
+                    raise ValueError(f"Hierarchical structure {values['hierarchical_structure']} already exists in table {table_id}")
+
+        # Delta tables stored against an edited table keep their view of what it changes
+        dependents = session.query(Table).filter(
+            Table.base_table_id.in_(list(written)), Table.storage_mode == 'delta'
+        ).all()
+        pinned = {}
+        for dependent in dependents:
+            structures = [structure for structure in written[dependent.base_table_id]
+                          if structure not in written.get(dependent.id, {})]
+            if structures:
+                pinned[dependent] = pinned_rows(session, dependent.id, structures)
+
+        full_ids = [previous_rows[table_id]['id'] for table_id in previous_rows if tables[table_id].storage_mode != 'delta']
+        if full_ids and values:
+            session.execute(
+                update(DataEntry).where(DataEntry.id.in_(full_ids)).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+            index_updated_entries(session)
+        for table_id in written:
+            if tables[table_id].storage_mode == 'delta':
+                write_delta_rows(session, tables[table_id], written[table_id])
+        for dependent, rows in pinned.items():
+            write_delta_rows(session, dependent, rows)
+
+        changed_nodes = [(table_id, structure) for table_id, structures in written.items() for structure in structures]
+        record_node_changes(session, changed_nodes, list(values))
+        updated_tables = list(written)
+        if updated_tables:
+            invalidate_tables_reports(session, updated_tables)
+            invalidate_tables_points(session, updated_tables)
+
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error updating data for person with ID {person_id} in tables {table_ids}: {str(e)}")
+        return {
+            table_id: {"error": f"Error updating data for person with ID {person_id} in table {table_id}: {str(e)}"}
+            for table_id in table_ids
+        }
+
+    results = {}
+    for table_id, row in new_rows.items():
+        results[table_id] = {field: row[field] for field in RESULT_FIELDS}
+        results[table_id]["birth_date"] = row['birth_date'].isoformat() if row['birth_date'] else None
+        update_table_completions(session, table_id, {field: previous_rows[table_id][field] for field in COMPLETION_FIELDS},
+                                 {field: row[field] for field in COMPLETION_FIELDS})
+
+    logger.info(f"Updated person with ID {person_id} in {len(results)} of {len(table_ids)} tables in one transaction")
+    return {table_id: results[table_id] if table_id in results else not_found(table_id) for table_id in table_ids}
+
+def person_rows(session, tables, person_id):
+    """Return, for each table holding the person, the first of the person's rows as a dictionary."""
+    rows = tables_snapshot_select(session, tables, DataEntry.person_id == person_id)
+    if rows is None:
+        return {}
+    rows = rows.subquery()
+    first_ids = select(func.min(rows.c.id)).where(rows.c.person_id == person_id).group_by(rows.c.table_id)
+    return {
+        row['table_id']: dict(row)
+        for row in session.execute(select(rows).where(rows.c.id.in_(first_ids), rows.c.person_id == person_id)).mappings()
+    }
+
+def taken_structures(session, tables, structure):
+    """Return the IDs of the tables that have a row at a structure."""
+    rows = tables_snapshot_select(session, tables, DataEntry.hierarchical_structure == structure)
+    if rows is None:
+        return set()
+    rows = rows.subquery()
+    return set(session.execute(select(rows.c.table_id).where(rows.c.hierarchical_structure == structure)).scalars())
+
+def pinned_rows(session, table_id, structures):
+    """Return a table's current rows at some structures, with None for the structures it lacks."""
+    snapshot = snapshot_select(session, table_id).subquery()
+    rows = {structure: None for structure in structures}
+    for row in session.execute(select(snapshot).where(snapshot.c.hierarchical_structure.in_(structures))).mappings():
+        rows[row['hierarchical_structure']] = dict(row)
+    return rows
+
+def write_delta_rows(session, table, rows):
+    """Replace a delta table's rows at some structures with upserts of the given rows, or deletes where None."""
+    delta_entries = DeltaEntry.__table__
+    session.execute(
+        delete(delta_entries).where(delta_entries.c.table_id == table.id,
+                                    delta_entries.c.hierarchical_structure.in_(list(rows)))
+    )
+    session.execute(insert(DeltaEntry), [
+        {"table_id": table.id, "operation": "upsert", **{field: row[field] for field in ROW_FIELDS}, "upload_date": table.upload_date}
+        if row is not None
+        else {**{field: None for field in ROW_FIELDS}, "table_id": table.id, "operation": "delete", "hierarchical_structure": structure}
+        for structure, row in rows.items()
+    ])
@@ -0,0 +1,187 @@
+from models import ChangeLogEntry, Table, get_session
+from change_log import split_fields
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from sqlalchemy import event
+import threading
+import logging
+import time
+import json
+
+logger = logging.getLogger(__name__)
+
+# Open event streams per worker process; each one holds a connection and a thread
+MAX_SUBSCRIBERS = 32
+# Idle streams send a comment this often, so proxies keep them open and dead clients are noticed
+HEARTBEAT_SECONDS = 15
+# Streams are closed after this long; browsers reconnect on their own and resume from the last event
+MAX_STREAM_SECONDS = 300
+RECONNECT_MILLISECONDS = 3000
+# Beyond this many changes in one event, clients are told to reset instead
+MAX_EVENT_CHANGES = 500
+
+class Subscription:
+    def __init__(self, folder_id, table_id=None):
+        self.folder_id = folder_id
+        self.table_id = table_id
+        self.wake = threading.Event()
+
+    def wants(self, table_ids):
+        return self.table_id is None or self.table_id in table_ids
+
+class ChangeBroker:
+    """Wakes the event streams of this process when a transaction changing their tables commits."""
+
+    def __init__(self, max_subscribers=MAX_SUBSCRIBERS):
+        self.max_subscribers = max_subscribers
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def subscribe(self, folder_id, table_id=None):
+        """
+        Register an event stream.
+
+        Returns:
+        Subscription: The subscription, or None when the process already serves its maximum of streams.
+        """
+        with self.lock:
+            if len(self.subscriptions) >= self.max_subscribers:
+                return None
+            subscription = Subscription(folder_id, table_id)
+            self.subscriptions.add(subscription)
+            return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def notify(self, table_ids):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(table_ids):
+                subscription.wake.set()
+
+    def subscriber_count(self):
+        with self.lock:
+            return len(self.subscriptions)
+
+broker = ChangeBroker()
+
+@event.listens_for(Session, "after_commit")
+def notify_committed_changes(session):
+    # change_log marks the tables it records changes for in session.info
+    table_ids = session.info.pop('changed_tables', None)
+    if table_ids:
+        broker.notify(table_ids)
+
+@event.listens_for(Session, "after_rollback")
+def discard_rolled_back_changes(session):
+    session.info.pop('changed_tables', None)
+
+def subscription_changes(subscription):
+    changes = (
+        select(ChangeLogEntry.id, ChangeLogEntry.table_id, ChangeLogEntry.hierarchical_structure, ChangeLogEntry.changed_fields,
+               Table.deleting)
+        .join(Table, Table.id == ChangeLogEntry.table_id)
+        .where(Table.folder_id == subscription.folder_id)
+    )
+    if subscription.table_id is not None:
+        changes = changes.where(ChangeLogEntry.table_id == subscription.table_id)
+    return changes
+
+def latest_version(session, subscription):
+    """Return the last version logged for the tables of a subscription, the default resume point of its stream."""
+    changes = subscription_changes(subscription).subquery()
+    return session.execute(select(func.max(changes.c.id))).scalar() or 0
+
+def pending_event(session, subscription, after, max_changes=MAX_EVENT_CHANGES):
+    """
+    Build the notification for the changes logged after a version in the tables of a subscription.
+
+    Each changed node is listed once per table with the union of its changed fields (None
+    when the node was created, replaced or deleted). A table that was rewritten is marked
+    for reset instead, and so is every table when more than max_changes changes are
+    pending, so the event stays small; clients then fetch the tree or /changes again.
+    Tables being deleted are marked deleted, and their clients drop them instead.
+
+    Args:
+    session (Session): The database session.
+    subscription (Subscription): The subscription of the stream.
+    after (int): The last version sent to the client.
+    max_changes (int): The number of changes above which clients are told to reset.
+
+    Returns:
+    dict: The version of the last change and the changes per table, or None if nothing changed.
+    """
+    rows = session.execute(
+        subscription_changes(subscription).where(ChangeLogEntry.id > after)
+        .order_by(ChangeLogEntry.id).limit(max_changes + 1)
+    ).all()
+    if not rows:
+        return None
+    if len(rows) > max_changes:
+        pending = subscription_changes(subscription).where(ChangeLogEntry.id > after).subquery()
+        version, tables = 0, []
+        for row in session.execute(select(pending.c.table_id, pending.c.deleting, func.max(pending.c.id))
+                                   .group_by(pending.c.table_id, pending.c.deleting)):
+            version = max(version, row[2])
+            tables.append({"table_id": row.table_id, "reset": True, "deleted": row.deleting, "changes": []})
+        return {"version": version, "tables": tables}
+
+    tables = {}
+    for row in rows:
+        table = tables.setdefault(row.table_id, {"table_id": row.table_id, "reset": False, "deleted": row.deleting, "changes": {}})
+        if row.hierarchical_structure is None:
+            table["reset"] = True
+            continue
+        fields = split_fields(row.changed_fields)
+        if row.hierarchical_structure in table["changes"]:
+            known = table["changes"][row.hierarchical_structure]
+            fields = sorted(set(known) | set(fields)) if known is not None and fields is not None else None
+        table["changes"][row.hierarchical_structure] = fields
+    return {
+        "version": rows[-1].id,
+        "tables": [
+            {**table, "changes": [] if table["reset"] else [
+                {"hierarchical_structure": structure, "fields": fields} for structure, fields in table["changes"].items()
+            ]}
+            for table in tables.values()
+        ]
+    }
+
+def format_event(notification):
+    return f"id: {notification['version']}\nevent: changes\ndata: {json.dumps(notification)}\n\n"
+
+def stream_changes(subscription, after, max_seconds=MAX_STREAM_SECONDS, heartbeat_seconds=HEARTBEAT_SECONDS):
+    """
+    Yield server-sent events for the changes committed to the tables of a subscription.
+
+    The stream wakes as soon as a transaction of this process commits changes to its
+    tables, and also checks the change log at every heartbeat so changes committed by
+    other processes are delivered too, at most a heartbeat late.
+
+    Args:
+    subscription (Subscription): The subscription of the stream, which the caller unsubscribes.
+    after (int): The version to send changes after.
+    max_seconds (float): How long to stream before closing, so clients reconnect.
+    heartbeat_seconds (float): The longest wait between two checks of the change log.
+    """
+    yield f"retry: {RECONNECT_MILLISECONDS}\n\n"
+    deadline = time.monotonic() + max_seconds
+    while True:
+        session = get_session()
+        try:
+            notification = pending_event(session, subscription, after)
+        finally:
+            session.close()
+        if notification:
+            after = notification["version"]
+            yield format_event(notification)
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        woken = subscription.wake.wait(min(heartbeat_seconds, remaining))
+        subscription.wake.clear()
+        if not woken:
+            yield ": keep-alive\n\n"
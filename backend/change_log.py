@@ -0,0 +1,126 @@
+from models import ChangeLogEntry
+from snapshots import snapshot_select
+from sqlalchemy import select, insert, func, literal
+import logging
+
+logger = logging.getLogger(__name__)
+
+NODE_FIELDS = ['hierarchical_structure', 'person_id', 'name', 'role', 'department', 'rank', 'birth_date',
+               'organization_id', 'upload_date']
+# Beyond this many changed nodes a client is better off fetching the whole tree again
+MAX_CHANGES = 5000
+
+def join_fields(fields):
+    return ','.join(sorted(set(fields))) if fields else None
+
+def mark_changed_tables(session, table_ids):
+    """Note the tables a transaction changed, for the listeners notified once it commits."""
+    session.info.setdefault('changed_tables', set()).update(table_ids)
+
+def record_node_changes(session, nodes, fields=None):
+    """
+    Log the (table_id, hierarchical_structure) nodes changed by the current transaction,
+    one version each, with the changed fields (None for new or replaced nodes).
+    """
+    nodes = list(dict.fromkeys(nodes))
+    if nodes:
+        changed_fields = join_fields(fields)
+        session.execute(insert(ChangeLogEntry), [
+            {"table_id": table_id, "hierarchical_structure": structure, "changed_fields": changed_fields}
+            for table_id, structure in nodes
+        ])
+        mark_changed_tables(session, {table_id for table_id, _ in nodes})
+
+def record_changes_from(session, table_ids, changed, fields=None):
+    """Log the nodes selected by a (table_id, hierarchical_structure) select in the given tables, with one statement."""
+    changed = changed.add_columns(literal(join_fields(fields)).label('changed_fields'))
+    session.execute(insert(ChangeLogEntry).from_select(['table_id', 'hierarchical_structure', 'changed_fields'], changed))
+    mark_changed_tables(session, table_ids)
+
+def record_table_reset(session, table_id):
+    """Log that a table's rows were all (re)written, so clients must fetch it again."""
+    session.execute(insert(ChangeLogEntry).values(table_id=table_id, hierarchical_structure=None))
+    mark_changed_tables(session, [table_id])
+
+def current_version(session, table_id):
+    return tables_version(session, [table_id])
+
+def tables_version_select(table_ids):
+    """A scalar subquery of the newest version of any of the tables, 0 before their first change."""
+    return select(func.coalesce(func.max(ChangeLogEntry.id), 0)).where(ChangeLogEntry.table_id.in_(table_ids)).scalar_subquery()
+
+def tables_version(session, table_ids):
+    return session.execute(select(tables_version_select(table_ids))).scalar()
+
+def split_fields(changed_fields):
+    return changed_fields.split(',') if changed_fields else None
+
+def serialize_node(row):
+    node = {field: getattr(row, field) for field in NODE_FIELDS}
+    for field in ['birth_date', 'upload_date']:
+        node[field] = node[field].isoformat() if node[field] else None
+    return node
+
+def changes_since(session, table_id, since, max_changes=MAX_CHANGES):
+    """
+    Return the node-level changes of a table after a version, as patches to a client's tree.
+
+    Each changed node is reported once with its current state: an upsert with its data,
+    or a delete if it no longer exists, along with the fields changed since the version
+    (None when the node was created or replaced). When the table was rewritten after the
+    version, too many nodes changed, or the version is unknown, the client is told to
+    reset instead, that is to fetch the whole tree again.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+    since (int): The last version the client has applied.
+    max_changes (int): The number of changed nodes above which a reset is returned.
+
+    Returns:
+    dict: The current version, whether the client must reset, and the changes ordered
+    by version, each with its hierarchical_structure, operation, fields and node.
+    """
+    version = current_version(session, table_id)
+    result = {"table_id": table_id, "since": since, "version": version, "reset": False, "changes": []}
+    if since > version:
+        result["reset"] = True
+        return result
+    if since == version:
+        return result
+
+    changed = (
+        select(
+            ChangeLogEntry.hierarchical_structure,
+            func.max(ChangeLogEntry.id).label('version'),
+            # A NULL entry means the whole node changed, which count() reveals by skipping it
+            (func.count(ChangeLogEntry.changed_fields) == func.count()).label('fields_known'),
+            func.group_concat(ChangeLogEntry.changed_fields).label('changed_fields')
+        )
+        .where(ChangeLogEntry.table_id == table_id, ChangeLogEntry.id > since, ChangeLogEntry.id <= version)
+        .group_by(ChangeLogEntry.hierarchical_structure)
+    )
+    changed_nodes = session.execute(changed).all()
+    if any(node.hierarchical_structure is None for node in changed_nodes) or len(changed_nodes) > max_changes:
+        result["reset"] = True
+        return result
+
+    snapshot = snapshot_select(session, table_id).subquery()
+    changed_structures = changed.subquery()
+    current = {
+        row.hierarchical_structure: serialize_node(row)
+        for row in session.execute(
+            select(snapshot).where(snapshot.c.hierarchical_structure.in_(select(changed_structures.c.hierarchical_structure)))
+        )
+    }
+
+    for changed_node in sorted(changed_nodes, key=lambda node: node.version):
+        node = current.get(changed_node.hierarchical_structure)
+        result["changes"].append({
+            "version": changed_node.version,
+            "hierarchical_structure": changed_node.hierarchical_structure,
+            "operation": "upsert" if node else "delete",
+            "fields": sorted(set(split_fields(changed_node.changed_fields))) if changed_node.fields_known else None,
+            "node": node
+        })
+    return result
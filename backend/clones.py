@@ -0,0 +1,69 @@
+from models import Table, DataEntry, DeltaEntry
+from snapshots import KEYFRAME_INTERVAL, ROW_FIELDS, get_table_chain, snapshot_select
+from search_index import index_table_entries
+from change_log import record_table_reset
+from sqlalchemy import select, insert, literal
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLONE_MODES = ('copy', 'reference')
+
+def clone_table(session, table_id, name=None, mode='copy', folder_id=None):
+    """
+    Create a new table with the same rows as an existing one, without reading them into Python.
+
+    In 'copy' mode the rows are copied with one INSERT ... SELECT over the source's
+    snapshot, whatever its storage, and indexed for search in bulk. In 'reference' mode
+    the clone is stored as a delta sharing the source's rows: a full source becomes the
+    clone's base with no delta rows at all, and a delta source lends its base while only
+    its own (small) delta rows are copied, so the clone does not depend on the source.
+    Edits then write delta rows to the clone, copying on write. A reference that would
+    make the delta chain longer than KEYFRAME_INTERVAL falls back to a copy.
+
+    The clone is marked with clone_of_id, so it stays out of the folder's series of
+    snapshots: it is never a predecessor of an upload, a point of the time series or one
+    side of a precomputed consecutive report.
+
+    The clone is flushed but not committed, so the caller can apply edits to it in the
+    same transaction.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table to clone.
+    name (str): The name of the clone, by default the source's name followed by "(clone)".
+    mode (str): 'copy' or 'reference'.
+    folder_id (int): The folder of the clone, by default the source's folder.
+
+    Returns:
+    Table: The new table, whose storage_mode tells how it was stored.
+    """
+    source = session.get(Table, table_id)
+    if source is None:
+        raise ValueError(f"Table with id {table_id} not found")
+
+    clone = Table(name=name or f"{source.name} (clone)", folder_id=folder_id or source.folder_id, upload_date=source.upload_date,
+                  clone_of_id=table_id)
+    session.add(clone)
+    session.flush()
+
+    base_id = source.base_table_id if source.storage_mode == 'delta' else table_id
+    if mode == 'reference' and len(get_table_chain(session, base_id)) <= KEYFRAME_INTERVAL:
+        clone.storage_mode = 'delta'
+        clone.base_table_id = base_id
+        if source.storage_mode == 'delta':
+            columns = ['operation'] + ROW_FIELDS
+            session.execute(insert(DeltaEntry).from_select(['table_id'] + columns, select(
+                literal(clone.id), *[getattr(DeltaEntry, column) for column in columns]
+            ).where(DeltaEntry.table_id == table_id)))
+    else:
+        snapshot = snapshot_select(session, table_id).subquery()
+        session.execute(insert(DataEntry).from_select(['table_id'] + ROW_FIELDS, select(
+            literal(clone.id), *[snapshot.c[column] for column in ROW_FIELDS]
+        )))
+        index_table_entries(session, clone.id)
+
+    record_table_reset(session, clone.id)
+    session.flush()
+    logger.info(f"Cloned table {table_id} into table {clone.id} ({clone.storage_mode})")
+    return clone
@@ -0,0 +1,397 @@
+from models import Table
+from snapshots import snapshot_select
+from sqlalchemy import select, case, cast, and_, or_, func, MetaData, Column, String, Integer, Index
+from sqlalchemy import Table as SchemaTable
+from collections import Counter
+from datetime import datetime
+import json
+import numpy as np
+import logging
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# person_id values that mean "no person", as written by uploads and by vacated nodes
+NULL_PERSON_IDS = ('', 'nan', 'NaN', 'None')
+
+# Compared fields and the change category each one reports into
+CHANGE_CATEGORIES = {
+    'department': 'department_changes',
+    'role': 'role_changes',
+    'rank': 'rank_changes',
+    'hierarchical_structure': 'reporting_line_changes'
+}
+
+ENTRY_FIELDS = ['person_id', 'name', 'role', 'department', 'rank', 'hierarchical_structure']
+
+KEYED_COLUMNS = ENTRY_FIELDS + ['match_key']
+
+def keyed_snapshot(session, table_id, name):
+    """
+    Copy a table's rows into an indexed temporary table keyed for matching across snapshots.
+
+    Rows whose person_id is present and unique within the table are matched by person_id.
+    Vacant rows and rows sharing a person_id are matched by hierarchical_structure instead,
+    so they are never collapsed into a single person.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+    name (str): Prefix for the temporary table name.
+
+    Returns:
+    Table: The temporary table, with a match_key column. Drop it when done.
+    """
+    snapshot = snapshot_select(session, table_id).subquery()
+    # NULL is left out: in the NOT IN list it would make the test NULL for every row
+    duplicated = select(snapshot.c.person_id).where(snapshot.c.person_id.isnot(None)).group_by(
+        snapshot.c.person_id).having(func.count() > 1)
+    keyed_by_person = and_(
+        snapshot.c.person_id.isnot(None),
+        snapshot.c.person_id.notin_(NULL_PERSON_IDS),
+        snapshot.c.person_id.notin_(duplicated)
+    )
+    keyed_rows = select(
+        *[snapshot.c[field] for field in ENTRY_FIELDS],
+        case((keyed_by_person, 'p:' + snapshot.c.person_id), else_='s:' + snapshot.c.hierarchical_structure).label('match_key')
+    )
+
+    # The join key is computed, so it is indexed explicitly on a temporary copy
+    keyed = SchemaTable(
+        f"{name}_{uuid.uuid4().hex[:8]}", MetaData(),
+        *[Column(column, String) for column in KEYED_COLUMNS],
+        prefixes=['TEMPORARY']
+    )
+    connection = session.connection()
+    keyed.create(connection)
+    session.execute(keyed.insert().from_select(KEYED_COLUMNS, keyed_rows))
+    Index(f"ix_{keyed.name}_match_key", keyed.c.match_key).create(connection)
+    return keyed
+
+def diff_tables(session, table1_id, table2_id):
+    """
+    Compute added, removed and changed rows between two tables inside the database.
+
+    Only rows that differ are fetched, so the cost on the Python side grows with the
+    size of the change rather than the size of the snapshots.
+
+    Args:
+    session (Session): The database session.
+    table1_id (int): The ID of the earlier table.
+    table2_id (int): The ID of the later table.
+
+    Returns:
+    dict: The changes, in the format returned by /compare_tables.
+    """
+    changes = {
+        "added": [],
+        "removed": [],
+        "changed": [],
+        "department_changes": {},
+        "role_changes": {},
+        "rank_changes": {},
+        "reporting_line_changes": {}
+    }
+
+    old = keyed_snapshot(session, table1_id, 'diff_old')
+    new = keyed_snapshot(session, table2_id, 'diff_new')
+    try:
+        collect_changes(session, old, new, changes)
+    finally:
+        old.drop(session.connection())
+        new.drop(session.connection())
+
+    logger.info(f"Diff of tables {table1_id} and {table2_id}: {len(changes['added'])} added, "
+                f"{len(changes['removed'])} removed, {len(changes['changed'])} changed")
+    return changes
+
+def collect_changes(session, old, new, changes):
+    differs = or_(*[old.c[field].is_distinct_from(new.c[field]) for field in CHANGE_CATEGORIES])
+
+    removed_or_changed = (
+        select(
+            *[old.c[field].label(f"old_{field}") for field in ENTRY_FIELDS],
+            *[new.c[field].label(f"new_{field}") for field in ENTRY_FIELDS],
+            old.c.match_key,
+            new.c.match_key.label('new_match_key')
+        )
+        .select_from(old.outerjoin(new, old.c.match_key == new.c.match_key))
+        .where(or_(new.c.match_key.is_(None), differs))
+        .order_by(old.c.hierarchical_structure)
+    )
+
+    for row in session.execute(removed_or_changed):
+        if row.new_match_key is None:
+            changes["removed"].append({field: getattr(row, f"old_{field}") for field in ENTRY_FIELDS})
+            continue
+
+        # Changes are reported under the person_id, or the structure for rows matched by position
+        change_key = row.match_key[2:]
+        for field, category in CHANGE_CATEGORIES.items():
+            old_value, new_value = getattr(row, f"old_{field}"), getattr(row, f"new_{field}")
+            if old_value != new_value:
+                changes[category][change_key] = {
+                    "name": row.new_name,
+                    "old": old_value,
+                    "new": new_value
+                }
+
+        changes["changed"].append({
+            "person_id": row.new_person_id,
+            "name": row.new_name,
+            "changes": {
+                field: (getattr(row, f"old_{field}"), getattr(row, f"new_{field}"))
+                for field in CHANGE_CATEGORIES
+            }
+        })
+
+    added = (
+        select(*[new.c[field] for field in ENTRY_FIELDS])
+        .select_from(new.outerjoin(old, old.c.match_key == new.c.match_key))
+        .where(old.c.match_key.is_(None))
+        .order_by(new.c.hierarchical_structure)
+    )
+    changes["added"] = [dict(row._mapping) for row in session.execute(added)]
+
+def build_comparison_report(session, table1, table2):
+    """
+    Build the /compare_tables response for two tables.
+
+    Args:
+    session (Session): The database session.
+    table1 (Table): The earlier table.
+    table2 (Table): The later table.
+
+    Returns:
+    dict: Table metadata, row-level changes and the aggregated report.
+    """
+    changes = diff_tables(session, table1.id, table2.id)
+    aggregated_report = generate_aggregated_report(changes, profile_table(session, table1.id), profile_table(session, table2.id))
+
+    return {
+        "table1": {
+            "id": table1.id,
+            "name": table1.name,
+            "upload_date": table1.upload_date.isoformat()
+        },
+        "table2": {
+            "id": table2.id,
+            "name": table2.name,
+            "upload_date": table2.upload_date.isoformat()
+        },
+        "changes": changes,
+        "aggregated_report": aggregated_report
+    }
+
+def generate_aggregated_report(changes, profile1, profile2):
+    return {
+        "total_employees": {
+            "before": profile1["total"],
+            "after": profile2["total"],
+            "difference": profile2["total"] - profile1["total"]
+        },
+        "department_changes": summarize_changes(changes["department_changes"]),
+        "role_changes": summarize_changes(changes["role_changes"]),
+        "rank_changes": summarize_changes(changes["rank_changes"]),
+        "reporting_line_changes": summarize_changes(changes["reporting_line_changes"]),
+        "structural_changes": len(changes["changed"]),
+        "new_employees": len(changes["added"]),
+        "departed_employees": len(changes["removed"]),
+        "age_distribution_change": compare_age_distributions(profile1, profile2),
+        "rank_distribution_change": compare_rank_distributions(profile1, profile2),
+        "department_size_changes": compare_department_sizes(profile1, profile2),
+        "role_diversity": compare_role_diversity(profile1, profile2),
+        "org_depth_analysis": compare_org_depths(profile1, profile2),
+        "span_of_control_changes": compare_span_of_control(profile1, profile2),
+        "turnover_rate": calculate_turnover_rate(changes, profile1),
+        "promotion_rate": calculate_promotion_rate(changes, profile1)
+    }
+
+def profile_table(session, table_id):
+    """
+    Compute the per-table figures behind the aggregated report.
+
+    Every figure comes from one SELECT over a CTE of the snapshot. A delta-stored snapshot
+    is materialized, so its rows are merged a single time; a full one is a range of the
+    table_id index that is cheaper to read again than to copy. The rank, department and
+    birth year counts and the team sizes are grouped into JSON arrays next to the row,
+    role and depth aggregates, and ages are summarized from the birth year histogram.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+
+    Returns:
+    dict: Row count, age summary, rank and department counts, distinct roles,
+    maximum depth and average span of control.
+    """
+    rows = snapshot_select(session, table_id).subquery()
+    storage_mode = session.get(Table, table_id).storage_mode
+    structure = rows.c.hierarchical_structure
+    snapshot = select(
+        rows.c.rank,
+        rows.c.department,
+        rows.c.role,
+        cast(func.strftime('%Y', rows.c.birth_date), Integer).label('birth_year'),
+        (func.length(structure) - func.length(func.replace(structure, '/', '')) + 1).label('depth'),
+        # rtrim drops the trailing characters that are not '/', leaving the manager's structure and a '/'
+        func.rtrim(structure, func.replace(structure, '/', '')).label('manager_slash')
+    ).cte('snapshot')
+    if storage_mode == 'full':
+        snapshot = snapshot.prefix_with('NOT MATERIALIZED')
+
+    def counts_json(column):
+        # [[value, count], ...] keeps NULL values and the type of the grouped values
+        groups = select(column.label('value'), func.count().label('count')).group_by(column).subquery()
+        return select(func.json_group_array(func.json_array(groups.c.value, groups.c.count))).scalar_subquery()
+
+    # Filtering the groups rather than the rows computes each row's manager once
+    teams = (
+        select(func.count().label('size'))
+        .select_from(snapshot)
+        .group_by(snapshot.c.manager_slash)
+        .having(snapshot.c.manager_slash.notin_(['', '/']))
+        .subquery()
+    )
+    profile = session.execute(select(
+        func.count().label('total'),
+        # COUNT(DISTINCT) skips NULL, while a set of roles counts it once
+        func.count(snapshot.c.role.distinct()).label('distinct_roles'),
+        func.max(snapshot.c.role.is_(None)).label('has_null_role'),
+        func.max(snapshot.c.depth).label('max_depth'),
+        counts_json(snapshot.c.rank).label('rank_counts'),
+        counts_json(snapshot.c.department).label('department_counts'),
+        counts_json(snapshot.c.birth_year).label('birth_year_counts'),
+        select(func.json_array(func.count(), func.sum(teams.c.size))).scalar_subquery().label('teams')
+    ).select_from(snapshot)).one()
+
+    def counter(counts):
+        return Counter({value: count for value, count in json.loads(counts)})
+
+    birth_year_counts = counter(profile.birth_year_counts)
+    birth_year_counts.pop(None, None)
+    managers, managed = json.loads(profile.teams)
+
+    return {
+        "total": profile.total,
+        "age_distribution": summarize_ages(birth_year_counts),
+        "rank_counts": counter(profile.rank_counts),
+        "department_counts": counter(profile.department_counts),
+        "unique_roles": profile.distinct_roles + (1 if profile.has_null_role else 0),
+        "max_depth": profile.max_depth or 0,
+        "average_span": managed / managers if managers else 0
+    }
+
+def summarize_ages(birth_year_counts):
+    if not birth_year_counts:
+        return {"average": 0, "min": 0, "max": 0, "median": 0}
+
+    current_year = datetime.now().year
+    ages = np.array(sorted(current_year - year for year in birth_year_counts), dtype=np.int64)
+    counts = np.array([birth_year_counts[current_year - age] for age in ages], dtype=np.int64)
+
+    # The median is the age at position n // 2 of the sorted ages, found on the cumulative counts
+    total = int(counts.sum())
+    median_index = int(np.searchsorted(np.cumsum(counts), total // 2, side='right'))
+    return {
+        "average": int((ages * counts).sum()) / total,
+        "min": int(ages[0]),
+        "max": int(ages[-1]),
+        "median": int(ages[median_index])
+    }
+
+def summarize_changes(changes):
+    return {
+        "total": len(changes),
+        "details": changes
+    }
+
+def compare_age_distributions(profile1, profile2):
+    dist1 = profile1["age_distribution"]
+    dist2 = profile2["age_distribution"]
+    
+    return {
+        "before": dist1,
+        "after": dist2,
+        "average_change": dist2["average"] - dist1["average"],
+        "median_change": dist2["median"] - dist1["median"]
+    }
+
+def compare_rank_distributions(profile1, profile2):
+    dist1 = profile1["rank_counts"]
+    dist2 = profile2["rank_counts"]
+    
+    changes = {}
+    for rank in dist1.keys() | dist2.keys():
+        before = dist1.get(rank, 0)
+        after = dist2.get(rank, 0)
+        if before != after:
+            changes[rank] = after - before
+    
+    return changes
+
+def compare_department_sizes(profile1, profile2):
+    sizes1 = profile1["department_counts"]
+    sizes2 = profile2["department_counts"]
+    
+    changes = {}
+    for dept in sizes1.keys() | sizes2.keys():
+        before = sizes1.get(dept, 0)
+        after = sizes2.get(dept, 0)
+        if before != after:
+            percent_change = ((after - before) / before * 100) if before > 0 else None
+            changes[dept] = {
+                "before": before,
+                "after": after,
+                "change": after - before,
+                "percent_change": percent_change
+            }
+    
+    return changes
+
+def compare_role_diversity(profile1, profile2):
+    def get_role_diversity(profile):
+        return {
+            "unique_roles": profile["unique_roles"],
+            "role_to_employee_ratio": profile["unique_roles"] / profile["total"] if profile["total"] else 0
+        }
+    
+    div1 = get_role_diversity(profile1)
+    div2 = get_role_diversity(profile2)
+    
+    return {
+        "before": div1,
+        "after": div2,
+        "unique_roles_change": div2["unique_roles"] - div1["unique_roles"],
+        "ratio_change": div2["role_to_employee_ratio"] - div1["role_to_employee_ratio"]
+    }
+
+def compare_org_depths(profile1, profile2):
+    depth1 = profile1["max_depth"]
+    depth2 = profile2["max_depth"]
+    
+    return {
+        "before": depth1,
+        "after": depth2,
+        "change": depth2 - depth1
+    }
+
+def compare_span_of_control(profile1, profile2):
+    span1 = profile1["average_span"]
+    span2 = profile2["average_span"]
+    
+    return {
+        "before": span1,
+        "after": span2,
+        "change": span2 - span1
+    }
+
+def calculate_turnover_rate(changes, profile1):
+    departed = len(changes["removed"])
+    total_before = profile1["total"]
+    return (departed / total_before) * 100 if total_before > 0 else 0
+
+def calculate_promotion_rate(changes, profile1):
+    promotions = sum(1 for change in changes["rank_changes"].values() if change["old"] < change["new"])
+    total_before = profile1["total"]
+    return (promotions / total_before) * 100 if total_before > 0 else 0
@@ -0,0 +1,166 @@
+from models import Folder, Table, DataEntry, DeltaEntry, ChangeLogEntry, begin_write_transaction
+from snapshots import rewrite_as_keyframe
+from report_cache import invalidate_tables_reports
+from timeseries import invalidate_tables_points
+from autocomplete import discard_table_completions
+from change_log import record_table_reset
+from search_index import merge_search_index
+from sqlalchemy import select, delete, func
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Rows deleted per transaction; each batch holds the write lock for a few tens of milliseconds
+DELETE_BATCH_ROWS = 5000
+# Free pages returned to the file system per incremental vacuum step
+VACUUM_STEP_PAGES = 2000
+INCREMENTAL_VACUUM = 2
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
+
+def delete_tables(session, table_ids, folder_id=None, batch_rows=DELETE_BATCH_ROWS):
+    """
+    Delete tables, and optionally their folder, in short transactions, yielding progress.
+
+    The first transaction marks the tables (and folder) as deleting, which hides them from
+    every reader, drops their cached reports and time series points and logs a reset of
+    each table, so event streams tell their clients right away. Tables stored as deltas
+    against a deleted table are then rewritten as keyframes, one per transaction. Their
+    data_entries, delta_entries and node-level change_log rows are deleted with set-based
+    DELETEs of batch_rows rows each, committed one by one so readers and other writers get
+    the database between batches, and the search index is merged to drop the deleted
+    entries. The tables (and folder) go last with their logged resets, so an interrupted
+    deletion leaves them hidden and can simply be run again.
+
+    Args:
+    session (Session): The database session.
+    table_ids (list): The IDs of the tables to delete.
+    folder_id (int): The ID of a folder to delete with its tables, or None.
+    batch_rows (int): The number of rows deleted per transaction.
+
+    Yields:
+    dict: The phase with its progress and elapsed milliseconds.
+    """
+    table_ids = list(table_ids)
+    start = time.perf_counter()
+
+    begin_write_transaction(session)
+    session.query(Table).filter(Table.id.in_(table_ids)).update({'deleting': True}, synchronize_session=False)
+    if folder_id is not None:
+        session.query(Folder).filter(Folder.id == folder_id).update({'deleting': True}, synchronize_session=False)
+    invalidate_tables_reports(session, table_ids)
+    invalidate_tables_points(session, table_ids)
+    for table_id in table_ids:
+        record_table_reset(session, table_id)
+    session.commit()
+    yield {"phase": "hide", "tables": len(table_ids), "elapsed_ms": elapsed_ms(start)}
+
+    # A delta based on a deleted table could still be uploaded until the tables were hidden,
+    # so the dependents are looked up again before each rewrite
+    rewritten = []
+    while True:
+        begin_write_transaction(session)
+        dependent = session.query(Table).filter(
+            Table.storage_mode == 'delta', Table.base_table_id.in_(table_ids), Table.id.notin_(table_ids)
+        ).first()
+        if dependent is None:
+            session.commit()
+            break
+        rewrite_as_keyframe(session, dependent)
+        rewritten.append(dependent.id)
+        session.commit()
+        yield {"phase": "rewrite", "table_id": rewritten[-1], "elapsed_ms": elapsed_ms(start)}
+
+    # Resets stay logged until the tables go, so streams that have not sent them yet still can
+    batched_rows = {
+        DataEntry: DataEntry.table_id.in_(table_ids),
+        DeltaEntry: DeltaEntry.table_id.in_(table_ids),
+        ChangeLogEntry: ChangeLogEntry.table_id.in_(table_ids) & ChangeLogEntry.hierarchical_structure.isnot(None)
+    }
+    totals = {
+        model.__tablename__: session.execute(select(func.count()).where(condition)).scalar()
+        for model, condition in batched_rows.items()
+    }
+    for model, condition in batched_rows.items():
+        deleted = 0
+        batch = delete(model).where(model.id.in_(select(model.id).where(condition).limit(batch_rows)))
+        while True:
+            count = session.execute(batch).rowcount
+            session.commit()
+            if not count:
+                break
+            deleted += count
+            yield {"phase": model.__tablename__, "deleted": deleted, "total": totals[model.__tablename__],
+                   "elapsed_ms": elapsed_ms(start)}
+
+    steps = 0
+    while merge_search_index(session):
+        session.commit()
+        steps += 1
+        yield {"phase": "search_index", "merge_steps": steps, "elapsed_ms": elapsed_ms(start)}
+    session.commit()
+
+    session.query(ChangeLogEntry).filter(ChangeLogEntry.table_id.in_(table_ids)).delete(synchronize_session=False)
+    session.query(Table).filter(Table.id.in_(table_ids)).delete(synchronize_session=False)
+    if folder_id is not None:
+        session.query(Folder).filter(Folder.id == folder_id).delete(synchronize_session=False)
+    session.commit()
+    for table_id in table_ids:
+        discard_table_completions(session, table_id)
+    deleted_rows = {name: total for name, total in totals.items() if name != ChangeLogEntry.__tablename__}
+    logger.info(f"Deleted tables {', '.join(map(str, table_ids))} with {sum(deleted_rows.values())} rows in {elapsed_ms(start)} ms")
+    yield {"phase": "tables", "deleted": len(table_ids), "deleted_rows": deleted_rows, "rewritten_tables": rewritten,
+           "elapsed_ms": elapsed_ms(start)}
+
+def reclaim_space(engine, step_pages=VACUUM_STEP_PAGES, full=False):
+    """
+    Return the pages freed by deletions to the file system, yielding progress.
+
+    Databases in incremental auto_vacuum mode (every database created since it was
+    introduced) are shrunk step_pages at a time, so the write lock is released between
+    steps. Older databases keep their free pages for reuse unless full is set: a single
+    VACUUM then rewrites the file, locking it for its whole duration, and switches it to
+    incremental mode for the next time.
+
+    Args:
+    engine (Engine): The database engine.
+    step_pages (int): The number of pages freed per step.
+    full (bool): Whether to run a full VACUUM on a database without incremental mode.
+
+    Yields:
+    dict: The free pages left, the bytes reclaimed so far and the elapsed milliseconds.
+    """
+    start = time.perf_counter()
+    raw_connection = engine.raw_connection()
+    try:
+        connection = raw_connection.driver_connection
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        free_pages = initial_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+
+        def progress(**extra):
+            return {"phase": "vacuum", "free_pages": free_pages, "reclaimed_bytes": (initial_pages - free_pages) * page_size,
+                    **extra, "elapsed_ms": elapsed_ms(start)}
+
+        if connection.execute("PRAGMA auto_vacuum").fetchone()[0] != INCREMENTAL_VACUUM:
+            if not full:
+                yield progress(skipped="The database predates incremental vacuum; free pages are reused by new rows")
+                return
+            connection.execute(f"PRAGMA auto_vacuum = {INCREMENTAL_VACUUM}")
+            connection.execute("VACUUM")
+            free_pages = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            yield progress(full=True)
+            return
+
+        while free_pages:
+            # sqlite3's execute frees a single page per call; executescript runs the pragma to completion
+            connection.executescript(f"PRAGMA incremental_vacuum({step_pages})")
+            remaining = connection.execute("PRAGMA freelist_count").fetchone()[0]
+            if remaining >= free_pages:
+                break
+            free_pages = remaining
+            yield progress()
+    finally:
+        raw_connection.close()
+    logger.info(f"Reclaimed {(initial_pages - free_pages) * page_size} bytes in {elapsed_ms(start)} ms")
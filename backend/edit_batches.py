@@ -0,0 +1,346 @@
+from models import Table, DataEntry, DeltaEntry, begin_write_transaction
+from snapshots import ROW_FIELDS, snapshot_select, ensure_full_storage, rewrite_dependents
+from report_cache import invalidate_tables_reports
+from timeseries import invalidate_tables_points
+from search_index import index_entries, index_updated_entries
+from change_log import record_node_changes
+from autocomplete import COMPLETION_FIELDS, update_table_completions
+from bulk_updates import parse_person_updates
+from relocations import NULL_NODE, is_in_subtree
+from utils import next_child_structure
+from sqlalchemy import select, update, insert, delete, bindparam
+from bisect import bisect_left, bisect_right, insort
+import pandas as pd
+import io
+import logging
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = ('update', 'move', 'create')
+BATCH_FIELDS = ['person_id', 'name', 'role', 'department', 'rank', 'birth_date', 'organization_id']
+# Columns locating the node a row changes, and the parent it is moved or created under
+LOCATOR_COLUMNS = ['hierarchical_structure', 'parent_structure', 'parent_person_id']
+MAX_BATCH_ROWS = 5000
+ENTRY_COLUMNS = ['id', 'hierarchical_structure', 'upload_date'] + BATCH_FIELDS
+
+def read_edit_batch(file_content, file_extension):
+    """
+    Read the operations of an edit batch from a CSV or XLSX file.
+
+    Cells are kept as text, so person IDs keep their leading zeros, and empty cells
+    become None, meaning "leave unchanged".
+
+    Returns:
+    tuple: The operations as a list of dicts with lowercased column names and None, or
+    None and the error message.
+    """
+    if file_extension == 'csv':
+        df = pd.read_csv(io.BytesIO(file_content), dtype=str, keep_default_na=False)
+    else:  # xlsx
+        df = pd.read_excel(io.BytesIO(file_content), dtype=str, keep_default_na=False)
+    df.columns = df.columns.str.strip().str.lower()
+
+    if 'operation' not in df.columns:
+        return None, "Required column operation is missing"
+    unknown_columns = [column for column in df.columns if column not in ['operation'] + LOCATOR_COLUMNS + BATCH_FIELDS]
+    if unknown_columns:
+        return None, f"Unknown column(s): {', '.join(unknown_columns)}"
+    if len(df) > MAX_BATCH_ROWS:
+        return None, f"An edit batch is limited to {MAX_BATCH_ROWS} rows"
+
+    operations = []
+    for record in df.to_dict('records'):
+        operations.append({column: value.strip() if isinstance(value, str) and value.strip() else None
+                           for column, value in record.items()})
+    return operations, None
+
+class SnapshotIndex:
+    """
+    The nodes of one snapshot in memory, changed row by row as an edit batch is validated.
+
+    Nodes are kept by structure, with a sorted list of structures for subtree ranges and
+    child slots (a root plus [root/, root0), and the same skip-scan as the SQL side) and a
+    lookup of structures by person ID.
+    """
+
+    def __init__(self, rows):
+        self.nodes = {row['hierarchical_structure']: row for row in rows}
+        self.structures = sorted(self.nodes)
+        self.people = {}
+        for structure, node in self.nodes.items():
+            self.add_person(node['person_id'], structure)
+
+    def add_person(self, person_id, structure):
+        if person_id is not None and person_id != 'nan':
+            self.people.setdefault(person_id, set()).add(structure)
+
+    def remove_person(self, person_id, structure):
+        structures = self.people.get(person_id)
+        if structures is not None:
+            structures.discard(structure)
+            if not structures:
+                del self.people[person_id]
+
+    def find(self, structure=None, person_id=None, role='Node'):
+        """Return the structure of a node given by structure or by person ID, and None or the error message."""
+        if structure is not None:
+            if structure not in self.nodes:
+                return None, f"{role} with hierarchical structure {structure} not found"
+            return structure, None
+        if person_id is None:
+            return None, f"{role} must be given by hierarchical structure or person ID"
+        structures = self.people.get(person_id, ())
+        if len(structures) != 1:
+            found = 'not found' if not structures else f"matches {len(structures)} nodes, give its hierarchical structure"
+            return None, f"{role} with person ID {person_id} {found}"
+        return next(iter(structures)), None
+
+    def subtree(self, root):
+        # Not one slice: a sibling such as root.5 sorts between root and root/
+        start = bisect_left(self.structures, root + '/')
+        descendants = self.structures[start:bisect_left(self.structures, root + '0', start)]
+        return ([root] if root in self.nodes else []) + descendants
+
+    def child_suffixes(self, parent):
+        suffixes = {}
+        low, high = parent + '/', parent + '0'
+        position = bisect_right(self.structures, low)
+        while position < len(self.structures) and self.structures[position] < high:
+            current = self.structures[position]
+            segment = current[len(low):].split('/', 1)[0]
+            suffixes[segment] = None
+            following = bisect_right(self.structures, current, position)
+            if following < len(self.structures) and self.structures[following] < low + segment + '/':
+                position = following
+            else:
+                position = bisect_left(self.structures, low + segment + '0', position)
+        return list(suffixes)
+
+    def update(self, structure, values):
+        node = self.nodes[structure]
+        if 'person_id' in values:
+            self.remove_person(node['person_id'], structure)
+            self.add_person(values['person_id'], structure)
+        node.update(values)
+
+    def move(self, root, parent):
+        """Move a subtree under a new parent, to its next free child slot, and return the new root."""
+        new_root = next_child_structure(parent, self.child_suffixes(parent))
+        moved = self.subtree(root)
+        for structure in moved:
+            del self.structures[bisect_left(self.structures, structure)]
+        nodes = [self.nodes.pop(structure) for structure in moved]
+        for structure, node in zip(moved, nodes):
+            self.remove_person(node['person_id'], structure)
+        for structure, node in zip(moved, nodes):
+            node['hierarchical_structure'] = new_root + structure[len(root):]
+            self.nodes[node['hierarchical_structure']] = node
+            insort(self.structures, node['hierarchical_structure'])
+            self.add_person(node['person_id'], node['hierarchical_structure'])
+        return new_root
+
+    def create(self, parent, values):
+        structure = next_child_structure(parent, self.child_suffixes(parent))
+        self.nodes[structure] = {"id": None, "hierarchical_structure": structure, **values}
+        insort(self.structures, structure)
+        self.add_person(values.get('person_id'), structure)
+        return structure
+
+def apply_operation(index, operation):
+    """
+    Validate one row of an edit batch and apply it to the in-memory index.
+
+    For update and move, the node is given by hierarchical_structure, or else by
+    person_id; a person_id next to a hierarchical_structure is a new value. The parent
+    of move and create is given by parent_structure or parent_person_id.
+
+    Returns:
+    tuple: The row report and None, or None and the error message.
+    """
+    kind = (operation.get('operation') or '').lower()
+    if kind not in OPERATIONS:
+        return None, f"Invalid operation. Use one of: {', '.join(OPERATIONS)}"
+
+    locate_by_person = kind != 'create' and operation.get('hierarchical_structure') is None
+    fields = {field: operation[field] for field in BATCH_FIELDS
+              if operation.get(field) is not None and not (field == 'person_id' and locate_by_person)}
+    values, error = parse_person_updates(fields)
+    if error:
+        return None, error
+
+    structure = parent = None
+    if kind != 'create':
+        structure, error = index.find(operation.get('hierarchical_structure'), operation.get('person_id'))
+        if error:
+            return None, error
+    if kind != 'update':
+        parent, error = index.find(operation.get('parent_structure'), operation.get('parent_person_id'), 'Parent node')
+        if error:
+            return None, error
+
+    report = {"operation": kind}
+    if kind == 'update':
+        if not values:
+            return None, "An update must change at least one field"
+        index.update(structure, values)
+        report["hierarchical_structure"] = structure
+    elif kind == 'move':
+        if is_in_subtree(parent, structure):
+            return None, "A node cannot be moved under itself or one of its descendants"
+        new_structure = index.move(structure, parent)
+        index.update(new_structure, values)
+        report.update({"previous_hierarchical_structure": structure, "hierarchical_structure": new_structure})
+    else:
+        if not values.get('role'):
+            return None, "A new position needs a role"
+        report["hierarchical_structure"] = index.create(parent, {**NULL_NODE, "role": None, **values})
+    report["fields"] = sorted(values)
+    return report, None
+
+def write_entry_edits(session, table_id, changed, created):
+    """Write the edits of a batch to the data_entries rows of a full table."""
+    # Moved rows park on a placeholder first, so a subtree can take over structures another one leaves
+    moved = [node for node, changes in changed if 'hierarchical_structure' in changes]
+    if moved:
+        session.execute(update(DataEntry), [
+            {"id": node['id'], "hierarchical_structure": f"#{node['id']}"} for node in moved
+        ])
+    if changed:
+        session.execute(update(DataEntry), [{"id": node['id'], **changes} for node, changes in changed])
+        index_updated_entries(session)
+    if created:
+        new_ids = session.execute(insert(DataEntry).returning(DataEntry.id), [
+            {**{column: node[column] for column in ENTRY_COLUMNS if column != 'id'}, "table_id": table_id}
+            for node in created
+        ]).scalars().all()
+        index_entries(session, new_ids)
+
+def write_delta_edits(session, table, original, changed, created):
+    """
+    Write the edits of a batch to a delta table as delta rows, leaving the rows it shares
+    with its base untouched: every edited node becomes an upsert of its structure, dated
+    like the table, and every structure left empty by a move a delete.
+    """
+    edits = {}
+    for node, changes in changed:
+        previous_structure = original[node['id']]['hierarchical_structure']
+        if previous_structure != node['hierarchical_structure']:
+            edits[previous_structure] = None
+    # A node moved or created into a vacated structure takes it over
+    for node in [node for node, _ in changed] + created:
+        edits[node['hierarchical_structure']] = node
+    if not edits:
+        return
+
+    delta_entries = DeltaEntry.__table__
+    session.execute(
+        delete(delta_entries).where(delta_entries.c.table_id == table.id,
+                                    delta_entries.c.hierarchical_structure == bindparam('structure')),
+        [{"structure": structure} for structure in edits]
+    )
+    session.execute(insert(DeltaEntry), [
+        {"table_id": table.id, "operation": "upsert", **{field: node[field] for field in ROW_FIELDS}, "upload_date": table.upload_date}
+        if node is not None
+        else {**{field: None for field in ROW_FIELDS}, "table_id": table.id, "operation": "delete", "hierarchical_structure": structure}
+        for structure, node in edits.items()
+    ])
+
+def apply_edit_batch(session, table_id, operations):
+    """
+    Validate an edit batch against a snapshot and apply it in one transaction, all or nothing.
+
+    The snapshot is loaded once into a SnapshotIndex, and the rows are checked and applied
+    to it in order, so a row sees the nodes moved or created by the rows before it. If any
+    row is invalid, nothing is written and every row is reported. Otherwise the changed
+    rows are written with one executemany UPDATE, the new positions with one INSERT, and
+    the change log, cached reports and time series points updated before a single commit.
+    A delta table, such as a reference clone, is not materialized: its edits are written
+    as delta rows instead. The transaction is the caller's until the commit, so a table
+    cloned in it is rolled back with an invalid batch.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table to edit.
+    operations (list): The rows of the batch, as returned by read_edit_batch.
+
+    Returns:
+    tuple: A report per row (with its 1-based spreadsheet row number, status and the
+    structures it touched, or its error), and None if the batch was applied or else the
+    error that stopped it.
+    """
+    try:
+        begin_write_transaction(session)
+        table = session.get(Table, table_id)
+        copy_on_write = table.storage_mode == 'delta'
+        if copy_on_write:
+            rewrite_dependents(session, table_id)
+        else:
+            ensure_full_storage(session, table_id)
+        snapshot = snapshot_select(session, table_id).subquery()
+        rows = [dict(zip(ENTRY_COLUMNS, row)) for row in session.execute(
+            select(*[snapshot.c[column] for column in ENTRY_COLUMNS]).order_by(snapshot.c.id)
+        )]
+        original = {row['id']: dict(row) for row in rows}
+        index = SnapshotIndex(rows)
+
+        reports = []
+        for number, operation in enumerate(operations, start=2):
+            report, error = apply_operation(index, operation)
+            reports.append({"row": number, "status": "valid", **report} if report else
+                           {"row": number, "status": "error", "operation": operation.get('operation'), "error": error})
+        invalid = [report for report in reports if report["status"] == "error"]
+        if invalid:
+            session.rollback()
+            error = f"Edit batch was not applied: {len(invalid)} invalid row(s), the first at row {invalid[0]['row']}: {invalid[0]['error']}"
+            logger.warning(error)
+            for report in reports:
+                if report["status"] == "valid":
+                    report["status"] = "not_applied"
+            return reports, error
+
+        changed, created = [], []
+        for node in index.nodes.values():
+            if node['id'] is None:
+                created.append(node)
+            else:
+                changes = {column: value for column, value in node.items() if original[node['id']][column] != value}
+                if changes:
+                    changed.append((node, changes))
+
+        for node in created:
+            node['upload_date'] = table.upload_date
+        if copy_on_write:
+            write_delta_edits(session, table, original, changed, created)
+        else:
+            write_entry_edits(session, table_id, changed, created)
+
+        # One change log insert per distinct set of changed fields
+        changed_nodes = {}
+        for node, changes in changed:
+            previous_structure = original[node['id']]['hierarchical_structure']
+            changed_nodes.setdefault(tuple(sorted(changes)), []).extend(
+                [(table_id, previous_structure), (table_id, node['hierarchical_structure'])]
+            )
+        for fields, nodes in changed_nodes.items():
+            record_node_changes(session, nodes, list(fields))
+        record_node_changes(session, [(table_id, node['hierarchical_structure']) for node in created])
+        if changed or created:
+            invalidate_tables_reports(session, [table_id])
+            invalidate_tables_points(session, [table_id])
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        error = f"An error occurred while applying the edit batch: {str(e)}"
+        logger.error(error)
+        return [{"row": number, "status": "not_applied"} for number in range(2, len(operations) + 2)], error
+
+    for node, changes in changed:
+        if any(field in changes for field in COMPLETION_FIELDS):
+            update_table_completions(session, table_id, {field: original[node['id']][field] for field in COMPLETION_FIELDS},
+                                     {field: node[field] for field in COMPLETION_FIELDS})
+    for node in created:
+        update_table_completions(session, table_id, None, {field: node[field] for field in COMPLETION_FIELDS})
+    for report in reports:
+        report["status"] = "applied"
+    logger.info(f"Applied edit batch of {len(operations)} rows to table {table_id}: {len(changed)} rows changed, {len(created)} created")
+    return reports, None
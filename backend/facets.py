@@ -0,0 +1,50 @@
+from sqlalchemy import select, func, literal, union_all
+import logging
+
+logger = logging.getLogger(__name__)
+
+FACET_FIELDS = ['department', 'rank', 'role']
+# Values beyond this many per facet are folded into its "other" count
+MAX_FACET_VALUES = 50
+
+def facet_counts(session, query, fields, max_values=MAX_FACET_VALUES):
+    """
+    Count the rows of a filtered query by each facet field, inside the database.
+
+    The matched rows are a CTE shared by one grouped query per field. SQLite
+    materializes a CTE that is referenced more than once, so the search runs once
+    however many facets are asked for, and only the groups leave the database.
+
+    Args:
+    session (Session): The database session.
+    query (Query): The filtered query, without ordering or limits.
+    fields (list): The facet fields, a subset of FACET_FIELDS.
+    max_values (int): The number of values listed per facet.
+
+    Returns:
+    dict: For each field, the most frequent values with their counts (most frequent
+    first, a null value included), the number of distinct values, and the count of the
+    rows whose value is not listed.
+    """
+    rows = query.subquery()
+    # Only the facet columns are materialized
+    matched = select(*(rows.c[field] for field in fields)).cte('matched')
+    grouped = union_all(*(
+        select(literal(field).label('field'), matched.c[field].label('value'), func.count().label('count'))
+        .group_by(matched.c[field])
+        for field in fields
+    ))
+
+    groups = {field: [] for field in fields}
+    for field, value, count in session.execute(grouped):
+        groups[field].append((value, count))
+
+    facets = {}
+    for field, values in groups.items():
+        values.sort(key=lambda item: (-item[1], item[0] is None, str(item[0])))
+        facets[field] = {
+            "values": [{"value": value, "count": count} for value, count in values[:max_values]],
+            "distinct": len(values),
+            "other": sum(count for _, count in values[max_values:])
+        }
+    return facets
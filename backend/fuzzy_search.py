@@ -0,0 +1,267 @@
+from models import normalize_search_text, get_session
+from snapshots import snapshot_select
+from autocomplete import get_table_completions, measure_table_completions, index_lock
+from sqlalchemy import select, or_
+from collections import defaultdict
+import heapq
+import re
+import sys
+import logging
+
+logger = logging.getLogger(__name__)
+
+SEARCH_MODES = ('exact', 'fuzzy')
+FUZZY_FIELDS = ['name', 'role']
+MAX_EDIT_DISTANCE = 2
+# Fuzzy results are ranked by score, so they are returned as one top-k list rather than pages
+FUZZY_RESULT_LIMIT = 100
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(normalize_search_text(text) or '')
+
+def token_grams(token):
+    """Return the trigrams of a token padded with one space on each side; a token has len(token) of them."""
+    padded = f' {token} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def is_exact_token(token):
+    """Tokens with digits (IDs, levels, grades) only match exactly; a typo there names a different value."""
+    return any(char.isdigit() for char in token)
+
+def allowed_distance(token, max_distance):
+    """
+    Return the edit distance tolerated for a query token.
+
+    One edit changes at most three trigrams, so a token within distance k of another
+    shares at least len(token) - 3k trigrams with it. The distance is capped so that at
+    least one trigram must be shared, which keeps every lookup on the index: short
+    tokens (up to 3 letters) must match exactly, up to 6 letters allow one edit.
+    """
+    if is_exact_token(token):
+        return 0
+    return max(0, min(max_distance, (len(token) - 1) // 3))
+
+def bounded_distance(a, b, limit):
+    """Return the Levenshtein distance of two strings, or limit + 1 once it exceeds limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    if a == b:
+        return 0
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+class TrigramIndex:
+    """
+    Candidate index for typo-tolerant matching of the distinct values of one field.
+
+    Values are split into normalized tokens, and each distinct token is posted under its
+    trigrams. A query token is compared only with tokens that share one of its rarest
+    trigrams (enough of them that any token within the allowed distance must share at
+    least one), so edit distances are computed for a handful of tokens rather than for
+    every row. Tokens with digits are only looked up exactly and are not posted under
+    trigrams. Row counts per value mirror the autocomplete PrefixIndex the index is
+    attached to.
+    """
+
+    def __init__(self, values, counts):
+        self.values = []
+        self.counts = []
+        self.ids = {}
+        self.token_values = defaultdict(list)
+        self.gram_tokens = defaultdict(set)
+        for value, count in zip(values, counts):
+            self.add(value, count)
+
+    def add(self, value, delta):
+        value_id = self.ids.get(value)
+        if value_id is None:
+            if delta <= 0:
+                return
+            value_id = self.ids[value] = len(self.values)
+            self.values.append(value)
+            self.counts.append(0)
+            for token in set(tokenize(value)):
+                if not self.token_values[token] and not is_exact_token(token):
+                    for gram in token_grams(token):
+                        self.gram_tokens[gram].add(token)
+                self.token_values[token].append(value_id)
+        self.counts[value_id] += delta
+        if self.counts[value_id] <= 0:
+            self.discard(value)
+
+    def discard(self, value):
+        value_id = self.ids.pop(value, None)
+        if value_id is None:
+            return
+        # The slot stays as a tombstone so the IDs held by other tokens remain valid
+        self.values[value_id] = None
+        self.counts[value_id] = 0
+        for token in set(tokenize(value)):
+            self.token_values[token].remove(value_id)
+            if not self.token_values[token]:
+                del self.token_values[token]
+                if not is_exact_token(token):
+                    for gram in token_grams(token):
+                        self.gram_tokens[gram].discard(token)
+
+    def match_token(self, token, max_distance):
+        """Return {token: distance} for the indexed tokens within the allowed distance of a query token."""
+        limit = allowed_distance(token, max_distance)
+        if limit == 0:
+            return {token: 0} if token in self.token_values else {}
+        grams = sorted(token_grams(token), key=lambda gram: len(self.gram_tokens.get(gram, ())))
+        # Any token within the limit shares one of the len(grams) - (len(grams) - 3 * limit) + 1 rarest grams
+        candidates = set().union(*(self.gram_tokens.get(gram, ()) for gram in grams[:3 * limit + 1]))
+        distances = {}
+        for candidate in candidates:
+            distance = bounded_distance(token, candidate, limit)
+            if distance <= limit:
+                distances[candidate] = distance
+        return distances
+
+    def search(self, query, max_distance=MAX_EDIT_DISTANCE):
+        """
+        Return the values matching every token of a query within the allowed distances.
+
+        Args:
+        query (str): The search text.
+        max_distance (int): The largest edit distance tolerated per token.
+
+        Returns:
+        dict: Value ID to the summed distance of its best matching tokens.
+        """
+        token_matches = [self.match_token(query_token, max_distance) for query_token in set(tokenize(query))]
+        if not token_matches:
+            return {}
+
+        def value_count(distances):
+            return sum(len(self.token_values[token]) for token in distances)
+
+        # The most selective query token goes first; the others then only check its values
+        token_matches.sort(key=value_count)
+        matches = {}
+        # Closer tokens are merged last so their distance wins for values holding several
+        for token, distance in sorted(token_matches[0].items(), key=lambda item: -item[1]):
+            matches.update(dict.fromkeys(self.token_values[token], distance))
+        for distances in token_matches[1:]:
+            narrowed = {}
+            for value_id, distance in matches.items():
+                best = min((distances[token] for token in tokenize(self.values[value_id]) if token in distances), default=None)
+                if best is not None:
+                    narrowed[value_id] = distance + best
+            matches = narrowed
+        return matches
+
+    def memory_bytes(self):
+        size = sum(sys.getsizeof(items) for items in (self.values, self.counts, self.ids, self.token_values, self.gram_tokens))
+        size += sum(sys.getsizeof(token) + sys.getsizeof(ids) for token, ids in self.token_values.items())
+        size += sum(sys.getsizeof(gram) + sys.getsizeof(tokens) for gram, tokens in self.gram_tokens.items())
+        return size
+
+def get_trigram_index(session, table_id, field):
+    """Return the trigram index of a field, attaching it to the table's autocomplete index on first use."""
+    index = get_table_completions(session, table_id)[field]
+    with index_lock:
+        if index.trigrams is None:
+            index.trigrams = TrigramIndex(index.values, index.counts)
+            logger.info(f"Built trigram index for {field} of table {table_id}: {len(index.trigrams.token_values)} tokens")
+            measure_table_completions(session, table_id)
+        return index.trigrams
+
+def precompute_fuzzy_indexes(table_id):
+    """
+    Build the autocomplete and trigram indexes of a newly uploaded table off the request
+    path; failures are only logged and the indexes are then built on demand.
+    """
+    session = get_session()
+    try:
+        for field in FUZZY_FIELDS:
+            get_trigram_index(session, table_id, field)
+    except Exception as e:
+        logger.error(f"Error building fuzzy search indexes for table {table_id}: {str(e)}")
+    finally:
+        session.close()
+
+def fuzzy_search_table(session, table_id, query, columns, max_distance=MAX_EDIT_DISTANCE, limit=FUZZY_RESULT_LIMIT):
+    """
+    Find the rows whose name or role matches a query despite typos, best matches first.
+
+    Every query token must match a token of the value within its allowed distance (see
+    allowed_distance). A row scores 1 minus the summed distance over the query length,
+    taking its best matching column. Only the rows of the best values are loaded; the
+    total comes from the row counts of all matching values.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+    query (str): The search text.
+    columns (list): The fields to match, a subset of FUZZY_FIELDS.
+    max_distance (int): The largest edit distance tolerated per token.
+    limit (int): The number of rows to return.
+
+    Returns:
+    tuple: The ranked result rows and the total number of matches. The total counts a
+    row once per matching column.
+    """
+    query_length = sum(len(token) for token in tokenize(query)) or 1
+    ranked_values = {}
+    total = 0
+    for column in columns:
+        trigrams = get_trigram_index(session, table_id, column)
+        selected = {}
+        with index_lock:
+            matches = trigrams.search(query, max_distance)
+            total += sum(map(trigrams.counts.__getitem__, matches))
+
+            # Take the closest values, most frequent first, until they cover the limit
+            by_distance = defaultdict(list)
+            for value_id, distance in matches.items():
+                by_distance[distance].append(value_id)
+            covered = 0
+            for distance in sorted(by_distance):
+                for value_id in heapq.nlargest(limit, by_distance[distance], key=trigrams.counts.__getitem__):
+                    if covered >= limit:
+                        break
+                    selected[trigrams.values[value_id]] = distance
+                    covered += trigrams.counts[value_id]
+        ranked_values[column] = selected
+
+    snapshot = snapshot_select(session, table_id).subquery()
+    conditions = [snapshot.c[column].in_(list(values)) for column, values in ranked_values.items() if values]
+    if not conditions:
+        return [], 0
+    results = []
+    for entry in session.execute(select(snapshot).where(or_(*conditions))):
+        distance, matched_columns, matched_terms = None, [], []
+        for column in columns:
+            value = getattr(entry, column)
+            column_distance = ranked_values[column].get(value)
+            if column_distance is None:
+                continue
+            matched_columns.append(column)
+            matched_terms.append(value)
+            distance = column_distance if distance is None else min(distance, column_distance)
+        results.append({
+            'person_id': entry.person_id,
+            'name': entry.name,
+            'role': entry.role,
+            'department': entry.department,
+            'rank': entry.rank,
+            'organization_id': entry.organization_id,
+            'matched_terms': matched_terms,
+            'hierarchical_structure': entry.hierarchical_structure,
+            'matched_columns': matched_columns,
+            'score': round(max(0.0, 1 - distance / query_length), 3)
+        })
+
+    results.sort(key=lambda result: (-result['score'], result['hierarchical_structure']))
+    return results[:limit], total
@@ -1,9 +1,15 @@
-from sqlalchemy.orm import relationship, sessionmaker, scoped_session
+from sqlalchemy.orm import relationship, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, create_engine, inspect, func, UniqueConstraint
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Date, DateTime, Text, create_engine, inspect, func, UniqueConstraint, Index, event
+from sqlalchemy.engine import Engine
+from replicas import Replica
+from contextvars import ContextVar
 import glob
 import os
 import logging
+import sqlite3
+import threading
+import unicodedata
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -17,6 +23,10 @@ class Folder(Base):
     name = Column(String, nullable=False)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    # 'full' stores every snapshot completely, 'delta' stores snapshots as diffs against their predecessor
+    storage_mode = Column(String, nullable=False, default='full', server_default='full')
+    # Set while the folder is being deleted (see deletions.delete_tables); it is hidden meanwhile
+    deleting = Column(Boolean, nullable=False, default=False, server_default='0')
     tables = relationship('Table', back_populates='folder')
 
 class Table(Base):
@@ -25,6 +35,14 @@ class Table(Base):
     name = Column(String, nullable=False)
     folder_id = Column(Integer, ForeignKey('folders.id'), nullable=False)
     upload_date = Column(Date, nullable=False)
+    # Delta-stored tables keep their rows in delta_entries as changes against base_table_id
+    storage_mode = Column(String, nullable=False, default='full', server_default='full')
+    base_table_id = Column(Integer, ForeignKey('tables.id'), nullable=True)
+    # Clones are what-if copies of clone_of_id; they stay out of the folder's series of snapshots.
+    # No foreign key, so a clone stays marked when its source is deleted
+    clone_of_id = Column(Integer, nullable=True)
+    # Set while the table is being deleted; readers treat it as gone, its rows stay for dependents
+    deleting = Column(Boolean, nullable=False, default=False, server_default='0')
     folder = relationship('Folder', back_populates='tables')
     data_entries = relationship('DataEntry', back_populates='table')
 
@@ -48,7 +66,12 @@ class DataEntry(Base):
     
     table = relationship('Table', back_populates='data_entries')
 
-    __table_args__ = (UniqueConstraint('table_id', 'hierarchical_structure', name='_table_hierarchical_uc'),)
+    __table_args__ = (
+        UniqueConstraint('table_id', 'hierarchical_structure', name='_table_hierarchical_uc'),
+        Index('ix_data_entries_table_person', 'table_id', 'person_id'),
+        # Lets the search index bound its candidates to the id range of one table
+        Index('ix_data_entries_table_id', 'table_id', 'id'),
+    )
 
     @property
     def age(self):
@@ -56,22 +79,199 @@ class DataEntry(Base):
             return (self.upload_date - self.birth_date).days // 365
         return None
 
-# Global variables for engine, session, and db_path
+class DeltaEntry(Base):
+    __tablename__ = 'delta_entries'
+    id = Column(Integer, primary_key=True)
+    table_id = Column(Integer, ForeignKey('tables.id'), nullable=False, index=True)
+    # 'upsert' rows replace the base row at the same hierarchical_structure, 'delete' rows remove it
+    operation = Column(String, nullable=False)
+    hierarchical_structure = Column(String, nullable=False)
+    upload_date = Column(Date)
+
+    person_id = Column(String, nullable=True)
+    name = Column(String)
+    birth_date = Column(Date)
+
+    role = Column(String)
+    department = Column(String)
+    rank = Column(String)
+    organization_id = Column(String)
+
+    __table_args__ = (UniqueConstraint('table_id', 'hierarchical_structure', name='_delta_table_hierarchical_uc'),)
+
+class ComparisonReport(Base):
+    __tablename__ = 'comparison_reports'
+    id = Column(Integer, primary_key=True)
+    table1_id = Column(Integer, ForeignKey('tables.id'), nullable=False)
+    table2_id = Column(Integer, ForeignKey('tables.id'), nullable=False, index=True)
+    # The full /compare_tables response, serialized as JSON
+    report = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (UniqueConstraint('table1_id', 'table2_id', name='_comparison_pair_uc'),)
+
+class TimeSeriesPoint(Base):
+    __tablename__ = 'timeseries_points'
+    id = Column(Integer, primary_key=True)
+    table_id = Column(Integer, ForeignKey('tables.id'), nullable=False)
+    # The snapshot the metrics were computed against; a point is stale once the predecessor changes
+    previous_table_id = Column(Integer, ForeignKey('tables.id'), index=True)
+    # Headcount, department sizes, joins, departures and promotions, serialized as JSON
+    metrics = Column(Text, nullable=False)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (UniqueConstraint('table_id', name='_timeseries_table_uc'),)
+
+class ChangeLogEntry(Base):
+    __tablename__ = 'change_log'
+    # The version of the change; AUTOINCREMENT keeps versions growing even after rows are deleted
+    id = Column(Integer, primary_key=True)
+    table_id = Column(Integer, ForeignKey('tables.id'), nullable=False)
+    # The changed node, or None when the whole table was (re)written
+    hierarchical_structure = Column(String)
+    # Comma separated names of the changed fields, or None when the whole node changed
+    changed_fields = Column(String)
+    created_at = Column(DateTime, server_default=func.now())
+
+    __table_args__ = (
+        Index('ix_change_log_table_version', 'table_id', 'id'),
+        {'sqlite_autoincrement': True}
+    )
+
+# Columns added after the original schema. init_db adds them in place to databases created before them.
+ADDED_COLUMNS = {
+    'folders': {
+        'storage_mode': "VARCHAR NOT NULL DEFAULT 'full'",
+        'deleting': "BOOLEAN NOT NULL DEFAULT 0"
+    },
+    'tables': {
+        'storage_mode': "VARCHAR NOT NULL DEFAULT 'full'",
+        'base_table_id': "INTEGER REFERENCES tables (id)",
+        'clone_of_id': "INTEGER",
+        'deleting': "BOOLEAN NOT NULL DEFAULT 0"
+    },
+    'change_log': {
+        'changed_fields': "VARCHAR"
+    }
+}
+
+# Columns of data_entries covered by the full-text search index, with their index column names
+# ('rank' is reserved by FTS5)
+SEARCH_INDEX_TABLE = 'data_entries_fts'
+# The folded values of indexed rows that have non-ASCII values, so rows can leave the index without search_normalize
+SEARCH_FOLDED_TABLE = 'data_entries_folded'
+# Updated rows waiting to be indexed again (see search_index.index_updated_entries)
+SEARCH_UNINDEXED_TABLE = 'data_entries_unindexed'
+SEARCH_INDEX_COLUMNS = {
+    'hierarchical_structure': 'hierarchical_structure',
+    'upload_date': 'upload_date',
+    'person_id': 'person_id',
+    'name': 'name',
+    'birth_date': 'birth_date',
+    'role': 'role',
+    'department': 'department',
+    'rank': 'rank_text',
+    'organization_id': 'organization_id'
+}
+
+def normalize_search_text(value):
+    """
+    Fold text for the search index: decompose it, drop combining marks (Hebrew niqqud,
+    Arabic harakat, Latin accents) and bidirectional control characters, and casefold.
+
+    Every character maps independently, so a substring of a value stays a substring after
+    folding and the index remains a superset of LIKE matches.
+    """
+    if not isinstance(value, str):
+        return value
+    if value.isascii():
+        return value.lower()
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ''.join(c for c in decomposed if unicodedata.category(c) not in ('Mn', 'Cf')).casefold()
+
+@event.listens_for(Engine, "connect")
+def register_search_functions(dbapi_connection, connection_record):
+    # Indexing rows calls search_normalize (see search_index_insert_statements); the triggers
+    # do not, so other SQLite clients can still update and delete rows
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.create_function('search_normalize', 1, normalize_search_text, deterministic=True)
+
+# Seconds a writer waits for the write lock of another connection before failing
+BUSY_TIMEOUT_SECONDS = 30
+# Options of the databases opened from now on; the serving mode sizes the pool to its
+# workers, and replica=True serves reads from an in-memory copy (see replicas.Replica)
+database_options = {'pool_size': 5, 'echo': True, 'replica': False}
+
+class Database:
+    """
+    The engine and session factory of one database file, shared by all threads.
+
+    Connections use write-ahead logging, so any number of them read while one writes,
+    and a writer waits up to BUSY_TIMEOUT_SECONDS for the write lock held by another
+    instead of failing, which serializes writers.
+    """
+
+    def __init__(self, path, pool_size=5, echo=True, replica=False):
+        self.path = path
+        self.engine = create_engine(f'sqlite:///{path}', echo=echo, pool_size=pool_size, max_overflow=pool_size,
+                                    connect_args={'timeout': BUSY_TIMEOUT_SECONDS})
+        event.listen(self.engine, "connect", configure_connection)
+        self.Session = sessionmaker(bind=self.engine)
+        self.replica = Replica(self.engine) if replica else None
+        self.initialized = False
+
+    def close(self):
+        if self.replica:
+            self.replica.close()
+        self.engine.dispose()
+
+def configure_connection(dbapi_connection, connection_record):
+    dbapi_connection.execute("PRAGMA journal_mode = WAL")
+    dbapi_connection.execute("PRAGMA synchronous = NORMAL")
+
+# Open databases by path, and the one selected for new requests
+databases = {}
+databases_lock = threading.Lock()
+current_database = None
+# The database of the request being handled, so selecting another one does not affect it
+request_database = ContextVar('request_database', default=None)
+# Whether the request only reads, so its sessions may read from the database's replica
+request_read_only = ContextVar('request_read_only', default=False)
+
+# The selected database, for callers that predate Database
 engine = None
 Session = None
 db_path = None
 
+def open_database(path):
+    """Return the Database of a file, opening it on first use."""
+    path = os.path.abspath(path)
+    with databases_lock:
+        database = databases.get(path)
+        if database is None:
+            logger.info(f"Opening database: {path}")
+            database = databases[path] = Database(path, **database_options)
+        return database
+
+def select_database(database):
+    global current_database, engine, Session, db_path
+    current_database = database
+    engine, Session, db_path = (database.engine, database.Session, database.path) if database else (None, None, None)
+
 def set_db_path(path):
-    global db_path, engine, Session
+    """
+    Select the database of new requests, and of the rest of the current one.
+
+    Requests already running keep the database they started with, so its engine is not
+    disposed; dispose_db closes it explicitly.
+    """
     logger.info(f"Setting new database path: {path}")
-    db_path = path
-    dispose_db()
-    engine = create_engine(f'sqlite:///{path}', echo=True)
-    Session = scoped_session(sessionmaker(bind=engine))
-    logger.info("New database engine and session created")
+    database = open_database(path)
+    select_database(database)
+    if request_database.get() is not None:
+        request_database.set(database)
 
 def get_db_path():
-    global db_path
     if db_path:
         logger.info(f"Using existing database path: {db_path}")
         return db_path
@@ -82,48 +282,211 @@ def get_db_path():
     logger.warning("No database file found")
     return None
 
-def get_engine():
-    global engine
-    if engine is None:
+def get_database():
+    """
+    Return the database of the current request, or else the selected one.
+
+    Returns:
+    Database: The database, or None when none is selected and no database file is found.
+    """
+    database = request_database.get() or current_database
+    if database is None:
         path = get_db_path()
         if path:
-            logger.info(f"Creating new engine for database: {path}")
-            engine = create_engine(f'sqlite:///{path}', echo=True)
+            set_db_path(path)
+            database = current_database
         else:
             logger.error("No database path available to create engine")
-    return engine
+    return database
+
+def bind_request_database(read_only=False):
+    """
+    Pin the selected database for the request starting in this context.
+
+    Args:
+    read_only (bool): Whether the request only reads, so its sessions may use the replica.
+
+    Returns:
+    tuple: The tokens that release_request_database takes when the request ends.
+    """
+    return request_database.set(current_database), request_read_only.set(read_only)
+
+def release_request_database(tokens):
+    database_token, read_only_token = tokens
+    request_read_only.reset(read_only_token)
+    request_database.reset(database_token)
+
+def get_engine():
+    database = get_database()
+    return database.engine if database else None
 
 def get_session():
-    global Session
-    if Session is None:
-        engine = get_engine()
-        if engine:
-            logger.info("Creating new session")
-            Session = scoped_session(sessionmaker(bind=engine))
-        else:
-            logger.error("No engine available to create session")
-    return Session() if Session else None
-
-def dispose_db():
-    global engine, Session
-    if Session:
-        logger.info("Removing existing session")
-        Session.remove()
-    if engine:
-        logger.info("Disposing existing engine")
-        engine.dispose()
-    engine = None
-    Session = None
+    """
+    Open a session on the database of the current request.
+
+    Read-only requests read from the replica when the database has one and it is
+    current; their writes still go to the disk.
+    """
+    database = get_database()
+    if database is None:
+        logger.error("No engine available to create session")
+        return None
+    if database.replica and request_read_only.get():
+        session = database.replica.read_session()
+        if session is not None:
+            return session
+    return database.Session()
+
+def begin_write_transaction(session):
+    """
+    Take the database write lock for the rest of a session's transaction.
+
+    sqlite3 only begins a transaction at the first write, so reads made to decide what
+    to write (such as the next free hierarchical slot) could otherwise be outdated by a
+    concurrent writer by the time the write happens. BEGIN IMMEDIATE makes a second
+    writer wait for the first one to commit, then read its rows.
+
+    Args:
+    session (Session): The database session about to read and then write.
+    """
+    connection = session.connection().connection.driver_connection
+    if isinstance(connection, sqlite3.Connection) and not connection.in_transaction:
+        connection.execute("BEGIN IMMEDIATE")
+
+def dispose_db(path=None):
+    """
+    Close the connections of a database, or of all databases, and forget them.
+
+    Args:
+    path (str): The path of the database to close, or None for all of them.
+    """
+    with databases_lock:
+        paths = [os.path.abspath(path)] if path else list(databases)
+        for database_path in paths:
+            database = databases.pop(database_path, None)
+            if database:
+                logger.info(f"Disposing engine of {database_path}")
+                database.close()
+    if current_database and current_database.path in paths:
+        select_database(None)
     logger.info("Database connections disposed")
 
 def init_db():
-    engine = get_engine()
-    if engine:
+    database = get_database()
+    if database is None:
+        logger.error("Failed to initialize database: No engine available")
+        return
+    with databases_lock:
+        if database.initialized:
+            return
         logger.info("Initializing database schema")
-        Base.metadata.create_all(engine)
+        with database.engine.connect() as connection:
+            # Only takes effect on a new database; it lets deletions give space back in steps
+            connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        Base.metadata.create_all(database.engine)
+        upgrade_db_schema(database.engine)
+        database.initialized = True
         logger.info("Database schema initialized successfully")
-    else:
-        logger.error("Failed to initialize database: No engine available")
+
+def upgrade_db_schema(engine):
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table_name, columns in ADDED_COLUMNS.items():
+            if table_name not in existing_tables:
+                continue
+            actual_columns = set(column['name'] for column in inspector.get_columns(table_name))
+            for column_name, column_ddl in columns.items():
+                if column_name not in actual_columns:
+                    logger.info(f"Adding missing column {column_name} to {table_name}")
+                    connection.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}")
+
+        # create_all skips indexes of tables that already exist
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+        create_search_index(connection)
+        analyze_data_entries(connection)
+
+def analyze_data_entries(connection):
+    """
+    Refresh the planner statistics of data_entries from a bounded sample.
+
+    Without statistics SQLite assumes a table_id matches about ten rows, and walks a
+    whole table in index order instead of looking up a few search candidates by id.
+    The sample keeps this to a few milliseconds on any database size.
+    """
+    connection.exec_driver_sql("PRAGMA analysis_limit=400")
+    connection.exec_driver_sql("ANALYZE data_entries")
+
+def create_search_index(connection):
+    """
+    Create the FTS5 index over data_entries if it does not exist yet.
+
+    The trigram tokenizer indexes every substring of three or more characters, so the
+    index can answer the same substring searches as LIKE. Values are indexed through
+    search_normalize, and queries are folded the same way. The index stores no content
+    of its own; the folded values of rows with non-ASCII values are kept in
+    SEARCH_FOLDED_TABLE, so a row can be removed from the index without folding again.
+
+    Inserted rows are indexed in bulk by the code that inserts them (see
+    search_index_insert_statements), which is several times faster than a per-row trigger.
+    Triggers remove updated and deleted rows from the index and queue updated rows in
+    SEARCH_UNINDEXED_TABLE, where searches still consider them until
+    search_index.index_updated_entries indexes them again. The triggers only use plain
+    SQL, so the sqlite3 shell, backups and scripts can update and delete rows without the
+    search_normalize function of this app's connections. Rows they insert are not indexed.
+
+    Existing rows are indexed here, and indexes built with other triggers are rebuilt.
+    """
+    trigger = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (f'{SEARCH_INDEX_TABLE}_au',)
+    ).first()
+    if trigger is not None and SEARCH_UNINDEXED_TABLE in trigger.sql:
+        return
+
+    logger.info(f"Creating search index {SEARCH_INDEX_TABLE}")
+    for suffix in ('ad', 'au'):
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {SEARCH_INDEX_TABLE}_{suffix}")
+    for table_name in (SEARCH_INDEX_TABLE, SEARCH_FOLDED_TABLE, SEARCH_UNINDEXED_TABLE):
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {table_name}")
+
+    index_columns = ', '.join(SEARCH_INDEX_COLUMNS.values())
+    # A folded value is NULL where the value is plain ASCII and was indexed as it is
+    old_values = ', '.join(f"coalesce(folded.{index_column}, old.{column})" for column, index_column in SEARCH_INDEX_COLUMNS.items())
+    delete_old = (f"INSERT INTO {SEARCH_INDEX_TABLE} ({SEARCH_INDEX_TABLE}, rowid, {index_columns}) "
+                  f"SELECT 'delete', old.id, {old_values} FROM (SELECT 1) "
+                  f"LEFT JOIN {SEARCH_FOLDED_TABLE} AS folded ON folded.id = old.id "
+                  f"WHERE old.id NOT IN (SELECT id FROM {SEARCH_UNINDEXED_TABLE}); "
+                  f"DELETE FROM {SEARCH_FOLDED_TABLE} WHERE id = old.id;")
+    forget_old = f"DELETE FROM {SEARCH_UNINDEXED_TABLE} WHERE id = old.id;"
+    queue_new = f"INSERT OR IGNORE INTO {SEARCH_UNINDEXED_TABLE} (id) VALUES (new.id);"
+
+    connection.exec_driver_sql(f"CREATE VIRTUAL TABLE {SEARCH_INDEX_TABLE} USING fts5({index_columns}, content='', tokenize='trigram')")
+    connection.exec_driver_sql(f"CREATE TABLE {SEARCH_FOLDED_TABLE} (id INTEGER PRIMARY KEY, {index_columns})")
+    connection.exec_driver_sql(f"CREATE TABLE {SEARCH_UNINDEXED_TABLE} (id INTEGER PRIMARY KEY)")
+    connection.exec_driver_sql(f"CREATE TRIGGER {SEARCH_INDEX_TABLE}_ad AFTER DELETE ON data_entries BEGIN {delete_old} {forget_old} END")
+    connection.exec_driver_sql(f"CREATE TRIGGER {SEARCH_INDEX_TABLE}_au AFTER UPDATE ON data_entries BEGIN {delete_old} {queue_new} END")
+    for statement in search_index_insert_statements('1'):
+        connection.exec_driver_sql(statement)
+
+def search_index_insert_statements(condition):
+    """Return the statements that add the data_entries rows matching a SQL condition to the search index."""
+    index_columns = ', '.join(SEARCH_INDEX_COLUMNS.values())
+    # The tokenizer already folds ASCII case, so only values with other characters need search_normalize
+    non_ascii = {column: f"{column} GLOB '*[^ -~]*'" for column in SEARCH_INDEX_COLUMNS}
+    folded_values = ', '.join(f"CASE WHEN {non_ascii[column]} THEN search_normalize({column}) END" for column in SEARCH_INDEX_COLUMNS)
+    entry_values = ', '.join(
+        f"CASE WHEN {non_ascii[column]} THEN (SELECT {index_column} FROM {SEARCH_FOLDED_TABLE} WHERE id = data_entries.id) "
+        f"ELSE {column} END"
+        for column, index_column in SEARCH_INDEX_COLUMNS.items()
+    )
+    return (
+        f"INSERT OR REPLACE INTO {SEARCH_FOLDED_TABLE} (id, {index_columns}) "
+        f"SELECT id, {folded_values} FROM data_entries WHERE ({condition}) AND ({' OR '.join(non_ascii.values())})",
+        f"INSERT INTO {SEARCH_INDEX_TABLE} (rowid, {index_columns}) SELECT id, {entry_values} FROM data_entries WHERE {condition}"
+    )
 
 def create_new_db(path):
     logger.info(f"Creating new database at: {path}")
@@ -152,7 +515,8 @@ def check_db_schema(db_path):
         }
 
         for table_name, model in table_models.items():
-            expected_columns = set(column.key for column in model.__table__.columns)
+            # Columns added later are created by init_db, so older databases remain valid
+            expected_columns = set(column.key for column in model.__table__.columns) - set(ADDED_COLUMNS.get(table_name, {}))
             actual_columns = set(column['name'] for column in inspector.get_columns(table_name))
             
             if not expected_columns.issubset(actual_columns):
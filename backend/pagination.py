@@ -0,0 +1,71 @@
+from sqlalchemy import select, func
+import base64
+import binascii
+import json
+
+TOTAL_MODES = ('exact', 'approximate', 'none')
+MAX_PAGE_SIZE = 1000
+# Approximate totals stop counting here, so a page of a broad search costs the same as a narrow one
+APPROXIMATE_TOTAL_CAP = 1000
+
+def encode_cursor(after):
+    return base64.urlsafe_b64encode(json.dumps({"after": after}).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return the sort key a cursor points after; raise ValueError for a malformed cursor."""
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))["after"]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def keyset_page(query, sort_column, after=None, limit=None):
+    """
+    Order a query by a unique column and restrict it to one page after a sort key.
+
+    One row more than the page size is selected, so split_page can tell whether a next
+    page exists without counting.
+
+    Args:
+    query (Query): The filtered query.
+    sort_column (Column): A column that is unique within the results.
+    after (str): The sort key of the last row of the previous page, or None for the first page.
+    limit (int): The page size, or None for all rows.
+
+    Returns:
+    Query: The ordered, and possibly limited, query.
+    """
+    query = query.order_by(sort_column)
+    if after is not None:
+        query = query.filter(sort_column > after)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    return query
+
+def split_page(results, limit, sort_key):
+    """Return the page and the cursor of the next page (None on the last page)."""
+    if limit is None or len(results) <= limit:
+        return results, None
+    page = results[:limit]
+    return page, encode_cursor(sort_key(page[-1]))
+
+def count_results(session, query, mode):
+    """
+    Count the rows of a filtered query.
+
+    Args:
+    session (Session): The database session.
+    query (Query): The filtered query, without ordering or limits.
+    mode (str): 'exact', 'approximate' (count at most APPROXIMATE_TOTAL_CAP + 1 rows) or 'none'.
+
+    Returns:
+    tuple: The total (None for 'none') and whether it is exact.
+    """
+    if mode == 'none':
+        return None, False
+    statement = query.statement
+    if mode == 'approximate':
+        statement = statement.limit(APPROXIMATE_TOTAL_CAP + 1)
+    total = session.execute(select(func.count()).select_from(statement.subquery())).scalar()
+    if mode == 'approximate' and total > APPROXIMATE_TOTAL_CAP:
+        return APPROXIMATE_TOTAL_CAP, False
+    return total, True
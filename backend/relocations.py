@@ -0,0 +1,330 @@
+from models import DataEntry, begin_write_transaction
+from snapshots import ensure_full_storage_tables
+from report_cache import invalidate_tables_reports
+from timeseries import invalidate_tables_points
+from search_index import index_entries, index_updated_entries
+from change_log import record_node_changes, record_changes_from
+from autocomplete import COMPLETION_FIELDS, completion_values, update_table_completions
+from utils import child_suffixes, next_child_structure
+from sqlalchemy import select, update, insert, bindparam, func, or_, and_, String
+import logging
+
+logger = logging.getLogger(__name__)
+
+UPDATE_TYPES = ('create_new', 'override', 'move_subtree')
+# The fields a relocated person leaves behind at their old position
+NULL_NODE = {
+    "name": "nan",
+    "department": "nan",
+    "birth_date": None,
+    "rank": "nan",
+    "organization_id": "nan",
+    "person_id": "nan"
+}
+
+def first_entries(session, table_ids, structures):
+    """Return {(table_id, structure): entry} for the first row of each structure in each table, with one query."""
+    entries = {}
+    rows = session.query(DataEntry).filter(
+        DataEntry.table_id.in_(table_ids),
+        DataEntry.hierarchical_structure.in_(structures)
+    ).order_by(DataEntry.id)
+    for entry in rows:
+        entries.setdefault((entry.table_id, entry.hierarchical_structure), entry)
+    return entries
+
+def subtree_condition(column, root):
+    """
+    Match a node and all its descendants.
+
+    Descendants are the structures in [root + '/', root + '0'), since '0' follows '/', so
+    the condition is a range over the (table_id, hierarchical_structure) unique index,
+    unlike a LIKE pattern.
+    """
+    return or_(column == root, and_(column >= root + '/', column < root + '0'))
+
+def is_in_subtree(structure, root):
+    return structure == root or structure.startswith(root + '/')
+
+def plan_relocation(table_id, hierarchical_structure, current_entry, target_entry, update_type,
+                    target_hierarchical_structure, new_role=None, suffixes=()):
+    """
+    Compute the changes of a relocation in one table from prefetched entries.
+
+    Args:
+    table_id (int): The ID of the table.
+    hierarchical_structure (str): The structure of the node being moved.
+    current_entry (DataEntry): The node being moved, or None if the table lacks it.
+    target_entry (DataEntry): The new parent (create_new) or the node to override, or None.
+    update_type (str): 'create_new' or 'override'.
+    target_hierarchical_structure (str): The structure of the target node.
+    new_role (str): The role of the new node, for create_new.
+    suffixes (list): The last parts of the structures of the new parent's children, for create_new.
+
+    Returns:
+    dict: The new_node or update_node values and the null_node values, or an error dictionary.
+    """
+    if current_entry is None:
+        return {"error": f"Node with hierarchical structure {hierarchical_structure} not found in table {table_id}"}
+
+    changes = {}
+    if update_type == 'create_new':
+        if target_entry is None:
+            return {"error": f"New parent node with hierarchical structure {target_hierarchical_structure} not found"}
+        changes['new_node'] = {
+            "table_id": table_id,
+            "person_id": current_entry.person_id,
+            "upload_date": current_entry.upload_date,
+            "hierarchical_structure": next_child_structure(target_entry.hierarchical_structure, suffixes),
+            "name": current_entry.name,
+            "role": new_role,
+            "department": target_entry.department,
+            "birth_date": current_entry.birth_date,
+            "rank": current_entry.rank,
+            "organization_id": current_entry.organization_id
+        }
+    else:
+        if target_entry is None:
+            return {"error": f"Node to override with hierarchical structure {target_hierarchical_structure} not found in table {table_id}"}
+        changes['update_node'] = {
+            "person_id": current_entry.person_id,
+            "upload_date": current_entry.upload_date,
+            "hierarchical_structure": target_entry.hierarchical_structure,
+            "name": current_entry.name,
+            "role": target_entry.role,
+            "department": target_entry.department,
+            "birth_date": current_entry.birth_date,
+            "rank": current_entry.rank,
+            "organization_id": current_entry.organization_id
+        }
+    changes['null_node'] = dict(NULL_NODE)
+    return changes
+
+def relocate_across_tables(session, table_ids, hierarchical_structure, update_type, target_hierarchical_structure, new_role=None):
+    """
+    Move a node in many tables at once, with all-or-nothing semantics.
+
+    The moves are planned for every table before anything is written: delta tables are
+    materialized with one lookup, and the moved nodes, targets and (for create_new) the
+    new parent's children are prefetched with one query each. If any table cannot be
+    relocated, nothing is written. Otherwise the new nodes are inserted, the overridden
+    and vacated nodes updated with one statement each, cached reports and time series
+    points dropped, and everything committed in a single transaction.
+
+    Args:
+    session (Session): The database session.
+    table_ids (list): The IDs of the tables to update.
+    hierarchical_structure (str): The structure of the node being moved.
+    update_type (str): 'create_new' or 'override'.
+    target_hierarchical_structure (str): The new parent (create_new) or the node to override.
+    new_role (str): The role of the new node, for create_new.
+
+    Returns:
+    tuple: For each table ID, the applied changes or an error dictionary, and None if every
+    table was updated or else the error that stopped the relocation.
+    """
+    table_ids = list(dict.fromkeys(table_ids))
+    if update_type == 'create_new' and not new_role:
+        error = "New role must be provided for create_new operation"
+        return {table_id: {"error": error} for table_id in table_ids}, error
+
+    try:
+        # New slots are only free until another writer takes them
+        begin_write_transaction(session)
+        ensure_full_storage_tables(session, table_ids)
+        entries = first_entries(session, table_ids, [hierarchical_structure, target_hierarchical_structure])
+        suffixes = child_suffixes(session, table_ids, target_hierarchical_structure) if update_type == 'create_new' else {}
+
+        plans = {
+            table_id: plan_relocation(
+                table_id, hierarchical_structure,
+                entries.get((table_id, hierarchical_structure)),
+                entries.get((table_id, target_hierarchical_structure)),
+                update_type, target_hierarchical_structure, new_role, suffixes.get(table_id, [])
+            )
+            for table_id in table_ids
+        }
+        failed = [table_id for table_id, changes in plans.items() if 'error' in changes]
+        if failed:
+            session.rollback()
+            error = f"Hierarchical location was not updated in any table: {plans[failed[0]]['error']}"
+            logger.warning(error)
+            return {
+                table_id: plans[table_id] if table_id in failed
+                else {"error": "Not updated because the relocation failed in another table"}
+                for table_id in table_ids
+            }, error
+
+        # (table ID, completion fields before, completion fields after) of every touched row
+        edited_values = []
+        if update_type == 'create_new':
+            new_nodes = [plans[table_id]['new_node'] for table_id in table_ids]
+            new_ids = session.execute(insert(DataEntry).returning(DataEntry.id), new_nodes).scalars().all()
+            index_entries(session, new_ids)
+            edited_values += [(node['table_id'], None, {field: node.get(field) for field in COMPLETION_FIELDS})
+                              for node in new_nodes]
+        else:
+            target_updates = []
+            for table_id in table_ids:
+                target_entry = entries[(table_id, target_hierarchical_structure)]
+                previous_values = completion_values(target_entry)
+                target_updates.append({"id": target_entry.id, **plans[table_id]['update_node']})
+                edited_values.append((table_id, previous_values, {**previous_values, **{
+                    field: value for field, value in plans[table_id]['update_node'].items() if field in COMPLETION_FIELDS
+                }}))
+            session.execute(update(DataEntry), target_updates)
+
+        moved_entries = [entries[(table_id, hierarchical_structure)] for table_id in table_ids]
+        for entry in moved_entries:
+            previous_values = completion_values(entry)
+            edited_values.append((entry.table_id, previous_values, {**previous_values, **{
+                field: value for field, value in NULL_NODE.items() if field in COMPLETION_FIELDS
+            }}))
+        session.execute(
+            update(DataEntry).where(DataEntry.id.in_([entry.id for entry in moved_entries])).values(**NULL_NODE)
+            .execution_options(synchronize_session=False)
+        )
+        index_updated_entries(session)
+
+        # The moved node is blanked in place, a created node is new and an overridden one takes the moved data
+        record_node_changes(session, [(table_id, hierarchical_structure) for table_id in table_ids], list(NULL_NODE))
+        if update_type == 'create_new':
+            record_node_changes(session, [
+                (table_id, plans[table_id]['new_node']['hierarchical_structure']) for table_id in table_ids
+            ])
+        else:
+            for table_id in table_ids:
+                update_node = plans[table_id]['update_node']
+                record_node_changes(session, [(table_id, update_node['hierarchical_structure'])],
+                                    [field for field in update_node if field != 'hierarchical_structure'])
+        invalidate_tables_reports(session, table_ids)
+        invalidate_tables_points(session, table_ids)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        error = f"An error occurred while updating the hierarchical location: {str(e)}"
+        logger.error(error)
+        return {table_id: {"error": error} for table_id in table_ids}, error
+
+    for table_id, previous_values, new_values in edited_values:
+        update_table_completions(session, table_id, previous_values, new_values)
+    logger.info(f"Relocated {hierarchical_structure} to {target_hierarchical_structure} ({update_type}) in {len(table_ids)} tables")
+    return {
+        table_id: {"message": "Hierarchical location updated successfully", "changes": plans[table_id]}
+        for table_id in table_ids
+    }, None
+
+def move_subtree_across_tables(session, table_ids, hierarchical_structure, new_parent_structure):
+    """
+    Move a node with all its descendants under a new parent in many tables, all or nothing.
+
+    The node gets the next free slot among the new parent's children, and the whole
+    subtree is moved by rewriting the prefix of its structures with one UPDATE per table
+    (run as a single executemany), so people keep their data and their positions
+    relative to each other. The new structures are checked against the unique
+    (table_id, hierarchical_structure) constraint before anything is written.
+
+    Args:
+    session (Session): The database session.
+    table_ids (list): The IDs of the tables to update.
+    hierarchical_structure (str): The structure of the root of the subtree.
+    new_parent_structure (str): The structure of the new parent.
+
+    Returns:
+    tuple: For each table ID, the old and new root structures and the number of moved
+    rows, or an error dictionary, and None if every table was updated or else the error
+    that stopped the move.
+    """
+    table_ids = list(dict.fromkeys(table_ids))
+    if is_in_subtree(new_parent_structure, hierarchical_structure):
+        error = "A node cannot be moved under itself or one of its descendants"
+        return {table_id: {"error": error} for table_id in table_ids}, error
+
+    try:
+        begin_write_transaction(session)
+        ensure_full_storage_tables(session, table_ids)
+        entries = first_entries(session, table_ids, [hierarchical_structure, new_parent_structure])
+        suffixes = child_suffixes(session, table_ids, new_parent_structure)
+
+        plans = {}
+        for table_id in table_ids:
+            if (table_id, hierarchical_structure) not in entries:
+                plans[table_id] = {"error": f"Node with hierarchical structure {hierarchical_structure} not found in table {table_id}"}
+            elif (table_id, new_parent_structure) not in entries:
+                plans[table_id] = {"error": f"New parent node with hierarchical structure {new_parent_structure} not found"}
+            else:
+                plans[table_id] = {"new_root": next_child_structure(new_parent_structure, suffixes.get(table_id, []))}
+
+        # A new root is a fresh slot, but rows left below it (or a letter scheme wrapping
+        # around) would still collide with the moved structures
+        planned = [table_id for table_id in table_ids if 'error' not in plans[table_id]]
+        if planned:
+            conflicts = session.execute(
+                select(DataEntry.table_id, func.min(DataEntry.hierarchical_structure))
+                .where(or_(*(
+                    and_(DataEntry.table_id == table_id, subtree_condition(DataEntry.hierarchical_structure, plans[table_id]['new_root']))
+                    for table_id in planned
+                )))
+                .group_by(DataEntry.table_id)
+            ).all()
+            for table_id, structure in conflicts:
+                plans[table_id] = {"error": f"Hierarchical structure {structure} already exists in table {table_id}"}
+
+        failed = [table_id for table_id in table_ids if 'error' in plans[table_id]]
+        if failed:
+            session.rollback()
+            error = f"Subtree was not moved in any table: {plans[failed[0]]['error']}"
+            logger.warning(error)
+            return {
+                table_id: plans[table_id] if table_id in failed
+                else {"error": "Not updated because the move failed in another table"}
+                for table_id in table_ids
+            }, error
+
+        moved_counts = dict(session.execute(
+            select(DataEntry.table_id, func.count())
+            .where(DataEntry.table_id.in_(table_ids), subtree_condition(DataEntry.hierarchical_structure, hierarchical_structure))
+            .group_by(DataEntry.table_id)
+        ).all())
+
+        entries_table = DataEntry.__table__
+        structure = entries_table.c.hierarchical_structure
+        rewrite = (
+            update(entries_table)
+            .where(entries_table.c.table_id == bindparam('moved_table_id'), subtree_condition(structure, hierarchical_structure))
+            .values(hierarchical_structure=bindparam('new_root', type_=String) + func.substr(structure, len(hierarchical_structure) + 1))
+        )
+        # Clients see the old structures deleted and the new ones inserted
+        record_changes_from(session, table_ids, select(DataEntry.table_id, DataEntry.hierarchical_structure).where(
+            DataEntry.table_id.in_(table_ids), subtree_condition(DataEntry.hierarchical_structure, hierarchical_structure)
+        ), ['hierarchical_structure'])
+        session.execute(rewrite, [
+            {"moved_table_id": table_id, "new_root": plans[table_id]['new_root']} for table_id in table_ids
+        ])
+        index_updated_entries(session)
+        record_changes_from(session, table_ids, select(DataEntry.table_id, DataEntry.hierarchical_structure).where(or_(*(
+            and_(DataEntry.table_id == table_id, subtree_condition(DataEntry.hierarchical_structure, plans[table_id]['new_root']))
+            for table_id in table_ids
+        ))), ['hierarchical_structure'])
+
+        invalidate_tables_reports(session, table_ids)
+        invalidate_tables_points(session, table_ids)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        error = f"An error occurred while moving the subtree: {str(e)}"
+        logger.error(error)
+        return {table_id: {"error": error} for table_id in table_ids}, error
+
+    logger.info(f"Moved subtree {hierarchical_structure} under {new_parent_structure} in {len(table_ids)} tables")
+    return {
+        table_id: {
+            "message": "Subtree moved successfully",
+            "changes": {
+                "old_root": hierarchical_structure,
+                "new_root": plans[table_id]['new_root'],
+                "moved_rows": moved_counts.get(table_id, 0)
+            }
+        }
+        for table_id in table_ids
+    }, None
@@ -0,0 +1,255 @@
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+from itertools import count
+from pathlib import Path
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How often the disk database is checked for commits made outside this process's sessions
+POLL_SECONDS = 0.5
+# How long a read waits for the replica to catch up with earlier writes before using the disk
+MAX_READ_WAIT_SECONDS = 2.0
+# Memory a replica may use. A refresh holds the new copy next to the one being read, so only
+# databases up to half of this are replicated; reads of larger ones keep going to the disk
+MAX_REPLICA_BYTES = 2 * 1024 ** 3
+# Caches of reads (see report_cache and timeseries). Their writes do not refresh the replica,
+# and replica sessions read them from the disk, so a stored result is found right away
+CACHE_TABLES = {'comparison_reports', 'timeseries_points'}
+# Every change to the data is logged in change_log, and a new table changes the schema; cache
+# writes change neither, so the replica is only refreshed when this changes
+DATA_VERSION_SQL = "SELECT (SELECT schema_version FROM pragma_schema_version), (SELECT max(id) FROM change_log)"
+
+# The replica of each disk engine, for the session events below
+replicas = {}
+replica_names = count(1)
+
+def writes_to_disk(clause):
+    # Temporary tables (comparison.keyed_snapshot) live and are written on the replica connection
+    return clause is not None and clause.is_dml and 'TEMPORARY' not in getattr(clause.table, '_prefixes', ())
+
+def reads_cache(mapper):
+    return mapper is not None and mapper.local_table.name in CACHE_TABLES
+
+def data_version(connection):
+    try:
+        return connection.execute(DATA_VERSION_SQL).fetchone()
+    except sqlite3.OperationalError:
+        # change_log is created by init_db, which may run after the replica starts
+        return connection.execute("SELECT schema_version FROM pragma_schema_version").fetchone()
+
+class ReplicaSession(Session):
+    """
+    A session reading from a replica, whose flushes and INSERT, UPDATE and DELETE statements
+    go to the disk, along with the queries of CACHE_TABLES.
+    """
+
+    def get_bind(self, mapper=None, *, clause=None, **kwargs):
+        if self._flushing or writes_to_disk(clause) or reads_cache(mapper):
+            return self.info['disk_engine']
+        return super().get_bind(mapper, clause=clause, **kwargs)
+
+class Replica:
+    """
+    An in-memory copy of a database file, serving reads.
+
+    The copy is written into a named in-memory database, so every connection of the
+    replica engine shares it. Writes go to the disk; after each commit that logged
+    changes, and whenever the change log or schema of the file changed otherwise, a
+    background thread makes a fresh copy and swaps it in, so sessions already reading
+    keep a consistent copy. Writes to CACHE_TABLES refresh nothing. A read session
+    waits for the copy to include every change committed before it was opened, so a
+    client reads its own writes.
+
+    While a refresh runs, and until the sessions reading the previous copy close, both
+    copies are in memory; databases are only replicated while two copies fit in
+    max_bytes. A response streamed from one session (such as a folder search) keeps its
+    copy until it ends.
+    """
+
+    def __init__(self, disk_engine, max_bytes=MAX_REPLICA_BYTES, poll_seconds=POLL_SECONDS):
+        self.disk_engine = disk_engine
+        self.path = disk_engine.url.database
+        self.max_bytes = max_bytes
+        self.poll_seconds = poll_seconds
+        self.condition = threading.Condition()
+        self.wake = threading.Event()
+        self.closed = False
+        # Commits that changed rows, and how many of them the current copy includes
+        self.written = 0
+        self.applied = 0
+        self.engine = None
+        self.keeper = None
+        self.stale_since = None
+        self.memory_bytes = 0
+        self.refreshes = 0
+        self.last_refresh_ms = None
+        self.last_lag_ms = None
+        self.error = None
+        replicas[disk_engine] = self
+        self.thread = threading.Thread(target=self.run, name='replica', daemon=True)
+        self.thread.start()
+
+    def mark_written(self):
+        with self.condition:
+            self.written += 1
+            if self.stale_since is None:
+                self.stale_since = time.perf_counter()
+        self.wake.set()
+
+    def run(self):
+        probe = sqlite3.connect(self.path)
+        version = None
+        try:
+            while not self.closed:
+                current_version = data_version(probe)
+                with self.condition:
+                    behind = self.applied < self.written
+                    if current_version != version and self.stale_since is None:
+                        self.stale_since = time.perf_counter()
+                if behind or current_version != version:
+                    version = current_version
+                    try:
+                        self.refresh()
+                    except Exception as e:
+                        self.error = str(e)
+                        logger.error(f"Error refreshing the replica of {self.path}: {str(e)}")
+                self.wake.wait(self.poll_seconds)
+                self.wake.clear()
+        finally:
+            probe.close()
+
+    def refresh(self):
+        start = time.perf_counter()
+        with self.condition:
+            generation = self.written
+        uri = f"file:/replica-{id(self)}-{next(replica_names)}?vfs=memdb"
+        source = sqlite3.connect(Path(self.path).resolve().as_uri(), uri=True)
+        try:
+            size = source.execute("PRAGMA page_count").fetchone()[0] * source.execute("PRAGMA page_size").fetchone()[0]
+            if 2 * size > self.max_bytes:
+                self.drop(f"Two copies of the database ({size} bytes each) are larger than the replica limit of {self.max_bytes} bytes")
+                return
+            # The keeper connection holds the copy open until the next one replaces it
+            keeper = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            # The backup API would also copy the file's write-ahead log flag, which in-memory
+            # databases shared between connections cannot open; VACUUM INTO writes a plain copy
+            source.execute("VACUUM INTO ?", (uri,))
+            size = keeper.execute("PRAGMA page_count").fetchone()[0] * keeper.execute("PRAGMA page_size").fetchone()[0]
+        finally:
+            source.close()
+        # The replica keeps the disk URL, so caches keyed by it (autocomplete, fuzzy search) are shared
+        engine = create_engine(self.disk_engine.url, creator=lambda: sqlite3.connect(uri, uri=True, check_same_thread=False),
+                               poolclass=QueuePool, pool_size=self.disk_engine.pool.size(), max_overflow=self.disk_engine.pool.size())
+
+        with self.condition:
+            previous = self.engine
+            self.engine, self.keeper = engine, keeper
+            self.applied = generation
+            self.memory_bytes = size
+            self.refreshes += 1
+            self.last_refresh_ms = round((time.perf_counter() - start) * 1000, 2)
+            if self.stale_since is not None:
+                self.last_lag_ms = round((time.perf_counter() - self.stale_since) * 1000, 2)
+            # Writes that committed during the copy may be missing; they are applied next
+            self.stale_since = None if self.applied >= self.written else start
+            self.error = None
+            self.condition.notify_all()
+        self.release(previous)
+        logger.info(f"Refreshed the replica of {self.path} ({size} bytes) in {self.last_refresh_ms} ms")
+
+    def release(self, engine):
+        # Sessions opened on the old copy hold its keeper connection, so the copy is freed
+        # once the last of them is gone, even if they had not connected yet
+        if engine is not None:
+            engine.dispose()
+
+    def drop(self, reason):
+        with self.condition:
+            previous = self.engine
+            self.engine, self.keeper = None, None
+            self.memory_bytes = 0
+            self.error = reason
+            self.condition.notify_all()
+        self.release(previous)
+        logger.warning(f"Not replicating {self.path}: {reason}")
+
+    def read_session(self, max_wait=MAX_READ_WAIT_SECONDS):
+        """
+        Open a session on the replica, once it includes every write committed so far.
+
+        Args:
+        max_wait (float): The longest wait for the replica to catch up, in seconds.
+
+        Returns:
+        ReplicaSession: The session, or None when the replica is not loaded or stays
+        behind, in which case the caller reads from the disk.
+        """
+        deadline = time.monotonic() + max_wait
+        with self.condition:
+            target = self.written
+            while self.engine is not None and self.applied < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+            if self.engine is None:
+                return None
+            engine, keeper = self.engine, self.keeper
+        return ReplicaSession(bind=engine, info={'disk_engine': self.disk_engine, 'replica_keeper': keeper})
+
+    def stats(self):
+        with self.condition:
+            return {
+                "loaded": self.engine is not None,
+                "memory_bytes": self.memory_bytes,
+                "max_bytes": self.max_bytes,
+                "pending_writes": self.written - self.applied,
+                "lag_ms": round((time.perf_counter() - self.stale_since) * 1000, 2) if self.stale_since is not None else 0,
+                "last_lag_ms": self.last_lag_ms,
+                "last_refresh_ms": self.last_refresh_ms,
+                "refreshes": self.refreshes,
+                "error": self.error
+            }
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+        self.thread.join()
+        replicas.pop(self.disk_engine, None)
+        with self.condition:
+            previous = self.engine
+            self.engine, self.keeper = None, None
+        self.release(previous)
+
+# Sessions note the rows changed by each disk connection, to tell the replica of writes
+# once they are committed. Registered when models imports this module, so before the
+# change event listeners: a stream woken by a commit then waits for the replica.
+@event.listens_for(Session, "after_begin")
+def track_disk_changes(session, transaction, connection):
+    replica = replicas.get(connection.engine)
+    if replica:
+        dbapi_connection = connection.connection.driver_connection
+        session.info.setdefault('replica_changes', []).append((replica, dbapi_connection, dbapi_connection.total_changes))
+
+@event.listens_for(Session, "before_commit")
+def note_logged_changes(session):
+    # change_log marks the tables it logs changes for; transactions that only wrote caches log none
+    if 'replica_changes' in session.info:
+        session.info['replica_logged'] = bool(session.info.get('changed_tables'))
+
+@event.listens_for(Session, "after_commit")
+def notify_replica_of_writes(session):
+    logged = session.info.pop('replica_logged', False)
+    for replica, dbapi_connection, changes in session.info.pop('replica_changes', []):
+        if logged and dbapi_connection.total_changes > changes:
+            replica.mark_written()
+
+@event.listens_for(Session, "after_rollback")
+def discard_replica_changes(session):
+    session.info.pop('replica_changes', None)
+    session.info.pop('replica_logged', None)
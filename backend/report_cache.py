@@ -0,0 +1,127 @@
+from models import Table, ComparisonReport, get_session
+from comparison import build_comparison_report
+from snapshots import folder_snapshots
+from change_log import tables_version, tables_version_select
+from sqlalchemy import select, insert, literal, or_
+from sqlalchemy.exc import OperationalError
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def get_cached_report(session, table1_id, table2_id):
+    cached = session.query(ComparisonReport.report).filter_by(table1_id=table1_id, table2_id=table2_id).first()
+    return json.loads(cached.report) if cached else None
+
+def store_report(session, table1_id, table2_id, report, version):
+    """
+    Save a report in its own short write transaction, unless the tables changed since it was built.
+
+    Building a report reads inside a transaction (the diff writes temporary tables), so
+    that transaction is committed first; upgrading it to a write could deadlock with
+    another writer. The report replaces the cached one in a single statement that only
+    writes while the change log of both tables is still at the version read before the
+    build, so a report built before an edit is never stored after the edit invalidated
+    the cache. Caching is best effort: if the database stays locked the report is
+    simply not stored.
+
+    Args:
+    session (Session): The database session the report was built in.
+    table1_id (int): The ID of the earlier table.
+    table2_id (int): The ID of the later table.
+    report (dict): The report.
+    version (int): The tables_version of both tables read before the build.
+
+    Returns:
+    bool: Whether the report was stored.
+    """
+    session.commit()
+    try:
+        stored = session.execute(insert(ComparisonReport).prefix_with('OR REPLACE').from_select(
+            ['table1_id', 'table2_id', 'report'],
+            select(literal(table1_id), literal(table2_id), literal(json.dumps(report, default=str)))
+            .where(tables_version_select([table1_id, table2_id]) == version)
+        )).rowcount
+        session.commit()
+    except OperationalError as e:
+        session.rollback()
+        logger.warning(f"Could not cache comparison report for tables {table1_id} and {table2_id}: {str(e)}")
+        return False
+    if not stored:
+        logger.info(f"Comparison report for tables {table1_id} and {table2_id} not cached, the tables changed while it was built")
+    return bool(stored)
+
+def get_or_build_report(session, table1, table2):
+    """
+    Return the comparison report for two tables, building and caching it on a miss.
+
+    Args:
+    session (Session): The database session.
+    table1 (Table): The earlier table.
+    table2 (Table): The later table.
+
+    Returns:
+    dict: The /compare_tables response.
+    """
+    report = get_cached_report(session, table1.id, table2.id)
+    if report is not None:
+        logger.info(f"Comparison report cache hit for tables {table1.id} and {table2.id}")
+        return report
+
+    logger.info(f"Comparison report cache miss for tables {table1.id} and {table2.id}")
+    table1_id, table2_id = table1.id, table2.id
+    version = tables_version(session, [table1_id, table2_id])
+    report = build_comparison_report(session, table1, table2)
+    store_report(session, table1_id, table2_id, report, version)
+    return report
+
+def invalidate_table_reports(session, table_id):
+    """Drop every cached report that involves the table. Call it in the transaction that edits the table."""
+    invalidate_tables_reports(session, [table_id])
+
+def invalidate_tables_reports(session, table_ids):
+    """Drop every cached report that involves any of the tables, in one statement."""
+    deleted = session.query(ComparisonReport).filter(
+        or_(ComparisonReport.table1_id.in_(table_ids), ComparisonReport.table2_id.in_(table_ids))
+    ).delete(synchronize_session=False)
+    if deleted:
+        logger.info(f"Invalidated {deleted} cached comparison reports for tables {', '.join(map(str, table_ids))}")
+
+def consecutive_pairs(session, table):
+    if table.clone_of_id is not None:
+        return []
+    tables = folder_snapshots(session, table.folder_id)
+    position = [t.id for t in tables].index(table.id)
+    pairs = []
+    if position > 0:
+        pairs.append((tables[position - 1], table))
+    if position < len(tables) - 1:
+        pairs.append((table, tables[position + 1]))
+    return pairs
+
+def precompute_consecutive_reports(table_id):
+    """
+    Build and store the reports comparing a new table with its neighbours in the folder.
+
+    Runs after an upload has committed, usually on a background thread, so it opens
+    its own session. Failures are logged only; the reports are then built on demand.
+
+    Args:
+    table_id (int): The ID of the newly uploaded table.
+    """
+    session = get_session()
+    try:
+        table = session.get(Table, table_id)
+        if table is None:
+            return
+        pairs = [(earlier.id, later.id, earlier, later) for earlier, later in consecutive_pairs(session, table)]
+        for earlier_id, later_id, earlier, later in pairs:
+            if get_cached_report(session, earlier_id, later_id) is None:
+                version = tables_version(session, [earlier_id, later_id])
+                if store_report(session, earlier_id, later_id, build_comparison_report(session, earlier, later), version):
+                    logger.info(f"Precomputed comparison report for tables {earlier_id} and {later_id}")
+    except Exception as e:
+        session.rollback()
+        logger.error(f"Error precomputing comparison reports for table {table_id}: {str(e)}")
+    finally:
+        session.close()
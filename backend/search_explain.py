@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The progress handler runs every this many SQLite VM instructions
+VM_STEP_INTERVAL = 1000
+
+class PhaseTimer:
+    """Accumulates wall time per named phase of a request."""
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = self.timings.get(name, 0) + (time.perf_counter() - start) * 1000
+
+    def report(self):
+        """Return the phase timings in milliseconds, with their total."""
+        timings = {name: round(elapsed, 3) for name, elapsed in self.timings.items()}
+        timings["total"] = round(sum(self.timings.values()), 3)
+        return timings
+
+@contextmanager
+def count_vm_steps(session):
+    """
+    Count the SQLite VM instructions run inside the block, to the nearest VM_STEP_INTERVAL.
+
+    The count covers every statement of the session's connection, so it measures the
+    work of a search independently of the machine it runs on.
+
+    Yields:
+    dict: Holds the running count under "steps".
+    """
+    connection = session.connection().connection.driver_connection
+    counter = {"steps": 0}
+
+    def tick():
+        counter["steps"] += VM_STEP_INTERVAL
+        return 0
+
+    connection.set_progress_handler(tick, VM_STEP_INTERVAL)
+    try:
+        yield counter
+    finally:
+        connection.set_progress_handler(None, VM_STEP_INTERVAL)
+
+def literal_sql(statement):
+    return str(statement.compile(compile_kwargs={"literal_binds": True}))
+
+def query_plan(session, statement):
+    """
+    Return SQLite's plan for a statement as a list of {id, parent, detail} steps.
+
+    Args:
+    session (Session): The database session.
+    statement (Select): The statement to explain.
+
+    Returns:
+    list: The EXPLAIN QUERY PLAN rows, parents before their children.
+    """
+    compiled = statement.compile(dialect=session.get_bind().dialect, compile_kwargs={"render_postcompile": True})
+    parameters = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {compiled}", parameters).all()
+    return [{"id": step_id, "parent": parent, "detail": detail} for step_id, parent, _, detail in rows]
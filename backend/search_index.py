@@ -0,0 +1,194 @@
+from models import (Table, DataEntry, SEARCH_INDEX_TABLE, SEARCH_INDEX_COLUMNS, SEARCH_UNINDEXED_TABLE,
+                    search_index_insert_statements, normalize_search_text)
+from sqlalchemy import select, func, text, bindparam, table as sql_table, column as sql_column
+import logging
+
+logger = logging.getLogger(__name__)
+
+# The trigram tokenizer cannot look up terms shorter than this
+MIN_TERM_LENGTH = 3
+# Above this many candidates a paginated search finds its page sooner by scanning in sort order
+BROAD_QUERY_CANDIDATES = 5000
+# Pages of the search index merged per step when it is compacted after deletions
+MERGE_STEP_PAGES = 500
+
+search_index = sql_table(SEARCH_INDEX_TABLE, sql_column('rowid'), sql_column(SEARCH_INDEX_TABLE))
+unindexed_entries = sql_table(SEARCH_UNINDEXED_TABLE, sql_column('id'))
+
+def search_index_available(session):
+    return session.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_INDEX_TABLE}
+    ).first() is not None
+
+def merge_search_index(session, pages=MERGE_STEP_PAGES):
+    """
+    Merge segments of the search index once, if the database has one.
+
+    Deleting rows only adds tombstones to the index, so after large deletions its
+    segments are merged step by step to drop the deleted entries and free their pages.
+
+    Returns:
+    bool: Whether the step did any work, that is whether another step may be useful.
+    """
+    if not search_index_available(session):
+        return False
+    connection = session.connection().connection.driver_connection
+    before = connection.total_changes
+    # A negative page count merges even levels with few segments
+    session.execute(text(f"INSERT INTO {SEARCH_INDEX_TABLE} ({SEARCH_INDEX_TABLE}, rank) VALUES ('merge', :pages)"),
+                    {"pages": -pages})
+    return connection.total_changes - before >= 2
+
+def index_table_entries(session, table_id):
+    """Add the freshly inserted rows of a table to the search index, if the database has one."""
+    if search_index_available(session):
+        for statement in search_index_insert_statements('table_id = :table_id'):
+            session.execute(text(statement), {"table_id": table_id})
+
+def index_entry(session, entry_id):
+    """Add one freshly inserted row to the search index, if the database has one."""
+    if search_index_available(session):
+        for statement in search_index_insert_statements('id = :entry_id'):
+            session.execute(text(statement), {"entry_id": entry_id})
+
+def index_entries(session, entry_ids):
+    """Add several freshly inserted rows to the search index, if the database has one."""
+    if entry_ids and search_index_available(session):
+        for statement in search_index_insert_statements('id IN :entry_ids'):
+            statement = text(statement).bindparams(bindparam('entry_ids', expanding=True))
+            session.execute(statement, {"entry_ids": list(entry_ids)})
+
+def index_updated_entries(session):
+    """
+    Index the updated rows again, if the database has a search index.
+
+    The triggers cannot fold values, so they only queue updated rows (see
+    models.create_search_index); writers call this after updating data_entries.
+    """
+    if search_index_available(session):
+        for statement in search_index_insert_statements(f'id IN (SELECT id FROM {SEARCH_UNINDEXED_TABLE})'):
+            session.execute(text(statement))
+        session.execute(text(f"DELETE FROM {SEARCH_UNINDEXED_TABLE}"))
+
+def compile_fts_query(parsed_query, columns):
+    """
+    Compile a parse_complex_query result into an FTS5 match expression.
+
+    The expression selects a superset of the rows that build_sqlalchemy_condition
+    matches, so callers still apply that condition to the candidates. Parts the index
+    cannot narrow (NOT, terms shorter than three characters, LIKE wildcards) are left
+    out of an AND; an OR with such a part cannot be narrowed at all. Terms are folded
+    with normalize_search_text, like the indexed values.
+
+    Args:
+    parsed_query (list): The parsed query.
+    columns (list): The columns being searched.
+
+    Returns:
+    str: The match expression, or None if the index cannot narrow the search.
+    """
+    indexed_columns = [SEARCH_INDEX_COLUMNS[column] for column in columns if column in SEARCH_INDEX_COLUMNS]
+    if len(indexed_columns) < len(columns):
+        return None
+    column_filter = '{' + ' '.join(indexed_columns) + '}'
+
+    def compile_term(term):
+        if not isinstance(term, str):
+            return None
+        quoted = term.startswith('"') and term.endswith('"')
+        # The index holds folded text, so the term is folded the same way
+        value = normalize_search_text(term.strip('"') if quoted else term)
+        # Unquoted terms are LIKE patterns, where '_' matches any character
+        if len(value) < MIN_TERM_LENGTH or (not quoted and '_' in value):
+            return None
+        return f'{column_filter}: "' + value.replace('"', '""') + '"'
+
+    def combine(parts, operator):
+        if operator == 'OR':
+            if not parts or None in parts:
+                return None
+        else:
+            parts = [part for part in parts if part is not None]
+            if not parts:
+                return None
+        return parts[0] if len(parts) == 1 else '(' + f' {operator} '.join(parts) + ')'
+
+    # Mirrors the branches of build_sqlalchemy_condition
+    def compile_expression(expr):
+        if isinstance(expr, list):
+            if len(expr) == 1:
+                return compile_expression(expr[0])
+            elif not expr or expr[0] == 'NOT':
+                return None
+            elif 'OR' in expr:
+                return combine([compile_expression(e) for e in expr if e != 'OR'], 'OR')
+            elif 'AND' in expr:
+                return combine([compile_expression(e) for e in expr if e != 'AND'], 'AND')
+            else:
+                return combine([compile_expression(e) for e in expr], 'AND')
+        return compile_term(expr)
+
+    return compile_expression(parsed_query)
+
+def table_id_range(session, table_id):
+    # SQLite answers a lone min() or max() from the (table_id, id) index without a scan
+    low = select(func.min(DataEntry.id)).where(DataEntry.table_id == table_id).scalar_subquery()
+    high = select(func.max(DataEntry.id)).where(DataEntry.table_id == table_id).scalar_subquery()
+    return session.execute(select(low, high)).one()
+
+def candidate_ids(session, table_id, parsed_query, columns, max_candidates=None):
+    """
+    Return a select of the data_entries ids in a table that may match the query.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+    parsed_query (list): The parsed query.
+    columns (list): The columns being searched.
+    max_candidates (int): If given, give up on the index when more rows than this may match.
+
+    Returns:
+    Select: The candidate ids, or None when the index cannot be used. Delta-stored
+    tables are not indexed, since their rows live in delta_entries.
+    """
+    table = session.get(Table, table_id)
+    if table is None or table.storage_mode != 'full':
+        return None
+    return tables_candidate_ids(session, [table_id], parsed_query, columns, max_candidates)
+
+def tables_candidate_ids(session, table_ids, parsed_query, columns, max_candidates=None):
+    """
+    Return a select of the data_entries ids in full-stored tables that may match the query.
+
+    The candidates are bounded to the id range spanned by the tables, so callers still
+    filter on table_id, and include the updated rows not indexed again yet. Arguments and
+    result are as for candidate_ids.
+    """
+    if not table_ids or not search_index_available(session):
+        return None
+
+    match_expression = compile_fts_query(parsed_query, columns)
+    if match_expression is None:
+        logger.info("Search query cannot be narrowed by the search index")
+        return None
+
+    logger.info(f"Search index match expression: {match_expression}")
+    ranges = [table_id_range(session, table_id) for table_id in table_ids]
+    lows = [low for low, _ in ranges if low is not None]
+    highs = [high for _, high in ranges if high is not None]
+    low, high = min(lows, default=None), max(highs, default=None)
+    candidates = (
+        select(search_index.c.rowid)
+        .where(search_index.c[SEARCH_INDEX_TABLE].op('MATCH')(match_expression))
+        .where(search_index.c.rowid.between(low, high))
+    )
+    unindexed = select(unindexed_entries.c.id).where(unindexed_entries.c.id.between(low, high))
+    if session.execute(select(unindexed.exists())).scalar():
+        candidates = candidates.union_all(unindexed)
+
+    if max_candidates is not None:
+        probe = select(func.count()).select_from(candidates.limit(max_candidates + 1).subquery())
+        if session.execute(probe).scalar() > max_candidates:
+            logger.info(f"More than {max_candidates} search index candidates, scanning in sort order instead")
+            return None
+    return candidates
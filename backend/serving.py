@@ -0,0 +1,85 @@
+from models import database_options
+from change_events import broker
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+class PooledRequestHandler(WSGIRequestHandler):
+    # One request per connection, so an idle keep-alive connection never holds a worker
+    protocol_version = "HTTP/1.0"
+
+class PooledWSGIServer(BaseWSGIServer):
+    """
+    A WSGI server that handles connections on a fixed pool of worker threads.
+
+    When every worker is busy the server stops accepting, so new connections wait in the
+    listen backlog instead of piling up threads.
+    """
+
+    multithread = True
+
+    def __init__(self, host, port, app, workers=DEFAULT_WORKERS):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='worker')
+        self.idle_workers = threading.Semaphore(workers)
+        super().__init__(host, port, app, handler=PooledRequestHandler)
+
+    def process_request(self, request, client_address):
+        self.idle_workers.acquire()
+        self.executor.submit(self.process_request_in_worker, request, client_address)
+
+    def process_request_in_worker(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self.idle_workers.release()
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+def configure_workers(workers):
+    """
+    Size the shared resources of the process for a number of workers.
+
+    Database engines opened from now on pool one connection per worker and stop echoing
+    every statement, and event streams, which hold a worker for minutes, may take at
+    most half of the workers. A single worker still serves one event stream, and other
+    requests wait while it is open.
+
+    Args:
+    workers (int): The number of worker threads.
+    """
+    database_options.update(pool_size=workers, echo=False)
+    broker.max_subscribers = min(broker.max_subscribers, max(1, workers // 2))
+    if workers == 1:
+        logger.warning("With one worker an open event stream makes other requests wait; use --workers 2 or more")
+
+def make_pooled_server(app, host='127.0.0.1', port=5000, workers=DEFAULT_WORKERS):
+    """
+    Create the production server of an app, without starting it.
+
+    Args:
+    app (Flask): The WSGI application.
+    host (str): The address to listen on.
+    port (int): The port to listen on, or 0 for any free port.
+    workers (int): The number of worker threads.
+
+    Returns:
+    PooledWSGIServer: The server, whose serve_forever method serves requests.
+    """
+    if workers < 1:
+        raise ValueError("At least one worker is needed")
+    configure_workers(workers)
+    server = PooledWSGIServer(host, port, app, workers)
+    logger.info(f"Serving on http://{host}:{server.server_port} with {workers} worker threads")
+    return server
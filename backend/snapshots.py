@@ -0,0 +1,292 @@
+from models import Folder, Table, DataEntry, DeltaEntry
+from search_index import index_table_entries
+from sqlalchemy import select, literal, case, union_all, exists, insert, delete, func, or_, Date
+from collections import Counter
+import pandas as pd
+import logging
+
+logger = logging.getLogger(__name__)
+
+STORAGE_MODES = ('full', 'delta')
+
+# A delta chain is cut by a full keyframe after this many deltas, bounding reconstruction cost
+KEYFRAME_INTERVAL = 12
+
+# If a diff touches more than this share of the rows it is cheaper to store the snapshot in full
+MAX_DELTA_RATIO = 0.5
+
+# Columns of a reconstructed snapshot row, in the order DataEntry declares them
+SNAPSHOT_COLUMNS = [
+    'id', 'table_id', 'hierarchical_structure', 'upload_date', 'person_id',
+    'name', 'birth_date', 'role', 'department', 'rank', 'organization_id'
+]
+
+# Fields that decide whether a row changed between two snapshots
+DIFF_FIELDS = ['person_id', 'name', 'birth_date', 'role', 'department', 'rank', 'organization_id']
+
+ROW_FIELDS = ['hierarchical_structure', 'upload_date'] + DIFF_FIELDS
+
+def get_table_chain(session, table_id):
+    """
+    Return the ids needed to reconstruct a table, starting with its keyframe.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+
+    Returns:
+    list: Table ids from the full keyframe to table_id, in application order.
+    """
+    chain = [table_id]
+    current = session.query(Table.storage_mode, Table.base_table_id, Table.deleting).filter(Table.id == table_id).first()
+    # A table being deleted is gone for its readers, though its rows still serve as a base
+    if current is None or current.deleting:
+        raise ValueError(f"Table with id {table_id} not found")
+
+    while current.storage_mode == 'delta':
+        if current.base_table_id is None or current.base_table_id in chain:
+            raise ValueError(f"Broken delta chain for table {table_id}")
+        chain.append(current.base_table_id)
+        current = session.query(Table.storage_mode, Table.base_table_id).filter(Table.id == current.base_table_id).first()
+        if current is None:
+            raise ValueError(f"Broken delta chain for table {table_id}")
+
+    chain.reverse()
+    return chain
+
+def snapshot_select(session, table_id):
+    """
+    Build a SELECT returning the rows of a table regardless of how it is stored.
+
+    Full tables read data_entries directly. Delta tables stack their keyframe and every
+    delta in the chain, keep the newest version of each hierarchical_structure and drop
+    the ones whose newest version is a delete. The result exposes SNAPSHOT_COLUMNS, so it
+    can be executed as is or wrapped with .subquery() and filtered further.
+
+    Rows of a delta table carry the table's own upload_date, like the rows stored in
+    full, and delta rows get negative ids so they never collide with keyframe rows.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table.
+
+    Returns:
+    Select: A SELECT over the table's rows.
+    """
+    chain = get_table_chain(session, table_id)
+    if len(chain) == 1:
+        return select(*[getattr(DataEntry, column) for column in SNAPSHOT_COLUMNS]).where(DataEntry.table_id == table_id)
+
+    keyframe_id, delta_ids = chain[0], chain[1:]
+    upload_date = session.query(Table.upload_date).filter(Table.id == table_id).scalar()
+    depth = case({delta_id: depth for depth, delta_id in enumerate(delta_ids, start=1)}, value=DeltaEntry.table_id)
+
+    keyframe_rows = select(
+        *[getattr(DataEntry, column) for column in ['id'] + ROW_FIELDS],
+        literal(0).label('depth'),
+        literal('upsert').label('operation')
+    ).where(DataEntry.table_id == keyframe_id)
+
+    delta_rows = select(
+        (-DeltaEntry.id).label('id'),
+        *[getattr(DeltaEntry, column) for column in ROW_FIELDS],
+        depth.label('depth'),
+        DeltaEntry.operation
+    ).where(DeltaEntry.table_id.in_(delta_ids))
+
+    layers = union_all(keyframe_rows, delta_rows).subquery()
+    ranked = select(
+        layers,
+        func.row_number().over(
+            partition_by=layers.c.hierarchical_structure,
+            order_by=layers.c.depth.desc()
+        ).label('version')
+    ).subquery()
+
+    constants = {
+        'table_id': literal(table_id).label('table_id'),
+        'upload_date': literal(upload_date, Date).label('upload_date')
+    }
+    return select(*[
+        constants[column] if column in constants else ranked.c[column].label(column)
+        for column in SNAPSHOT_COLUMNS
+    ]).where(ranked.c.version == 1, ranked.c.operation == 'upsert')
+
+def tables_snapshot_select(session, tables, full_condition=None):
+    """
+    Build a SELECT returning the rows of several tables, with the columns of snapshot_select.
+
+    Full tables are read from data_entries in a single branch; each delta table adds its
+    own reconstructed branch.
+
+    Args:
+    session (Session): The database session.
+    tables (list): The Table objects to read.
+    full_condition (ColumnElement): An extra filter on DataEntry for the full-table branch.
+
+    Returns:
+    Select: A SELECT over the rows of every table, or None when there are no tables.
+    """
+    full_ids = [table.id for table in tables if table.storage_mode != 'delta']
+    branches = [snapshot_select(session, table.id) for table in tables if table.storage_mode == 'delta']
+    if full_ids:
+        full_rows = select(*[getattr(DataEntry, column) for column in SNAPSHOT_COLUMNS]).where(DataEntry.table_id.in_(full_ids))
+        if full_condition is not None:
+            full_rows = full_rows.where(full_condition)
+        branches.insert(0, full_rows)
+
+    if not branches:
+        return None
+    return branches[0] if len(branches) == 1 else union_all(*branches)
+
+def load_snapshot_entries(session, table_id):
+    """Return every row of a table as read-only rows with DataEntry attribute names."""
+    return session.execute(snapshot_select(session, table_id)).all()
+
+def load_snapshot_frame(session, table_id):
+    """Return every row of a table as a DataFrame with SNAPSHOT_COLUMNS."""
+    return pd.DataFrame(load_snapshot_entries(session, table_id), columns=SNAPSHOT_COLUMNS)
+
+def snapshot_contains(session, table_id, column, value):
+    snapshot = snapshot_select(session, table_id).subquery()
+    return session.query(exists().where(snapshot.c[column] == value)).scalar()
+
+def folder_snapshots(session, folder_id):
+    """Return the uploaded tables of a folder in upload order, leaving out clones and tables being deleted."""
+    return (
+        session.query(Table)
+        .filter(Table.folder_id == folder_id, Table.clone_of_id.is_(None), Table.deleting.is_(False))
+        .order_by(Table.upload_date, Table.id)
+        .all()
+    )
+
+def find_predecessor(session, table):
+    return (
+        session.query(Table)
+        .filter(
+            Table.folder_id == table.folder_id,
+            Table.id != table.id,
+            Table.clone_of_id.is_(None),
+            Table.deleting.is_(False),
+            Table.upload_date <= table.upload_date
+        )
+        .order_by(Table.upload_date.desc(), Table.id.desc())
+        .first()
+    )
+
+def store_snapshot_records(session, table_id, records):
+    """
+    Persist the rows of a newly uploaded table using its folder's storage mode.
+
+    In 'delta' folders the rows are diffed against the previous snapshot by
+    hierarchical_structure, and only added, changed and removed rows are written.
+    A full keyframe is written instead for the first snapshot, after KEYFRAME_INTERVAL
+    deltas, or when the diff is larger than MAX_DELTA_RATIO of the snapshot.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the new table.
+    records (list): Row dictionaries with DataEntry fields, including table_id.
+
+    Returns:
+    str: The storage mode used for the table.
+    """
+    table = session.get(Table, table_id)
+    folder = session.get(Folder, table.folder_id)
+    # Rows carry the date of their snapshot, which reconstructed delta rows report as well
+    records = [dict(record, upload_date=table.upload_date) for record in records]
+
+    structure_counts = Counter(record['hierarchical_structure'] for record in records)
+    duplicates = sorted(structure for structure, count in structure_counts.items() if count > 1)
+    if duplicates:
+        raise ValueError(f"Duplicate hierarchical_structure values in upload: {duplicates}")
+
+    predecessor = find_predecessor(session, table) if folder.storage_mode == 'delta' else None
+    if predecessor is None or len(get_table_chain(session, predecessor.id)) > KEYFRAME_INTERVAL:
+        write_full_rows(session, table, records)
+        return table.storage_mode
+
+    base_rows = {row.hierarchical_structure: row for row in load_snapshot_entries(session, predecessor.id)}
+    delta = diff_records(base_rows, records)
+    if len(delta) > MAX_DELTA_RATIO * max(len(records), 1):
+        logger.info(f"Diff for table {table_id} touches {len(delta)} of {len(records)} rows, storing a keyframe")
+        write_full_rows(session, table, records)
+        return table.storage_mode
+
+    table.storage_mode = 'delta'
+    table.base_table_id = predecessor.id
+    if delta:
+        session.execute(insert(DeltaEntry), [dict(record, table_id=table_id) for record in delta])
+    logger.info(f"Stored table {table_id} as a delta of {len(delta)} rows against table {predecessor.id}")
+    return table.storage_mode
+
+def diff_records(base_rows, records):
+    delta = []
+    seen = set()
+    for record in records:
+        structure = record['hierarchical_structure']
+        seen.add(structure)
+        base = base_rows.get(structure)
+        if base is None or any(getattr(base, field) != record.get(field) for field in DIFF_FIELDS):
+            delta.append(dict({field: record.get(field) for field in ROW_FIELDS}, operation='upsert'))
+
+    for structure in base_rows:
+        if structure not in seen:
+            delta.append(dict({field: None for field in ROW_FIELDS}, hierarchical_structure=structure, operation='delete'))
+
+    return delta
+
+def write_full_rows(session, table, records):
+    table.storage_mode = 'full'
+    table.base_table_id = None
+    if records:
+        session.execute(insert(DataEntry), [dict(record, table_id=table.id) for record in records])
+        index_table_entries(session, table.id)
+
+def rewrite_as_keyframe(session, table):
+    rows = load_snapshot_entries(session, table.id)
+    session.execute(delete(DeltaEntry).where(DeltaEntry.table_id == table.id))
+    write_full_rows(session, table, [{field: getattr(row, field) for field in ROW_FIELDS} for row in rows])
+    session.flush()
+    logger.info(f"Table {table.id} rewritten as a full keyframe with {len(rows)} rows")
+
+def rewrite_dependents(session, table_id):
+    """Rewrite the tables stored as deltas against a table as keyframes, so they keep their contents when it changes."""
+    dependents = session.query(Table).filter(Table.base_table_id == table_id, Table.storage_mode == 'delta').all()
+    for dependent in dependents:
+        rewrite_as_keyframe(session, dependent)
+
+def ensure_full_storage(session, table_id):
+    """
+    Prepare a table for in-place edits of its data_entries rows.
+
+    Tables stored as deltas against this one are rewritten as keyframes first, so they
+    keep their current contents, and the table itself is materialized if it is a delta.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the table about to be edited.
+    """
+    rewrite_dependents(session, table_id)
+
+    table = session.get(Table, table_id)
+    if table is not None and table.storage_mode == 'delta':
+        rewrite_as_keyframe(session, table)
+
+def ensure_full_storage_tables(session, table_ids):
+    """
+    Prepare several tables for in-place edits, like ensure_full_storage, with one lookup.
+
+    Rewriting a delta leaves its contents unchanged, so the tables can be rewritten in
+    any order.
+
+    Args:
+    session (Session): The database session.
+    table_ids (list): The IDs of the tables about to be edited.
+    """
+    deltas = session.query(Table).filter(
+        Table.storage_mode == 'delta',
+        or_(Table.base_table_id.in_(table_ids), Table.id.in_(table_ids))
+    ).all()
+    for table in deltas:
+        rewrite_as_keyframe(session, table)
@@ -0,0 +1,39 @@
+import pytest
+from backend.models import Table
+from backend.snapshots import store_snapshot_records
+from backend.change_log import record_table_reset
+
+SNAPSHOT_COLUMNS = ('hierarchical_structure', 'person_id', 'name')
+
+def add_snapshot_table(self, upload_date, rows):
+    """
+    Store a snapshot of rows in self.folder and commit it.
+
+    Each row is a tuple of the class's snapshot_columns (SNAPSHOT_COLUMNS by default);
+    its snapshot_values are added to every row, and with log_snapshot_reset the table is
+    recorded in the change log as rewritten, as an upload does.
+
+    Args:
+    upload_date (date): The upload date of the table, which also names it.
+    rows (list): The rows of the snapshot.
+
+    Returns:
+    int: The ID of the new table.
+    """
+    table = Table(name=f'{upload_date}.csv', folder_id=self.folder.id, upload_date=upload_date)
+    self.session.add(table)
+    self.session.flush()
+    store_snapshot_records(self.session, table.id, [
+        {'upload_date': upload_date, **getattr(self, 'snapshot_values', {}),
+         **dict(zip(getattr(self, 'snapshot_columns', SNAPSHOT_COLUMNS), row))}
+        for row in rows
+    ])
+    if getattr(self, 'log_snapshot_reset', False):
+        record_table_reset(self.session, table.id)
+    self.session.commit()
+    return table.id
+
+@pytest.fixture(scope='class')
+def snapshot_tables(request):
+    """Give a unittest test case with a session and a folder the add_table method above."""
+    request.cls.add_table = add_snapshot_table
@@ -0,0 +1,121 @@
+import unittest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry
+from backend.snapshots import store_snapshot_records
+from backend import autocomplete
+from backend.autocomplete import (PrefixIndex, build_table_completions, complete, completion_values,
+                                  update_table_completions, completion_stats)
+
+class TestPrefixIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.counts = {f'Role {index}': index % 7 + 1 for index in range(60)}
+        self.counts.update({'Zoë': 3, 'zoe': 2, 'Zed': 9})
+
+    def expected(self, prefix, limit):
+        matches = [(value, count) for value, count in self.counts.items() if autocomplete.normalize_search_text(value).startswith(prefix)]
+        return sorted(matches, key=lambda match: -match[1])[:limit]
+
+    def assertCompletes(self, index, prefix, limit=5):
+        completions = index.complete(prefix, limit)
+        self.assertEqual([count for _, count in completions], [count for _, count in self.expected(prefix, limit)])
+        for value, count in completions:
+            self.assertEqual(self.counts[value], count)
+
+    def test_precomputed_prefixes_match_scans(self):
+        with patch.object(autocomplete, 'SCAN_LIMIT', 4):
+            index = PrefixIndex(self.counts)
+            self.assertIn('role 1', index.top)
+            for prefix in ['', 'r', 'role ', 'role 1', 'role 12', 'z', 'zo', 'x']:
+                with self.subTest(prefix=prefix):
+                    self.assertCompletes(index, prefix)
+
+    def test_add_updates_counts_and_rankings(self):
+        with patch.object(autocomplete, 'SCAN_LIMIT', 4):
+            index = PrefixIndex(self.counts)
+            index.complete('role 5', 5)
+            for value, delta in [('Role 50', 20), ('Role 3', -1), ('Role 7', -7), ('Role 5x', 4), ('Missing', -1)]:
+                index.add(value, delta)
+                if value in self.counts or delta > 0:
+                    self.counts[value] = self.counts.get(value, 0) + delta
+            self.counts = {value: count for value, count in self.counts.items() if count > 0}
+
+            self.assertEqual(index.complete('role 5', 1), [('Role 50', 22)])
+            self.assertNotIn('Role 7', index.values)
+            for prefix in ['', 'role', 'role 5', 'role 3']:
+                with self.subTest(prefix=prefix):
+                    self.assertCompletes(index, prefix, 10)
+
+class TestTableCompletions(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        self.table_id = table.id
+        store_snapshot_records(self.session, self.table_id, [
+            {'hierarchical_structure': '/1', 'upload_date': date(2024, 1, 1), 'person_id': '10', 'name': 'Alice', 'role': 'Engineer', 'department': 'Engineering'},
+            {'hierarchical_structure': '/1/1', 'upload_date': date(2024, 1, 1), 'person_id': '11', 'name': 'Bob', 'role': 'Engineer', 'department': 'Engineering'},
+            {'hierarchical_structure': '/1/2', 'upload_date': date(2024, 1, 1), 'person_id': 'nan', 'name': 'nan', 'role': 'Engineer', 'department': 'Sales'}
+        ])
+        self.session.commit()
+        build_table_completions(self.session, self.table_id)
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_complete_ranks_fields_by_frequency(self):
+        self.assertEqual(complete(self.session, self.table_id, 'ENG'), [
+            {"field": "role", "value": "Engineer", "count": 3},
+            {"field": "department", "value": "Engineering", "count": 2}
+        ])
+        self.assertEqual(complete(self.session, self.table_id, 'n', ['name', 'person_id']), [])
+        self.assertEqual(complete(self.session, self.table_id, '1', limit=1), [{"field": "person_id", "value": "10", "count": 1}])
+
+    def test_edits_update_the_cached_index(self):
+        entry = self.session.query(DataEntry).filter_by(person_id='11').one()
+        previous_values = completion_values(entry)
+        entry.role = 'Sales Lead'
+        self.session.commit()
+        update_table_completions(self.session, self.table_id, previous_values, completion_values(entry))
+
+        self.assertEqual(complete(self.session, self.table_id, 'eng', ['role']), [{"field": "role", "value": "Engineer", "count": 2}])
+        self.assertEqual(complete(self.session, self.table_id, 'sa'), [
+            {"field": "role", "value": "Sales Lead", "count": 1},
+            {"field": "department", "value": "Sales", "count": 1}
+        ])
+
+    def test_completion_stats(self):
+        stats = [index for index in completion_stats(self.session) if index["table_id"] == self.table_id]
+        self.assertEqual(stats[0]["values"], {'name': 2, 'role': 1, 'department': 2, 'person_id': 2})
+        self.assertGreater(stats[0]["memory_bytes"], 0)
+
+    def test_cache_is_bounded_by_size(self):
+        table = Table(name='copy.csv', folder_id=self.session.get(Table, self.table_id).folder_id, upload_date=date(2024, 2, 1))
+        self.session.add(table)
+        self.session.flush()
+        store_snapshot_records(self.session, table.id, [
+            {'hierarchical_structure': '/1', 'upload_date': date(2024, 2, 1), 'person_id': '12', 'name': 'Carol', 'role': 'Analyst'}
+        ])
+        self.session.commit()
+        size = [index["memory_bytes"] for index in completion_stats(self.session) if index["table_id"] == self.table_id][0]
+
+        with patch.object(autocomplete, 'MAX_CACHED_BYTES', size * 3 // 2):
+            build_table_completions(self.session, table.id)
+
+        self.assertEqual([index["table_id"] for index in completion_stats(self.session)], [table.id])
+        self.assertEqual(complete(self.session, table.id, 'car'), [{"field": "name", "value": "Carol", "count": 1}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import pytest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, DeltaEntry, ComparisonReport, upgrade_db_schema
+from backend.snapshots import load_snapshot_entries
+from backend.bulk_updates import parse_person_updates, bulk_update_person
+
+@pytest.mark.usefixtures('snapshot_tables')
+class TestBulkUpdatePerson(unittest.TestCase):
+    snapshot_values = {'role': 'Engineer'}
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Test Folder', storage_mode='delta')
+        self.session.add(self.folder)
+        self.session.flush()
+        self.tables = [
+            self.add_table(date(2024, 1, 1), [('/1', '1', 'Alice'), ('/1/1', '2', 'Bob')]),
+            self.add_table(date(2024, 2, 1), [('/1', '1', 'Alice'), ('/1/1', '2', 'Bob'), ('/1/2', '3', 'Carol')]),
+            self.add_table(date(2024, 3, 1), [('/1', '1', 'Alice'), ('/1/2', '3', 'Carol')])
+        ]
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_parse_person_updates(self):
+        self.assertEqual(parse_person_updates({'role': 'Lead', 'birth_date': '1990-05-01'}),
+                         ({'role': 'Lead', 'birth_date': date(1990, 5, 1)}, None))
+        self.assertEqual(parse_person_updates({'id': 5}), (None, 'Invalid field: id'))
+        self.assertEqual(parse_person_updates({'birth_date': '05/01/1990'}),
+                         (None, 'Invalid date format for birth_date. Use YYYY-MM-DD'))
+
+    def test_updates_person_in_every_table(self):
+        storage = [self.session.get(Table, table_id).storage_mode for table_id in self.tables]
+        self.assertEqual(storage, ['full', 'delta', 'delta'])
+        for table_id in self.tables:
+            self.session.add(ComparisonReport(table1_id=self.tables[0], table2_id=table_id, report='{}'))
+        self.session.commit()
+
+        outcomes = bulk_update_person(self.session, self.tables, '1', {'role': 'Lead', 'birth_date': '1990-05-01'})
+
+        self.assertEqual(list(outcomes), self.tables)
+        for table_id in self.tables:
+            self.assertEqual(outcomes[table_id]['role'], 'Lead')
+            self.assertEqual(outcomes[table_id]['birth_date'], '1990-05-01')
+            entries = {entry.person_id: entry for entry in load_snapshot_entries(self.session, table_id)}
+            self.assertEqual(entries['1'].role, 'Lead')
+            self.assertTrue(all(entry.role == 'Engineer' for person_id, entry in entries.items() if person_id != '1'))
+        self.assertEqual(self.session.query(ComparisonReport).count(), 0)
+
+    def test_reports_tables_without_person(self):
+        outcomes = bulk_update_person(self.session, self.tables, '2', {'name': 'Robert'})
+
+        self.assertEqual(outcomes[self.tables[0]]['name'], 'Robert')
+        self.assertEqual(outcomes[self.tables[1]]['name'], 'Robert')
+        self.assertEqual(outcomes[self.tables[2]], {'error': f"Person with ID 2 not found in table {self.tables[2]}"})
+        self.assertEqual([entry.name for table_id in self.tables for entry in load_snapshot_entries(self.session, table_id)
+                          if entry.person_id == '2'], ['Robert', 'Robert'])
+
+    def test_delta_tables_are_edited_with_delta_rows(self):
+        outcomes = bulk_update_person(self.session, self.tables, '1', {'role': 'Lead'})
+
+        self.assertTrue(all('error' not in outcomes[table_id] for table_id in self.tables))
+        self.assertEqual([self.session.get(Table, table_id).storage_mode for table_id in self.tables], ['full', 'delta', 'delta'])
+        self.assertEqual(self.session.query(DataEntry).filter(DataEntry.table_id.in_(self.tables[1:])).count(), 0)
+        self.assertEqual(self.session.query(DeltaEntry).filter_by(person_id='1', role='Lead', operation='upsert').count(), 2)
+
+    def test_tables_stored_against_an_edited_table_keep_their_rows(self):
+        outcomes = bulk_update_person(self.session, self.tables[:2], '3', {'hierarchical_structure': '/1/3', 'role': 'Lead'})
+
+        self.assertEqual(outcomes[self.tables[1]]['role'], 'Lead')
+        self.assertEqual({entry.hierarchical_structure: entry.role for entry in load_snapshot_entries(self.session, self.tables[1])},
+                         {'/1': 'Engineer', '/1/1': 'Engineer', '/1/3': 'Lead'})
+        self.assertEqual({entry.hierarchical_structure: entry.role for entry in load_snapshot_entries(self.session, self.tables[2])},
+                         {'/1': 'Engineer', '/1/2': 'Engineer'})
+        self.assertEqual(self.session.get(Table, self.tables[2]).storage_mode, 'delta')
+
+        outcomes = bulk_update_person(self.session, self.tables, '1', {'hierarchical_structure': '/1/3'})
+        self.assertIn('Hierarchical structure /1/3 already exists in table', outcomes[self.tables[0]]['error'])
+        self.assertEqual([entry.person_id for entry in load_snapshot_entries(self.session, self.tables[0])
+                          if entry.hierarchical_structure == '/1'], ['1'])
+
+    def test_invalid_update_changes_nothing(self):
+        outcomes = bulk_update_person(self.session, self.tables, '3', {'birth_date': 'tomorrow'})
+
+        self.assertEqual(outcomes[self.tables[0]], {'error': f"Person with ID 3 not found in table {self.tables[0]}"})
+        for table_id in self.tables[1:]:
+            self.assertEqual(outcomes[table_id], {'error': 'Invalid date format for birth_date. Use YYYY-MM-DD'})
+        self.assertEqual(self.session.get(Table, self.tables[1]).storage_mode, 'delta')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+import pytest
+import json
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from backend.models import Base, Folder, Table, upgrade_db_schema
+from backend.change_log import record_node_changes, record_table_reset
+from backend.deletions import delete_tables
+from backend.bulk_updates import bulk_update_person
+from backend.change_events import ChangeBroker, broker, latest_version, pending_event, stream_changes
+
+@pytest.mark.usefixtures('snapshot_tables')
+class TestChangeEvents(unittest.TestCase):
+    log_snapshot_reset = True
+
+    def setUp(self):
+        self.engine = create_engine('sqlite://', connect_args={'check_same_thread': False}, poolclass=StaticPool)
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Test Folder')
+        self.session.add(self.folder)
+        self.session.flush()
+        rows = [('/1', '1', 'Alice'), ('/1/1', '2', 'Bob')]
+        self.tables = [self.add_table(date(2024, 1, 1), rows), self.add_table(date(2024, 2, 1), rows)]
+        self.subscription = broker.subscribe(self.folder.id)
+        self.after = latest_version(self.session, self.subscription)
+
+    def tearDown(self):
+        broker.unsubscribe(self.subscription)
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_broker_bounds_subscriptions(self):
+        limited = ChangeBroker(max_subscribers=1)
+        first = limited.subscribe(1)
+        self.assertIsNone(limited.subscribe(1))
+        limited.unsubscribe(first)
+        self.assertIsNotNone(limited.subscribe(1, 2))
+
+    def test_commit_wakes_subscribers_of_changed_tables(self):
+        table_subscription = broker.subscribe(self.folder.id, self.tables[1])
+        try:
+            self.subscription.wake.clear()
+            bulk_update_person(self.session, [self.tables[0]], '2', {'name': 'Robert'})
+
+            self.assertTrue(self.subscription.wake.is_set())
+            self.assertFalse(table_subscription.wake.is_set())
+        finally:
+            broker.unsubscribe(table_subscription)
+
+    def test_rollback_does_not_wake_subscribers(self):
+        self.subscription.wake.clear()
+        record_node_changes(self.session, [(self.tables[0], '/1')])
+        self.session.rollback()
+        self.session.commit()
+
+        self.assertFalse(self.subscription.wake.is_set())
+
+    def test_event_lists_changed_nodes_and_fields(self):
+        bulk_update_person(self.session, self.tables, '2', {'name': 'Robert'})
+        bulk_update_person(self.session, [self.tables[0]], '2', {'role': 'Lead'})
+
+        notification = pending_event(self.session, self.subscription, self.after)
+
+        self.assertEqual(notification['version'], latest_version(self.session, self.subscription))
+        self.assertEqual(notification['tables'], [
+            {'table_id': self.tables[0], 'reset': False, 'deleted': False,
+             'changes': [{'hierarchical_structure': '/1/1', 'fields': ['name', 'role']}]},
+            {'table_id': self.tables[1], 'reset': False, 'deleted': False,
+             'changes': [{'hierarchical_structure': '/1/1', 'fields': ['name']}]}
+        ])
+        self.assertIsNone(pending_event(self.session, self.subscription, notification['version']))
+
+    def test_large_or_rewritten_changes_ask_for_reset(self):
+        record_node_changes(self.session, [(self.tables[0], '/1'), (self.tables[0], '/1/1')])
+        record_table_reset(self.session, self.tables[1])
+        self.session.commit()
+
+        notification = pending_event(self.session, self.subscription, self.after)
+        self.assertEqual([(table['table_id'], table['reset']) for table in notification['tables']],
+                         [(self.tables[0], False), (self.tables[1], True)])
+
+        notification = pending_event(self.session, self.subscription, self.after, max_changes=2)
+        self.assertEqual(notification['version'], latest_version(self.session, self.subscription))
+        self.assertTrue(all(table['reset'] and not table['changes'] for table in notification['tables']))
+
+    def test_deleted_tables_are_announced(self):
+        self.subscription.wake.clear()
+        deletion = delete_tables(self.session, [self.tables[1]])
+        next(deletion)
+
+        self.assertTrue(self.subscription.wake.is_set())
+        notification = pending_event(self.session, self.subscription, self.after)
+        self.assertEqual(notification['tables'], [{'table_id': self.tables[1], 'reset': True, 'deleted': True, 'changes': []}])
+        deletion.close()
+
+    def test_stream_sends_events_and_heartbeats(self):
+        bulk_update_person(self.session, [self.tables[0]], '1', {'department': 'Exec'})
+
+        with patch('backend.change_events.get_session', side_effect=self.Session):
+            messages = list(stream_changes(self.subscription, self.after, max_seconds=0.05, heartbeat_seconds=0.01))
+
+        self.assertTrue(messages[0].startswith('retry: '))
+        event_lines = messages[1].splitlines()
+        self.assertEqual(event_lines[0], f"id: {latest_version(self.session, self.subscription)}")
+        self.assertEqual(event_lines[1], 'event: changes')
+        data = json.loads(event_lines[2][len('data: '):])
+        self.assertEqual(data['tables'][0]['changes'], [{'hierarchical_structure': '/1', 'fields': ['department']}])
+        self.assertIn(': keep-alive\n\n', messages[2:])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, ChangeLogEntry, upgrade_db_schema
+from backend.snapshots import store_snapshot_records
+from backend.change_log import record_node_changes, record_table_reset, current_version, changes_since
+from backend.bulk_updates import bulk_update_person
+from backend.relocations import move_subtree_across_tables
+
+class TestChangeLog(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        self.table_id = table.id
+        store_snapshot_records(self.session, self.table_id, [
+            {'hierarchical_structure': structure, 'upload_date': date(2024, 1, 1), 'person_id': person_id, 'name': name}
+            for structure, person_id, name in [('/1', '1', 'Alice'), ('/1/1', '2', 'Bob'), ('/1/2', '3', 'Carol'),
+                                               ('/1/2/1', '4', 'Dan')]
+        ])
+        record_table_reset(self.session, self.table_id)
+        self.session.commit()
+        self.version = current_version(self.session, self.table_id)
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_no_changes_since_current_version(self):
+        changes = changes_since(self.session, self.table_id, self.version)
+        self.assertEqual((changes['version'], changes['reset'], changes['changes']), (self.version, False, []))
+
+    def test_reset_after_table_rewrite_or_unknown_version(self):
+        self.assertTrue(changes_since(self.session, self.table_id, 0)['reset'])
+        self.assertTrue(changes_since(self.session, self.table_id, self.version + 1)['reset'])
+
+    def test_person_update_is_reported_once_with_current_state(self):
+        bulk_update_person(self.session, [self.table_id], '2', {'name': 'Robert'})
+        bulk_update_person(self.session, [self.table_id], '2', {'role': 'Lead'})
+
+        changes = changes_since(self.session, self.table_id, self.version)
+
+        self.assertFalse(changes['reset'])
+        self.assertEqual(changes['version'], current_version(self.session, self.table_id))
+        self.assertEqual([(change['hierarchical_structure'], change['operation']) for change in changes['changes']],
+                         [('/1/1', 'upsert')])
+        self.assertEqual((changes['changes'][0]['node']['name'], changes['changes'][0]['node']['role']), ('Robert', 'Lead'))
+        self.assertEqual(changes['changes'][0]['node']['upload_date'], '2024-01-01')
+        self.assertEqual(changes['changes'][0]['fields'], ['name', 'role'])
+
+    def test_subtree_move_deletes_old_and_upserts_new_structures(self):
+        move_subtree_across_tables(self.session, [self.table_id], '/1/2', '/1/1')
+
+        changes = changes_since(self.session, self.table_id, self.version)['changes']
+
+        operations = {change['hierarchical_structure']: change['operation'] for change in changes}
+        self.assertEqual(operations, {'/1/2': 'delete', '/1/2/1': 'delete', '/1/1/1': 'upsert', '/1/1/1/1': 'upsert'})
+        self.assertEqual([change['version'] for change in changes], sorted(change['version'] for change in changes))
+        self.assertTrue(all(change['fields'] == ['hierarchical_structure'] for change in changes))
+
+    def test_too_many_changes_ask_for_reset(self):
+        record_node_changes(self.session, [(self.table_id, '/1/1'), (self.table_id, '/1/2')])
+        self.session.commit()
+
+        self.assertTrue(changes_since(self.session, self.table_id, self.version, max_changes=1)['reset'])
+        self.assertFalse(changes_since(self.session, self.table_id, self.version, max_changes=2)['reset'])
+        self.assertIsNone(changes_since(self.session, self.table_id, self.version)['changes'][0]['fields'])
+
+    def test_versions_are_not_reused(self):
+        record_node_changes(self.session, [(self.table_id, '/1/1')])
+        self.session.commit()
+        latest = current_version(self.session, self.table_id)
+        self.session.query(ChangeLogEntry).filter_by(id=latest).delete()
+        record_node_changes(self.session, [(self.table_id, '/1/2')])
+        self.session.commit()
+
+        self.assertGreater(current_version(self.session, self.table_id), latest)
+
+if __name__ == '__main__':
+    unittest.main()
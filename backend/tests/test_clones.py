@@ -0,0 +1,111 @@
+import unittest
+import pytest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, DeltaEntry, upgrade_db_schema
+from backend.snapshots import load_snapshot_entries, folder_snapshots
+from backend.report_cache import consecutive_pairs
+from backend.search_index import tables_candidate_ids
+from backend.bulk_updates import bulk_update_person
+from backend.edit_batches import apply_edit_batch
+from backend.clones import clone_table
+
+@pytest.mark.usefixtures('snapshot_tables')
+class TestCloneTable(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Test Folder', storage_mode='delta')
+        self.session.add(self.folder)
+        self.session.flush()
+        rows = [('/1', '1', 'Alice'), ('/1/1', '2', 'Bob'), ('/1/2', '3', 'Carol'), ('/1/3', '5', 'Erin')]
+        self.full_id = self.add_table(date(2024, 1, 1), rows)
+        self.delta_id = self.add_table(date(2024, 2, 1), rows[:3] + [('/1/3', '4', 'Dan')])
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def names(self, table_id):
+        return {entry.hierarchical_structure: entry.name for entry in load_snapshot_entries(self.session, table_id)}
+
+    def test_copy_has_the_same_rows(self):
+        self.assertEqual(self.session.get(Table, self.delta_id).storage_mode, 'delta')
+        for source_id in (self.full_id, self.delta_id):
+            clone = clone_table(self.session, source_id)
+            self.session.commit()
+
+            self.assertEqual((clone.storage_mode, clone.upload_date), ('full', self.session.get(Table, source_id).upload_date))
+            self.assertEqual(self.names(clone.id), self.names(source_id))
+        matches = self.session.execute(tables_candidate_ids(self.session, [clone.id], ['dan'], ['name'])).scalars().all()
+        self.assertEqual(len(matches), 1)
+
+    def test_reference_shares_rows(self):
+        clone = clone_table(self.session, self.full_id, 'What if', 'reference')
+        self.session.commit()
+        self.assertEqual((clone.name, clone.storage_mode, clone.base_table_id), ('What if', 'delta', self.full_id))
+        self.assertEqual(self.session.query(DeltaEntry).filter_by(table_id=clone.id).count(), 0)
+        self.assertEqual(self.names(clone.id), self.names(self.full_id))
+
+        delta_clone = clone_table(self.session, self.delta_id, mode='reference')
+        self.session.commit()
+        self.assertEqual(delta_clone.base_table_id, self.full_id)
+        self.assertEqual(self.names(delta_clone.id), self.names(self.delta_id))
+
+    def test_reference_falls_back_to_copy_on_long_chains(self):
+        with patch('backend.clones.KEYFRAME_INTERVAL', 0):
+            clone = clone_table(self.session, self.delta_id, mode='reference')
+        self.assertEqual(clone.storage_mode, 'full')
+        self.assertEqual(self.names(clone.id), self.names(self.delta_id))
+
+    def test_clone_keeps_its_rows_when_the_source_changes(self):
+        clone = clone_table(self.session, self.full_id, mode='reference')
+        self.session.commit()
+
+        bulk_update_person(self.session, [self.full_id], '2', {'name': 'Robert'})
+
+        self.assertEqual(self.names(clone.id)['/1/1'], 'Bob')
+        self.assertEqual(self.names(self.full_id)['/1/1'], 'Robert')
+
+    def test_edits_to_a_reference_clone_copy_on_write(self):
+        clone = clone_table(self.session, self.full_id, mode='reference')
+        rows, error = apply_edit_batch(self.session, clone.id, [
+            {'operation': 'update', 'person_id': '2', 'name': 'Robert'},
+            {'operation': 'move', 'person_id': '3', 'parent_person_id': '2'}
+        ])
+
+        self.assertIsNone(error)
+        self.assertEqual(self.names(clone.id), {'/1': 'Alice', '/1/1': 'Robert', '/1/1/1': 'Carol', '/1/3': 'Erin'})
+        self.assertEqual(self.names(self.full_id), {'/1': 'Alice', '/1/1': 'Bob', '/1/2': 'Carol', '/1/3': 'Erin'})
+        self.assertEqual(self.session.query(DeltaEntry).filter_by(table_id=clone.id).count(), 3)
+
+    def test_clones_stay_out_of_the_folder_series(self):
+        clone = clone_table(self.session, self.delta_id, 'What if', 'reference')
+        apply_edit_batch(self.session, clone.id, [{'operation': 'update', 'person_id': '2', 'name': 'Robert'}])
+        self.assertEqual(clone.clone_of_id, self.delta_id)
+        self.assertEqual({row.upload_date for row in self.session.query(DeltaEntry).filter_by(table_id=clone.id)}, {clone.upload_date})
+
+        next_id = self.add_table(date(2024, 3, 1), [('/1', '1', 'Alice'), ('/1/1', '2', 'Bob'), ('/1/2', '3', 'Carol')])
+        upload = self.session.get(Table, next_id)
+        self.assertEqual(upload.base_table_id, self.delta_id)
+        self.assertEqual([t.id for t in folder_snapshots(self.session, self.folder.id)], [self.full_id, self.delta_id, next_id])
+        self.assertEqual([(earlier.id, later.id) for earlier, later in consecutive_pairs(self.session, upload)], [(self.delta_id, next_id)])
+        self.assertEqual(consecutive_pairs(self.session, clone), [])
+
+    def test_invalid_edits_roll_the_clone_back(self):
+        tables = self.session.query(Table).count()
+        clone = clone_table(self.session, self.full_id)
+        rows, error = apply_edit_batch(self.session, clone.id, [{'operation': 'update', 'person_id': '99', 'name': 'Nobody'}])
+
+        self.assertIsNotNone(error)
+        self.assertEqual(self.session.query(Table).count(), tables)
+        self.assertEqual(self.session.query(DataEntry).filter(DataEntry.table_id > self.delta_id).count(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
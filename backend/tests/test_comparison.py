@@ -0,0 +1,90 @@
+import unittest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry
+from backend.comparison import diff_tables, profile_table
+
+class TestComparison(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        self.folder_id = folder.id
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def add_table(self, rows, birth_dates=()):
+        table = Table(name='snapshot.csv', folder_id=self.folder_id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        for index, (structure, person_id, name, role) in enumerate(rows):
+            self.session.add(DataEntry(
+                table_id=table.id, hierarchical_structure=structure, upload_date=date(2024, 1, 1),
+                person_id=person_id, name=name, role=role, department='Eng', rank='1',
+                birth_date=birth_dates[index] if index < len(birth_dates) else None
+            ))
+        self.session.flush()
+        return table.id
+
+    def test_diff_by_person_id(self):
+        before = self.add_table([('/1', '1', 'Alice', 'CEO'), ('/1/1', '2', 'Bob', 'CTO'), ('/1/2', '3', 'Carol', 'CFO')])
+        after = self.add_table([('/1', '1', 'Alice', 'CEO'), ('/1/1', '2', 'Bob', 'VP'), ('/1/3', '4', 'Dan', 'CFO')])
+
+        changes = diff_tables(self.session, before, after)
+
+        self.assertEqual([entry['name'] for entry in changes['added']], ['Dan'])
+        self.assertEqual([entry['name'] for entry in changes['removed']], ['Carol'])
+        self.assertEqual(changes['role_changes'], {'2': {'name': 'Bob', 'old': 'CTO', 'new': 'VP'}})
+        self.assertEqual(len(changes['changed']), 1)
+
+    def test_vacant_and_duplicate_person_ids_are_not_collapsed(self):
+        before = self.add_table([('/1', '1', 'Alice', 'CEO'), ('/1/1', 'nan', 'nan', 'Open'), ('/1/2', 'nan', 'nan', 'Open'),
+                                 ('/1/3', '7', 'Eve', 'Eng'), ('/1/4', '7', 'Eve', 'Lead')])
+        after = self.add_table([('/1', '1', 'Alice', 'CEO'), ('/1/1', 'nan', 'nan', 'Open'), ('/1/2', 'nan', 'nan', 'Closed'),
+                                ('/1/3', '7', 'Eve', 'Eng')])
+
+        changes = diff_tables(self.session, before, after)
+
+        self.assertEqual(changes['role_changes'], {'/1/2': {'name': 'nan', 'old': 'Open', 'new': 'Closed'}})
+        self.assertEqual([entry['hierarchical_structure'] for entry in changes['removed']], ['/1/3', '/1/4'])
+        self.assertEqual([entry['hierarchical_structure'] for entry in changes['added']], ['/1/3'])
+
+    def test_people_are_matched_next_to_several_null_person_ids(self):
+        before = self.add_table([('/1', '1', 'Alice', 'CEO'), ('/1/1', None, 'nan', 'Open'), ('/1/2', None, 'nan', 'Open'),
+                                 ('/1/3', '2', 'Bob', 'Eng')])
+        after = self.add_table([('/1', '1', 'Alice', 'CEO'), ('/1/1', None, 'nan', 'Open'), ('/1/2', None, 'nan', 'Open'),
+                                ('/1/1/1', '2', 'Bob', 'Eng')])
+
+        changes = diff_tables(self.session, before, after)
+
+        self.assertEqual((changes['added'], changes['removed']), ([], []))
+        self.assertEqual(changes['reporting_line_changes'], {'2': {'name': 'Bob', 'old': '/1/3', 'new': '/1/1/1'}})
+
+    def test_profile_table(self):
+        table_id = self.add_table([('/1', '1', 'Alice', 'CEO'), ('/1/1', '2', 'Bob', 'CTO'), ('/1/2', '3', 'Carol', None),
+                                   ('/1/1/1', '4', 'Dan', 'CTO')],
+                                  [date(1970, 5, 1), date(1980, 1, 1), date(1990, 1, 1)])
+
+        profile = profile_table(self.session, table_id)
+
+        current_year = date.today().year
+        self.assertEqual(profile['total'], 4)
+        self.assertEqual(profile['rank_counts'], {'1': 4})
+        self.assertEqual(profile['unique_roles'], 3)
+        self.assertEqual(profile['max_depth'], 4)
+        self.assertEqual(profile['average_span'], 1.5)
+        self.assertEqual(profile['age_distribution'], {
+            "average": (3 * current_year - 1970 - 1980 - 1990) / 3, "min": current_year - 1990,
+            "max": current_year - 1970, "median": current_year - 1980
+        })
+
+if __name__ == '__main__':
+    unittest.main()
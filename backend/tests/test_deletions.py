@@ -0,0 +1,106 @@
+import unittest
+import unittest.mock
+import pytest
+import os
+import tempfile
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, DeltaEntry, ComparisonReport, ChangeLogEntry, upgrade_db_schema
+from backend.snapshots import load_snapshot_entries, folder_snapshots
+from backend.deletions import delete_tables, reclaim_space
+
+@pytest.mark.usefixtures('snapshot_tables')
+class TestDeletions(unittest.TestCase):
+    log_snapshot_reset = True
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory.name, 'test.db')}")
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Test Folder', storage_mode='delta')
+        self.session.add(self.folder)
+        self.session.flush()
+        rows = [('/1', '0', 'Root')] + [(f'/1/{index}', str(index), f'Person {index}' * 20) for index in range(1, 400)]
+        self.tables = [
+            self.add_table(date(2024, 1, 1), rows),
+            self.add_table(date(2024, 2, 1), rows[:-1]),
+            self.add_table(date(2024, 3, 1), rows[:-2])
+        ]
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def test_deleting_a_base_table_keeps_its_dependents(self):
+        self.assertEqual(self.session.get(Table, self.tables[1]).base_table_id, self.tables[0])
+        before = sorted(entry.hierarchical_structure for entry in load_snapshot_entries(self.session, self.tables[1]))
+        self.session.add(ComparisonReport(table1_id=self.tables[0], table2_id=self.tables[1], report='{}'))
+        self.session.commit()
+
+        progress = list(delete_tables(self.session, [self.tables[0]], batch_rows=150))
+
+        self.assertEqual([step['phase'] for step in progress[:2]], ['hide', 'rewrite'])
+        self.assertEqual(progress[-1]['rewritten_tables'], [self.tables[1]])
+        self.assertEqual([step['deleted'] for step in progress if step['phase'] == 'data_entries'], [150, 300, 400])
+        self.assertEqual(progress[-1]['deleted_rows'], {'data_entries': 400, 'delta_entries': 0})
+        self.assertIsNone(self.session.get(Table, self.tables[0]))
+        self.assertEqual(self.session.get(Table, self.tables[1]).storage_mode, 'full')
+        self.assertEqual(sorted(entry.hierarchical_structure for entry in load_snapshot_entries(self.session, self.tables[1])), before)
+        self.assertEqual(self.session.query(ComparisonReport).count(), 0)
+        self.assertEqual(self.session.query(ChangeLogEntry).filter_by(table_id=self.tables[0]).count(), 0)
+
+    def test_deleting_a_folder_removes_everything(self):
+        progress = list(delete_tables(self.session, self.tables, self.folder.id))
+
+        self.assertEqual(progress[-1]['rewritten_tables'], [])
+        self.assertEqual(progress[-1]['deleted'], 3)
+        for model in (Folder, Table, DataEntry, DeltaEntry, ChangeLogEntry):
+            self.assertEqual(self.session.query(model).count(), 0)
+
+    def test_tables_are_hidden_before_their_rows_are_deleted(self):
+        deletion = delete_tables(self.session, [self.tables[0]], batch_rows=150)
+        self.assertEqual(next(deletion)['phase'], 'hide')
+
+        self.assertEqual(self.session.get(Table, self.tables[0]).deleting, True)
+        with self.assertRaisesRegex(ValueError, 'not found'):
+            load_snapshot_entries(self.session, self.tables[0])
+        self.assertEqual([table.id for table in folder_snapshots(self.session, self.folder.id)], self.tables[1:])
+        self.assertEqual(len(load_snapshot_entries(self.session, self.tables[1])), 399)
+        reset = self.session.query(ChangeLogEntry).filter_by(table_id=self.tables[0]).order_by(ChangeLogEntry.id.desc()).first()
+        self.assertIsNone(reset.hierarchical_structure)
+
+        self.assertEqual(next(deletion), {'phase': 'rewrite', 'table_id': self.tables[1], 'elapsed_ms': unittest.mock.ANY})
+        list(deletion)
+        self.assertIsNone(self.session.get(Table, self.tables[0]))
+
+    def test_reclaim_space_in_steps(self):
+        list(delete_tables(self.session, self.tables, self.folder.id))
+        size_before = os.path.getsize(os.path.join(self.directory.name, 'test.db'))
+
+        progress = list(reclaim_space(self.engine, step_pages=10))
+
+        self.assertGreater(len(progress), 1)
+        self.assertEqual(progress[-1]['free_pages'], 0)
+        self.assertGreater(progress[-1]['reclaimed_bytes'], 0)
+        self.assertLess(os.path.getsize(os.path.join(self.directory.name, 'test.db')), size_before)
+
+    def test_reclaim_space_skips_databases_without_incremental_vacuum(self):
+        engine = create_engine(f"sqlite:///{os.path.join(self.directory.name, 'old.db')}")
+        try:
+            Base.metadata.create_all(engine)
+            self.assertIn('skipped', list(reclaim_space(engine))[0])
+            self.assertTrue(list(reclaim_space(engine, full=True))[0]['full'])
+            with engine.connect() as connection:
+                self.assertEqual(connection.exec_driver_sql("PRAGMA auto_vacuum").scalar(), 2)
+        finally:
+            engine.dispose()
+
+if __name__ == '__main__':
+    unittest.main()
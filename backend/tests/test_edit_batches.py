@@ -0,0 +1,141 @@
+import unittest
+import pytest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, DeltaEntry, ComparisonReport, upgrade_db_schema
+from backend.snapshots import load_snapshot_entries
+from backend.search_index import tables_candidate_ids
+from backend.change_log import changes_since, current_version
+from backend.edit_batches import read_edit_batch, apply_edit_batch
+
+@pytest.mark.usefixtures('snapshot_tables')
+class TestEditBatches(unittest.TestCase):
+    snapshot_columns = ('hierarchical_structure', 'person_id', 'name', 'role')
+    snapshot_values = {'department': 'Engineering'}
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Test Folder', storage_mode='delta')
+        self.session.add(self.folder)
+        self.session.flush()
+        rows = [('/1', '1', 'Alice', 'CEO'), ('/1/1', '2', 'Bob', 'Lead'), ('/1/2', '3', 'Carol', 'Lead'),
+                ('/1/2/1', '4', 'Dan', 'Engineer'), ('/1/2/2', '5', 'Eve', 'Engineer')]
+        self.base_id = self.add_table(date(2024, 1, 1), rows)
+        self.table_id = self.add_table(date(2024, 2, 1), rows)
+        self.version = current_version(self.session, self.table_id)
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def entries(self, table_id=None):
+        return {entry.hierarchical_structure: entry for entry in load_snapshot_entries(self.session, table_id or self.table_id)}
+
+    def test_read_edit_batch(self):
+        content = b"Operation,Person_ID,Role,Parent_Structure\nupdate,007,Lead,\nmove,4,, /1/1 \n"
+        self.assertEqual(read_edit_batch(content, 'csv'), ([
+            {'operation': 'update', 'person_id': '007', 'role': 'Lead', 'parent_structure': None},
+            {'operation': 'move', 'person_id': '4', 'role': None, 'parent_structure': '/1/1'}
+        ], None))
+        self.assertEqual(read_edit_batch(b"person_id\n1\n", 'csv'), (None, "Required column operation is missing"))
+        self.assertEqual(read_edit_batch(b"operation,salary\nupdate,1\n", 'csv'), (None, "Unknown column(s): salary"))
+
+    def test_batch_is_applied_in_order_in_one_transaction(self):
+        self.session.add(ComparisonReport(table1_id=self.table_id - 1, table2_id=self.table_id, report='{}'))
+        self.session.commit()
+
+        rows, error = apply_edit_batch(self.session, self.table_id, [
+            {'operation': 'update', 'person_id': '2', 'role': 'Director', 'birth_date': '1980-02-01'},
+            {'operation': 'move', 'person_id': '3', 'parent_person_id': '2'},
+            {'operation': 'create', 'parent_structure': '/1/1/1', 'role': 'Analyst', 'name': 'Vacancy'},
+            {'operation': 'update', 'hierarchical_structure': '/1/1/1/1', 'person_id': '44'}
+        ])
+
+        self.assertIsNone(error)
+        self.assertEqual([(row['row'], row['status'], row['hierarchical_structure']) for row in rows],
+                         [(2, 'applied', '/1/1'), (3, 'applied', '/1/1/1'), (4, 'applied', '/1/1/1/3'), (5, 'applied', '/1/1/1/1')])
+        self.assertEqual(rows[1]['previous_hierarchical_structure'], '/1/2')
+        entries = self.entries()
+        self.assertEqual({structure: entry.name for structure, entry in entries.items()},
+                         {'/1': 'Alice', '/1/1': 'Bob', '/1/1/1': 'Carol', '/1/1/1/1': 'Dan', '/1/1/1/2': 'Eve', '/1/1/1/3': 'Vacancy'})
+        self.assertEqual((entries['/1/1'].role, entries['/1/1'].birth_date), ('Director', date(1980, 2, 1)))
+        self.assertEqual(entries['/1/1/1/1'].person_id, '44')
+        self.assertEqual((entries['/1/1/1/3'].person_id, entries['/1/1/1/3'].upload_date), ('nan', date(2024, 2, 1)))
+        self.assertEqual(self.session.query(ComparisonReport).count(), 0)
+        # The delta is edited copy-on-write, leaving its base alone
+        self.assertEqual(self.session.get(Table, self.table_id).storage_mode, 'delta')
+        self.assertEqual(self.session.query(DeltaEntry).filter_by(table_id=self.table_id, operation='delete').count(), 3)
+        self.assertEqual({structure: entry.name for structure, entry in self.entries(self.base_id).items()},
+                         {'/1': 'Alice', '/1/1': 'Bob', '/1/2': 'Carol', '/1/2/1': 'Dan', '/1/2/2': 'Eve'})
+
+        changes = changes_since(self.session, self.table_id, self.version)
+        operations = {change['hierarchical_structure']: change['operation'] for change in changes['changes']}
+        self.assertEqual(operations['/1/2'], 'delete')
+        self.assertEqual(operations['/1/1/1/3'], 'upsert')
+
+    def test_invalid_rows_apply_nothing(self):
+        before = {structure: (entry.name, entry.role) for structure, entry in self.entries().items()}
+
+        rows, error = apply_edit_batch(self.session, self.table_id, [
+            {'operation': 'update', 'person_id': '2', 'role': 'Director'},
+            {'operation': 'move', 'person_id': '3', 'parent_structure': '/1/2/1'},
+            {'operation': 'update', 'person_id': '99', 'role': 'Lead'},
+            {'operation': 'create', 'parent_structure': '/1'},
+            {'operation': 'update', 'person_id': '4', 'birth_date': 'soon'},
+            {'operation': 'promote', 'person_id': '4'}
+        ])
+
+        self.assertIn('5 invalid row(s), the first at row 3', error)
+        self.assertEqual([row['status'] for row in rows], ['not_applied'] + ['error'] * 5)
+        self.assertEqual([row['error'] for row in rows[1:]], [
+            "A node cannot be moved under itself or one of its descendants",
+            "Node with person ID 99 not found",
+            "A new position needs a role",
+            "Invalid date format for birth_date. Use YYYY-MM-DD",
+            "Invalid operation. Use one of: update, move, create"
+        ])
+        self.assertEqual({structure: (entry.name, entry.role) for structure, entry in self.entries().items()}, before)
+        self.assertEqual(self.session.get(Table, self.table_id).storage_mode, 'delta')
+
+    def test_subtrees_can_swap_parents_in_a_full_table(self):
+        rows, error = apply_edit_batch(self.session, self.base_id, [
+            {'operation': 'move', 'hierarchical_structure': '/1/2/1', 'parent_structure': '/1/1'},
+            {'operation': 'move', 'hierarchical_structure': '/1/2', 'parent_structure': '/1/1'},
+            {'operation': 'move', 'hierarchical_structure': '/1/1/2', 'parent_structure': '/1'},
+            {'operation': 'create', 'parent_structure': '/1', 'role': 'Analyst'}
+        ])
+
+        self.assertIsNone(error)
+        self.assertEqual([row['hierarchical_structure'] for row in rows], ['/1/1/1', '/1/1/2', '/1/2', '/1/3'])
+        self.assertEqual({structure: entry.name for structure, entry in self.entries(self.base_id).items()},
+                         {'/1': 'Alice', '/1/1': 'Bob', '/1/1/1': 'Dan', '/1/2': 'Carol', '/1/2/2': 'Eve', '/1/3': 'nan'})
+        self.assertEqual(self.session.query(DataEntry).filter(DataEntry.hierarchical_structure.like('#%')).count(), 0)
+        matches = self.session.execute(tables_candidate_ids(self.session, [self.base_id], ['analyst'], ['role'])).scalars().all()
+        self.assertEqual(len(matches), 1)
+        # The delta stored against the table was rewritten first, so it kept its rows
+        self.assertEqual(self.session.get(Table, self.table_id).storage_mode, 'full')
+        self.assertEqual(self.entries()['/1/2/1'].name, 'Dan')
+
+    def test_move_leaves_a_sibling_that_sorts_inside_the_subtree(self):
+        # '/1/2.5' sorts between '/1/2' and its child '/1/2/1'
+        table_id = self.add_table(date(2024, 3, 1), [('/1', '1', 'Alice', 'CEO'), ('/1/2', '3', 'Carol', 'Lead'),
+                                                      ('/1/2.5', '6', 'Frank', 'Lead'), ('/1/2/1', '4', 'Dan', 'Engineer'),
+                                                      ('/1/3', '7', 'Grace', 'Lead')])
+
+        rows, error = apply_edit_batch(self.session, table_id, [
+            {'operation': 'move', 'hierarchical_structure': '/1/2', 'parent_structure': '/1/3'},
+            {'operation': 'create', 'parent_structure': '/1', 'role': 'Analyst'}
+        ])
+
+        self.assertIsNone(error)
+        self.assertEqual([row['hierarchical_structure'] for row in rows], ['/1/3/1', '/1/A'])
+        self.assertEqual({structure: entry.name for structure, entry in self.entries(table_id).items()},
+                         {'/1': 'Alice', '/1/2.5': 'Frank', '/1/3': 'Grace', '/1/3/1': 'Carol', '/1/3/1/1': 'Dan', '/1/A': 'nan'})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry
+from backend.facets import facet_counts
+
+class TestFacets(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        rows = [('Engineering', 'Engineer', '3'), ('Engineering', 'Engineer', '2'), ('Engineering', 'Lead', '4'),
+                ('Sales', 'Engineer', '3'), ('Finance', 'Analyst', '3'), (None, 'Analyst', '1')]
+        for index, (department, role, rank) in enumerate(rows):
+            self.session.add(DataEntry(table_id=table.id, hierarchical_structure=f'/1/{index}', upload_date=date(2024, 1, 1),
+                                       department=department, role=role, rank=rank))
+        self.session.flush()
+        self.query = self.session.query(DataEntry).filter(DataEntry.table_id == table.id)
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_counts_every_facet(self):
+        facets = facet_counts(self.session, self.query, ['department', 'role'])
+
+        self.assertEqual(facets['department'], {
+            "values": [{"value": 'Engineering', "count": 3}, {"value": 'Finance', "count": 1},
+                       {"value": 'Sales', "count": 1}, {"value": None, "count": 1}],
+            "distinct": 4,
+            "other": 0
+        })
+        self.assertEqual(facets['role']['values'][0], {"value": 'Engineer', "count": 3})
+
+    def test_counts_only_matched_rows_and_folds_the_tail(self):
+        facets = facet_counts(self.session, self.query.filter(DataEntry.role == 'Engineer'), ['rank', 'department'], max_values=1)
+
+        self.assertEqual(facets['rank'], {"values": [{"value": '3', "count": 2}], "distinct": 2, "other": 1})
+        self.assertEqual(facets['department'], {"values": [{"value": 'Engineering', "count": 2}], "distinct": 2, "other": 1})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+import pytest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, upgrade_db_schema
+from backend.app import search_folder_tables
+
+@pytest.mark.usefixtures('snapshot_tables')
+class TestFolderSearch(unittest.TestCase):
+    snapshot_columns = ('hierarchical_structure', 'person_id', 'name', 'department')
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Test Folder', storage_mode='delta')
+        self.session.add(self.folder)
+        self.session.flush()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_groups_matches_by_person_across_storage_modes(self):
+        self.add_table(date(2024, 1, 1), [('/1', '1', 'Alice', 'Sales'), ('/1/1', '2', 'Bob', 'Engineering'),
+                                          ('/1/2', 'nan', 'nan', 'Engineering')])
+        self.add_table(date(2024, 2, 1), [('/1', '1', 'Alice', 'Engineering'), ('/1/1', '2', 'Bob', 'Engineering'),
+                                          ('/1/2', 'nan', 'nan', 'Engineering')])
+        tables = self.session.query(Table).order_by(Table.upload_date).all()
+        self.assertEqual([table.storage_mode for table in tables], ['full', 'delta'])
+
+        groups = list(search_folder_tables(self.session, tables, 'engineer', ['department']))
+
+        self.assertEqual([(group['person_id'], group['name'], group['snapshot_count']) for group in groups],
+                         [('1', 'Alice', 1), ('2', 'Bob', 2), (None, 'nan', 2)])
+        self.assertEqual(groups[0]['matches'][0]['upload_date'], '2024-02-01')
+        self.assertEqual(groups[1]['matches'][0]['matched_columns'], ['department'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table
+from backend.snapshots import store_snapshot_records
+from backend.autocomplete import PrefixIndex, build_table_completions
+from backend.fuzzy_search import TrigramIndex, bounded_distance, allowed_distance, fuzzy_search_table
+
+NAMES = {'Mohammed Al-Hassan': 1, 'Muhammad Hassan': 2, 'Jonathan Smith': 1, 'Yonatan Cohen': 1, 'Bob': 1, 'Unit 42': 1}
+
+class TestTrigramIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.index = TrigramIndex(list(NAMES), list(NAMES.values()))
+
+    def search(self, query, max_distance=2):
+        return {self.index.values[value_id]: distance for value_id, distance in self.index.search(query, max_distance).items()}
+
+    def test_bounded_distance(self):
+        self.assertEqual(bounded_distance('muhammad', 'mohammed', 2), 2)
+        self.assertEqual(bounded_distance('kitten', 'sitting', 2), 3)
+        self.assertEqual(bounded_distance('abc', 'abcdef', 2), 3)
+        self.assertEqual(bounded_distance('same', 'same', 0), 0)
+
+    def test_allowed_distance(self):
+        self.assertEqual([allowed_distance(token, 2) for token in ['bob', 'jhon', 'hassan', 'jonathan', '12345']], [0, 1, 1, 2, 0])
+        self.assertEqual(allowed_distance('jonathan', 1), 1)
+
+    def test_search_tolerates_typos_and_transliterations(self):
+        self.assertEqual(self.search('Muhamed Hasan'), {'Muhammad Hassan': 3, 'Mohammed Al-Hassan': 3})
+        self.assertEqual(self.search('Muhammad'), {'Muhammad Hassan': 0, 'Mohammed Al-Hassan': 2})
+        self.assertEqual(self.search('jonatan smth'), {'Jonathan Smith': 2})
+        self.assertEqual(self.search('muhamad', max_distance=0), {})
+        self.assertEqual(self.search('bbo'), {})
+        self.assertEqual(self.search('unit 43'), {})
+        self.assertEqual(self.search('unit 42'), {'Unit 42': 0})
+
+    def test_follows_prefix_index_edits(self):
+        prefix_index = PrefixIndex(dict(NAMES))
+        prefix_index.trigrams = self.index
+        prefix_index.add('Jonathan Smith', -1)
+        prefix_index.add('Jonathon Smyth', 1)
+        prefix_index.add('Muhammad Hassan', -1)
+
+        self.assertEqual(self.search('jonathan smith'), {'Jonathon Smyth': 2})
+        self.assertEqual(self.index.counts[self.index.ids['Muhammad Hassan']], 1)
+
+class TestFuzzySearchTable(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        self.table_id = table.id
+        store_snapshot_records(self.session, self.table_id, [
+            {'hierarchical_structure': '/1', 'upload_date': date(2024, 1, 1), 'person_id': '1', 'name': 'Muhammad Hassan', 'role': 'Director'},
+            {'hierarchical_structure': '/1/1', 'upload_date': date(2024, 1, 1), 'person_id': '2', 'name': 'Mohammed Al-Hassan', 'role': 'Engineer'},
+            {'hierarchical_structure': '/1/2', 'upload_date': date(2024, 1, 1), 'person_id': '3', 'name': 'Dana Levi', 'role': 'Engineer'},
+            {'hierarchical_structure': '/1/3', 'upload_date': date(2024, 1, 1), 'person_id': '4', 'name': 'Dan Levy', 'role': 'Enginer'}
+        ])
+        self.session.commit()
+        build_table_completions(self.session, self.table_id)
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_results_are_ranked_by_score(self):
+        results, total = fuzzy_search_table(self.session, self.table_id, 'Mohammed Hasan', ['name', 'role'])
+
+        self.assertEqual(total, 2)
+        self.assertEqual([(result['person_id'], result['score']) for result in results], [('2', 0.923), ('1', 0.769)])
+        self.assertEqual(results[0]['matched_columns'], ['name'])
+
+    def test_limit_keeps_the_best_values(self):
+        results, total = fuzzy_search_table(self.session, self.table_id, 'engineer', ['role'], limit=2)
+
+        self.assertEqual(total, 3)
+        self.assertEqual([(result['person_id'], result['score']) for result in results], [('2', 1.0), ('3', 1.0)])
+
+if __name__ == '__main__':
+    unittest.main()
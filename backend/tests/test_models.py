@@ -1,7 +1,15 @@
 import unittest
-from sqlalchemy import create_engine
+import os
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
-from backend.models import Session, Folder, Table, DataEntry, Base
+from unittest.mock import patch
+from backend.models import (Session, Folder, Table, DataEntry, Base, set_db_path, init_db, get_session, dispose_db,
+                            get_database, database_options, bind_request_database, release_request_database,
+                            begin_write_transaction)
+from backend.change_log import record_table_reset
 
 class TestModels(unittest.TestCase):
 
@@ -23,5 +31,112 @@ class TestModels(unittest.TestCase):
         self.assertIsNotNone(retrieved)
         self.assertEqual(retrieved.name, 'Test Folder')
 
+class TestDatabaseContext(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.paths = [os.path.join(self.directory.name, name) for name in ('first.db', 'second.db')]
+        for path in self.paths:
+            set_db_path(path)
+            init_db()
+            session = get_session()
+            session.add(Folder(name=os.path.basename(path)))
+            session.commit()
+            session.close()
+
+    def tearDown(self):
+        dispose_db()
+        self.directory.cleanup()
+
+    def folder_names(self):
+        session = get_session()
+        try:
+            return [folder.name for folder in session.query(Folder)]
+        finally:
+            session.close()
+
+    def in_thread(self, target, *args):
+        # A new thread starts with an empty context, like a request on another worker
+        results = []
+        thread = threading.Thread(target=lambda: results.append(target(*args)))
+        thread.start()
+        thread.join()
+        return results[0]
+
+    def test_requests_keep_their_database_when_another_is_selected(self):
+        set_db_path(self.paths[0])
+        token = bind_request_database()
+        try:
+            self.in_thread(set_db_path, self.paths[1])
+
+            self.assertEqual(self.folder_names(), ['first.db'])
+            self.assertEqual(self.in_thread(self.folder_names), ['second.db'])
+        finally:
+            release_request_database(token)
+        self.assertEqual(self.folder_names(), ['second.db'])
+
+    def test_selecting_in_a_request_switches_that_request(self):
+        set_db_path(self.paths[0])
+        token = bind_request_database()
+        try:
+            set_db_path(self.paths[1])
+            self.assertEqual(self.folder_names(), ['second.db'])
+        finally:
+            release_request_database(token)
+
+    def test_read_only_requests_read_from_the_replica(self):
+        with patch.dict(database_options, replica=True):
+            set_db_path(os.path.join(self.directory.name, 'replicated.db'))
+        init_db()
+        replica = get_database().replica
+        for _ in range(100):
+            if replica.stats()['loaded'] and not replica.stats()['pending_writes']:
+                break
+            time.sleep(0.05)
+
+        token = bind_request_database(read_only=True)
+        try:
+            session = get_session()
+            self.assertIn('replica_keeper', session.info)
+            session.add(Folder(name='written'))
+            record_table_reset(session, 1)
+            session.commit()
+            session.close()
+            # The next read waits for the replica to include the write
+            self.assertEqual(self.folder_names(), ['written'])
+        finally:
+            release_request_database(token)
+        session = get_session()
+        self.assertNotIn('replica_keeper', session.info)
+        session.close()
+
+    def test_readers_are_not_blocked_by_a_writer(self):
+        set_db_path(self.paths[0])
+        writer = get_session()
+        self.assertEqual(writer.execute(text("PRAGMA journal_mode")).scalar(), 'wal')
+        begin_write_transaction(writer)
+        writer.add(Folder(name='pending'))
+        writer.flush()
+
+        self.assertEqual(self.folder_names(), ['first.db'])
+
+        second_writer_done = threading.Event()
+        def write():
+            session = get_session()
+            begin_write_transaction(session)
+            session.add(Folder(name='queued'))
+            session.commit()
+            session.close()
+            second_writer_done.set()
+        thread = threading.Thread(target=write)
+        thread.start()
+        time.sleep(0.2)
+        # The second writer waits for the write lock instead of failing
+        self.assertFalse(second_writer_done.is_set())
+        writer.commit()
+        writer.close()
+        thread.join()
+        self.assertEqual(self.folder_names(), ['first.db', 'pending', 'queued'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry
+from backend import pagination
+from backend.pagination import encode_cursor, decode_cursor, keyset_page, split_page, count_results
+
+class TestPagination(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        for index in range(7):
+            self.session.add(DataEntry(table_id=table.id, hierarchical_structure=f'/1/{index}', upload_date=date(2024, 1, 1)))
+        self.session.flush()
+        self.query = self.session.query(DataEntry.hierarchical_structure).filter(DataEntry.table_id == table.id)
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor('/1/2/ש')), '/1/2/ש')
+        with self.assertRaises(ValueError):
+            decode_cursor('not a cursor')
+
+    def test_pages_cover_all_rows_once(self):
+        seen, after = [], None
+        while True:
+            rows = keyset_page(self.query, DataEntry.hierarchical_structure, after, 3).all()
+            page, cursor = split_page(rows, 3, lambda row: row.hierarchical_structure)
+            seen.extend(row.hierarchical_structure for row in page)
+            if cursor is None:
+                break
+            after = decode_cursor(cursor)
+
+        self.assertEqual(seen, [f'/1/{index}' for index in range(7)])
+
+    def test_count_results(self):
+        self.assertEqual(count_results(self.session, self.query, 'exact'), (7, True))
+        self.assertEqual(count_results(self.session, self.query, 'none'), (None, False))
+        with patch.object(pagination, 'APPROXIMATE_TOTAL_CAP', 5):
+            self.assertEqual(count_results(self.session, self.query, 'approximate'), (5, False))
+
+if __name__ == '__main__':
+    unittest.main()
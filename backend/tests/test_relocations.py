@@ -0,0 +1,132 @@
+import unittest
+import pytest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, ComparisonReport, upgrade_db_schema, SEARCH_UNINDEXED_TABLE
+from backend.snapshots import load_snapshot_entries
+from backend.search_index import tables_candidate_ids
+from backend.utils import next_child_structure
+from backend.relocations import relocate_across_tables, move_subtree_across_tables
+
+@pytest.mark.usefixtures('snapshot_tables')
+class TestRelocateAcrossTables(unittest.TestCase):
+    snapshot_columns = ('hierarchical_structure', 'person_id', 'name', 'role', 'department')
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Test Folder', storage_mode='delta')
+        self.session.add(self.folder)
+        self.session.flush()
+        rows = [('/1', '1', 'Alice', 'CEO', 'Exec'), ('/1/1', '2', 'Bob', 'Lead', 'Sales'),
+                ('/1/2', '3', 'Carol', 'Lead', 'Engineering'), ('/1/2/1', '4', 'Dan', 'Engineer', 'Engineering')]
+        self.tables = [
+            self.add_table(date(2024, 1, 1), rows),
+            self.add_table(date(2024, 2, 1), rows + [('/1/2/2', '5', 'Eve', 'Engineer', 'Engineering')]),
+            self.add_table(date(2024, 3, 1), rows + [('/1/1/1', '6', 'Frank', 'Clerk', 'Sales')])
+        ]
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def structures(self, table_id):
+        return {entry.hierarchical_structure: entry for entry in load_snapshot_entries(self.session, table_id)}
+
+    def test_next_child_structure(self):
+        self.assertEqual(next_child_structure('/1', []), '/1/1')
+        self.assertEqual(next_child_structure('/1', ['1', '3', '2']), '/1/4')
+        self.assertEqual(next_child_structure('/1', ['A', 'C']), '/1/D')
+        self.assertEqual(next_child_structure('/1', ['Z', 'AA']), '/1/AB')
+
+    def test_create_new_in_every_table(self):
+        self.assertEqual([self.session.get(Table, table_id).storage_mode for table_id in self.tables], ['full', 'delta', 'delta'])
+        self.session.add(ComparisonReport(table1_id=self.tables[0], table2_id=self.tables[1], report='{}'))
+        self.session.commit()
+
+        outcomes, error = relocate_across_tables(self.session, self.tables, '/1/2/1', 'create_new', '/1/1', 'Analyst')
+
+        self.assertIsNone(error)
+        new_structures = [outcomes[table_id]['changes']['new_node']['hierarchical_structure'] for table_id in self.tables]
+        self.assertEqual(new_structures, ['/1/1/1', '/1/1/1', '/1/1/2'])
+        for table_id, new_structure in zip(self.tables, new_structures):
+            entries = self.structures(table_id)
+            self.assertEqual((entries[new_structure].name, entries[new_structure].role, entries[new_structure].department),
+                             ('Dan', 'Analyst', 'Sales'))
+            self.assertEqual((entries['/1/2/1'].name, entries['/1/2/1'].person_id), ('nan', 'nan'))
+        self.assertEqual(self.session.query(ComparisonReport).count(), 0)
+        matches = self.session.execute(tables_candidate_ids(self.session, self.tables, ['analyst'], ['role'])).scalars().all()
+        self.assertEqual(len(matches), len(self.tables))
+
+    def test_override_in_every_table(self):
+        outcomes, error = relocate_across_tables(self.session, self.tables, '/1/2/1', 'override', '/1/1')
+
+        self.assertIsNone(error)
+        for table_id in self.tables:
+            self.assertIn('update_node', outcomes[table_id]['changes'])
+            entries = self.structures(table_id)
+            self.assertEqual((entries['/1/1'].name, entries['/1/1'].role, entries['/1/1'].department), ('Dan', 'Lead', 'Sales'))
+            self.assertEqual(entries['/1/2/1'].name, 'nan')
+
+    def test_failure_in_one_table_changes_nothing(self):
+        before = [sorted((entry.hierarchical_structure, entry.name) for entry in load_snapshot_entries(self.session, table_id))
+                  for table_id in self.tables]
+
+        outcomes, error = relocate_across_tables(self.session, self.tables, '/1/2/2', 'override', '/1/1')
+
+        self.assertIn('Node with hierarchical structure /1/2/2 not found in table', error)
+        self.assertIn('error', outcomes[self.tables[0]])
+        self.assertEqual(outcomes[self.tables[1]], {"error": "Not updated because the relocation failed in another table"})
+        after = [sorted((entry.hierarchical_structure, entry.name) for entry in load_snapshot_entries(self.session, table_id))
+                 for table_id in self.tables]
+        self.assertEqual(after, before)
+        self.assertEqual(self.session.get(Table, self.tables[1]).storage_mode, 'delta')
+        self.assertEqual(self.session.query(DataEntry).filter_by(name='nan').count(), 0)
+
+    def test_move_subtree_rewrites_descendants(self):
+        outcomes, error = move_subtree_across_tables(self.session, self.tables, '/1/2', '/1/1')
+
+        self.assertIsNone(error)
+        self.assertEqual([outcomes[table_id]['changes']['new_root'] for table_id in self.tables], ['/1/1/1', '/1/1/1', '/1/1/2'])
+        self.assertEqual([outcomes[table_id]['changes']['moved_rows'] for table_id in self.tables], [2, 3, 2])
+        entries = self.structures(self.tables[1])
+        self.assertEqual({structure: entry.name for structure, entry in entries.items()},
+                         {'/1': 'Alice', '/1/1': 'Bob', '/1/1/1': 'Carol', '/1/1/1/1': 'Dan', '/1/1/1/2': 'Eve'})
+        self.assertEqual(entries['/1/1/1'].department, 'Engineering')
+        self.assertIn('/1/1/1', self.structures(self.tables[2]))
+        self.assertEqual(self.structures(self.tables[2])['/1/1/2/1'].name, 'Dan')
+        # The rewritten rows are indexed again rather than left queued for every search
+        self.assertEqual(self.session.execute(text(f"SELECT count(*) FROM {SEARCH_UNINDEXED_TABLE}")).scalar(), 0)
+
+    def test_move_subtree_skips_segments_of_orphans(self):
+        # A row left below a missing node still holds that node's slot
+        self.session.add(DataEntry(table_id=self.tables[0], hierarchical_structure='/1/1/1/1', upload_date=date(2024, 1, 1), name='Orphan'))
+        self.session.commit()
+
+        outcomes, error = move_subtree_across_tables(self.session, self.tables, '/1/2', '/1/1')
+
+        self.assertIsNone(error)
+        self.assertEqual(outcomes[self.tables[0]]['changes']['new_root'], '/1/1/2')
+        self.assertEqual(self.structures(self.tables[0])['/1/1/1/1'].name, 'Orphan')
+
+    def test_move_subtree_checks_conflicts_up_front(self):
+        with patch('backend.relocations.next_child_structure', return_value='/1/1'):
+            outcomes, error = move_subtree_across_tables(self.session, self.tables, '/1/2', '/1/1')
+
+        self.assertEqual(outcomes[self.tables[0]], {"error": f"Hierarchical structure /1/1 already exists in table {self.tables[0]}"})
+        self.assertIn('Subtree was not moved in any table', error)
+        self.assertIn('/1/2/1', self.structures(self.tables[1]))
+
+    def test_move_subtree_under_itself_is_rejected(self):
+        outcomes, error = move_subtree_across_tables(self.session, self.tables, '/1/2', '/1/2/1')
+
+        self.assertEqual(error, "A node cannot be moved under itself or one of its descendants")
+        self.assertEqual(self.structures(self.tables[0])['/1/2/1'].name, 'Dan')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import date
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, ComparisonReport, upgrade_db_schema
+from backend.change_log import record_table_reset
+from backend.replicas import Replica, ReplicaSession
+
+class TestReplica(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.db')
+        self.engine = create_engine(f'sqlite:///{self.path}')
+        with self.engine.connect() as connection:
+            connection.exec_driver_sql("PRAGMA journal_mode = WAL")
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.write(Folder(name='First'))
+        self.replica = Replica(self.engine, poll_seconds=0.05)
+        self.wait_for(lambda: self.replica.stats()['loaded'])
+
+    def tearDown(self):
+        self.replica.close()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def write(self, *objects, logged=True):
+        session = self.Session()
+        session.add_all(objects)
+        if logged:
+            record_table_reset(session, 1)
+        session.commit()
+        session.close()
+
+    def wait_for(self, condition):
+        for _ in range(100):
+            if condition():
+                return
+            time.sleep(0.05)
+        self.fail("Timed out waiting for the replica")
+
+    def folder_names(self):
+        session = self.replica.read_session()
+        self.assertIsInstance(session, ReplicaSession)
+        try:
+            return [folder.name for folder in session.query(Folder).order_by(Folder.id)]
+        finally:
+            session.close()
+
+    def test_reads_see_earlier_writes(self):
+        self.assertEqual(self.folder_names(), ['First'])
+        self.write(Folder(name='Second'))
+
+        self.assertEqual(self.folder_names(), ['First', 'Second'])
+        stats = self.replica.stats()
+        self.assertTrue(stats['loaded'])
+        self.assertGreater(stats['memory_bytes'], 0)
+        self.assertEqual(stats['pending_writes'], 0)
+        self.assertGreaterEqual(stats['refreshes'], 2)
+        self.assertIsNotNone(stats['last_lag_ms'])
+
+    def test_sessions_keep_their_copy_while_it_is_refreshed(self):
+        session = self.replica.read_session()
+        self.write(Folder(name='Second'))
+
+        self.assertEqual(self.folder_names(), ['First', 'Second'])
+        self.assertEqual([folder.name for folder in session.query(Folder)], ['First'])
+        session.close()
+
+    def test_writes_of_replica_sessions_go_to_the_disk(self):
+        session = self.replica.read_session()
+        folder = session.query(Folder).one()
+        session.add(Table(name='t.csv', folder_id=folder.id, upload_date=date(2024, 1, 1)))
+        session.add(ComparisonReport(table1_id=1, table2_id=1, report='{}'))
+        record_table_reset(session, 1)
+        session.commit()
+        session.query(ComparisonReport).filter_by(table1_id=1).delete()
+        session.commit()
+        session.close()
+
+        disk = self.Session()
+        self.assertEqual((disk.query(Table).count(), disk.query(ComparisonReport).count()), (1, 0))
+        disk.close()
+        session = self.replica.read_session()
+        self.assertEqual(session.query(Table).one().name, 't.csv')
+        session.close()
+
+    def test_commits_of_other_connections_are_picked_up(self):
+        refreshes = self.replica.stats()['refreshes']
+        connection = sqlite3.connect(self.path)
+        connection.execute("INSERT INTO folders (name, storage_mode) VALUES ('External', 'full')")
+        connection.execute("INSERT INTO change_log (table_id) VALUES (1)")
+        connection.commit()
+        connection.close()
+
+        self.wait_for(lambda: self.replica.stats()['refreshes'] > refreshes)
+        self.assertEqual(self.folder_names(), ['First', 'External'])
+
+    def test_cache_writes_do_not_refresh_the_replica(self):
+        self.write(Folder(name='Second'))
+        self.wait_for(lambda: not self.replica.stats()['pending_writes'])
+        time.sleep(0.2)
+        refreshes = self.replica.stats()['refreshes']
+
+        self.write(ComparisonReport(table1_id=1, table2_id=2, report='{}'), logged=False)
+        session = self.replica.read_session()
+        self.assertEqual(session.query(ComparisonReport.report).filter_by(table1_id=1).scalar(), '{}')
+        session.close()
+        time.sleep(0.2)
+        self.assertEqual(self.replica.stats()['refreshes'], refreshes)
+
+    def test_databases_over_the_limit_are_read_from_the_disk(self):
+        engine = create_engine(f'sqlite:///{self.path}')
+        replica = Replica(engine, max_bytes=1)
+        try:
+            replica.thread.join(0.5)
+            self.assertIsNone(replica.read_session())
+            self.assertFalse(replica.stats()['loaded'])
+            self.assertIn('larger than the replica limit', replica.stats()['error'])
+        finally:
+            replica.close()
+            engine.dispose()
+
+if __name__ == '__main__':
+    unittest.main()
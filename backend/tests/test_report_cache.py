@@ -0,0 +1,73 @@
+import json
+import unittest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, ComparisonReport
+from backend.report_cache import get_or_build_report, invalidate_table_reports
+from backend.comparison import build_comparison_report
+from backend.change_log import record_node_changes
+
+class TestReportCache(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        self.table1 = self.add_table(folder.id, 'CTO')
+        self.table2 = self.add_table(folder.id, 'VP')
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def add_table(self, folder_id, role):
+        table = Table(name='snapshot.csv', folder_id=folder_id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        for structure, person_id, name, entry_role in [('/1', '1', 'Alice', 'CEO'), ('/1/1', '2', 'Bob', role)]:
+            self.session.add(DataEntry(
+                table_id=table.id, hierarchical_structure=structure, upload_date=date(2024, 1, 1),
+                person_id=person_id, name=name, role=entry_role, department='Eng', rank='1',
+                birth_date=date(1980, 1, 1)
+            ))
+        self.session.flush()
+        return table
+
+    def test_report_is_cached(self):
+        report = get_or_build_report(self.session, self.table1, self.table2)
+
+        self.assertEqual(report['aggregated_report']['role_changes']['total'], 1)
+        self.assertEqual(self.session.query(ComparisonReport).count(), 1)
+        self.assertEqual(get_or_build_report(self.session, self.table1, self.table2), json.loads(json.dumps(report)))
+
+    def test_invalidate_drops_reports_of_table(self):
+        get_or_build_report(self.session, self.table1, self.table2)
+
+        invalidate_table_reports(self.session, self.table2.id)
+
+        self.assertEqual(self.session.query(ComparisonReport).count(), 0)
+
+    def test_report_built_before_an_edit_is_not_stored(self):
+        def build_while_edited(session, table1, table2):
+            report = build_comparison_report(session, table1, table2)
+            # Another request edits the table and invalidates the cache before the report is stored
+            record_node_changes(session, [(table2.id, '/1/1')], ['role'])
+            invalidate_table_reports(session, table2.id)
+            session.commit()
+            return report
+
+        with patch('backend.report_cache.build_comparison_report', side_effect=build_while_edited):
+            get_or_build_report(self.session, self.table1, self.table2)
+
+        self.assertEqual(self.session.query(ComparisonReport).count(), 0)
+        get_or_build_report(self.session, self.table1, self.table2)
+        self.assertEqual(self.session.query(ComparisonReport).count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from datetime import date
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, upgrade_db_schema
+from backend.snapshots import store_snapshot_records
+from backend.search_explain import PhaseTimer, count_vm_steps, query_plan
+from backend.app import search_table_specified_columns
+
+class TestSearchExplain(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        self.table_id = table.id
+        store_snapshot_records(self.session, self.table_id, [
+            {'hierarchical_structure': f'/1/{index}', 'upload_date': date(2024, 1, 1), 'person_id': str(index),
+             'name': f'Person {index}', 'role': 'Engineer' if index % 2 else 'Manager'}
+            for index in range(20)
+        ])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def test_phase_timer(self):
+        timer = PhaseTimer()
+        with timer.phase('sql'):
+            pass
+        with timer.phase('sql'):
+            pass
+        report = timer.report()
+        self.assertEqual(set(report), {'sql', 'total'})
+        self.assertEqual(report['total'], report['sql'])
+
+    def test_count_vm_steps_and_query_plan(self):
+        statement = select(DataEntry.name).where(DataEntry.table_id == self.table_id)
+        count_to = text("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 10000) SELECT count(*) FROM n")
+        with count_vm_steps(self.session) as vm_steps:
+            self.session.execute(count_to).scalar()
+        steps = vm_steps["steps"]
+        self.session.execute(count_to).scalar()
+        self.assertGreater(steps, 10000)
+        self.assertEqual(vm_steps["steps"], steps)
+
+        plan = query_plan(self.session, statement)
+        self.assertTrue(any('data_entries' in step['detail'] for step in plan))
+
+    def test_explain_describes_the_search(self):
+        explain = {}
+        results = search_table_specified_columns(self.session, self.table_id, 'engineer', ['role'], explain=explain)
+
+        self.assertEqual(len(results), 10)
+        self.assertEqual(explain['parsed_query'], ['engineer'])
+        self.assertEqual(explain['search_index'], {"used": True, "match_expression": '{role}: "engineer"'})
+        self.assertEqual((explain['rows_scanned'], explain['rows_returned']), (10, 10))
+        self.assertFalse(explain['rows_scanned_is_upper_bound'])
+        self.assertTrue(any('data_entries_fts' in step['detail'] for step in explain['query_plan']))
+        self.assertEqual(set(explain['timings_ms']), {'parse', 'build', 'sql', 'match', 'hydrate', 'total'})
+
+    def test_explain_counts_the_rows_of_the_page(self):
+        explain = {}
+        results = search_table_specified_columns(self.session, self.table_id, 'engineer', ['role'], limit=4, explain=explain)
+
+        # The extra row tells split_page that a next page exists, and is not returned
+        self.assertEqual(len(results), 5)
+        self.assertEqual(explain['rows_returned'], 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+import os
+import sqlite3
+import tempfile
+from datetime import date
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, upgrade_db_schema, normalize_search_text, SEARCH_FOLDED_TABLE
+from backend.snapshots import store_snapshot_records
+from backend.search_index import compile_fts_query, candidate_ids, index_updated_entries
+
+class TestSearchIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'test.db')
+        self.engine = create_engine(f'sqlite:///{self.path}')
+        Base.metadata.create_all(self.engine)
+        upgrade_db_schema(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        self.table_id = table.id
+        store_snapshot_records(self.session, self.table_id, [
+            {'hierarchical_structure': '/1', 'upload_date': date(2024, 1, 1), 'person_id': '1', 'name': 'Alice', 'role': 'Engineer'},
+            {'hierarchical_structure': '/1/1', 'upload_date': date(2024, 1, 1), 'person_id': '2', 'name': 'Bob', 'role': 'Manager'}
+        ])
+        self.session.commit()
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def candidate_names(self, parsed_query, columns):
+        ids = self.session.execute(candidate_ids(self.session, self.table_id, parsed_query, columns)).scalars().all()
+        return sorted(self.session.get(DataEntry, entry_id).name for entry_id in ids)
+
+    def test_compile_fts_query(self):
+        self.assertEqual(compile_fts_query(['eng'], ['name', 'role']), '{name role}: "eng"')
+        self.assertEqual(compile_fts_query(['eng', 'AND', ['NOT', 'bob']], ['rank']), '{rank_text}: "eng"')
+        self.assertEqual(compile_fts_query(['"Ali ce"', 'OR', 'bob'], ['name']), '({name}: "ali ce" OR {name}: "bob")')
+        self.assertEqual(compile_fts_query(['כֹּהֵן'], ['name']), '{name}: "כהן"')
+        self.assertIsNone(compile_fts_query(['eng', 'OR', 'al'], ['name']))
+        self.assertIsNone(compile_fts_query(['a_b'], ['name']))
+        self.assertIsNone(compile_fts_query(['NOT', 'bob'], ['name']))
+
+    def test_index_follows_inserts_and_updates(self):
+        self.assertEqual(self.candidate_names(['gin'], ['role']), ['Alice'])
+
+        entry = self.session.query(DataEntry).filter_by(name='Bob').one()
+        entry.role = 'Engineering Lead'
+        self.session.flush()
+        # Until writers index it again, an updated row is a candidate of every search
+        self.assertEqual(self.candidate_names(['ager'], ['role']), ['Bob'])
+        index_updated_entries(self.session)
+        self.session.commit()
+
+        self.assertEqual(self.candidate_names(['gin'], ['role']), ['Alice', 'Bob'])
+        self.assertEqual(self.candidate_names(['ager'], ['role']), [])
+
+    def test_normalize_search_text(self):
+        self.assertEqual(normalize_search_text('Engineer'), 'engineer')
+        self.assertEqual(normalize_search_text('דָּוִד \u200fכֹּהֵן'), 'דוד כהן')
+        self.assertEqual(normalize_search_text('Zoë MÜLLER'), 'zoe muller')
+        self.assertIsNone(normalize_search_text(None))
+
+    def test_index_folds_marks_of_rtl_values(self):
+        entry = self.session.query(DataEntry).filter_by(name='Bob').one()
+        entry.name = 'דָּוִד \u200fכֹּהֵן'
+        index_updated_entries(self.session)
+        self.session.commit()
+
+        self.assertEqual(self.candidate_names(['כהן'], ['name']), ['דָּוִד \u200fכֹּהֵן'])
+        self.assertEqual(self.candidate_names(['bob'], ['name']), [])
+
+    def test_other_clients_can_update_and_delete_rows(self):
+        entry = self.session.query(DataEntry).filter_by(name='Bob').one()
+        entry.name = 'דָּוִד \u200fכֹּהֵן'
+        index_updated_entries(self.session)
+        self.session.commit()
+
+        # A plain connection has no search_normalize function
+        connection = sqlite3.connect(self.path)
+        connection.execute("UPDATE data_entries SET role = 'Team Lead' WHERE person_id = '2'")
+        connection.execute("DELETE FROM data_entries WHERE person_id = '1'")
+        connection.commit()
+        connection.close()
+
+        self.session.expire_all()
+        self.assertEqual(self.candidate_names(['lead'], ['role']), ['דָּוִד \u200fכֹּהֵן'])
+        index_updated_entries(self.session)
+        self.session.commit()
+        self.assertEqual(self.candidate_names(['lead'], ['role']), ['דָּוִד \u200fכֹּהֵן'])
+        self.assertEqual(self.candidate_names(['ager'], ['role']), [])
+        self.assertEqual(self.candidate_names(['gin'], ['role']), [])
+
+        self.session.query(DataEntry).delete()
+        self.session.commit()
+        self.assertEqual(self.candidate_names(['כהן'], ['name']), [])
+        self.assertEqual(self.session.execute(text(f"SELECT count(*) FROM {SEARCH_FOLDED_TABLE}")).scalar(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
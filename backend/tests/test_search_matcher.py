@@ -0,0 +1,32 @@
+import unittest
+from backend.app import parse_complex_query, get_matched_terms, compile_matcher, get_compiled_query
+
+QUERIES = [
+    'eng',
+    'Eng AND NOT Dan',
+    '"gus"',
+    'Alice OR Gus',
+    'eng lead',
+    'NOT (alice OR bob)',
+    '(eng OR ops) AND NOT lead',
+    'a AND b OR c',
+    'NOT eng'
+]
+
+TEXTS = ['Engineering Lead', 'Alice', 'Bob the builder', 'Ops', 'None', '', 'gus', '"gus"', 'A B C', 'Dana Eng']
+
+class TestSearchMatcher(unittest.TestCase):
+
+    def test_matches_get_matched_terms(self):
+        for query in QUERIES:
+            parsed_query = parse_complex_query(query)
+            matcher = compile_matcher(parsed_query)
+            for text in TEXTS:
+                with self.subTest(query=query, text=text):
+                    self.assertEqual(matcher(text), get_matched_terms(text, parsed_query))
+
+    def test_compiled_query_is_cached(self):
+        self.assertIs(get_compiled_query('eng OR ops'), get_compiled_query('eng OR ops'))
+
+if __name__ == '__main__':
+    unittest.main()
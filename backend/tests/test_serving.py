@@ -0,0 +1,74 @@
+import unittest
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from unittest.mock import patch
+from backend import serving
+from backend.serving import make_pooled_server
+
+def slow_app(environ, start_response):
+    time.sleep(0.2)
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [threading.current_thread().name.encode()]
+
+class TestPooledServer(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.dict(serving.database_options)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        broker_patcher = patch.object(serving.broker, 'max_subscribers', serving.broker.max_subscribers)
+        broker_patcher.start()
+        self.addCleanup(broker_patcher.stop)
+
+    def serve(self, workers):
+        server = make_pooled_server(slow_app, port=0, workers=workers)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return server.server_port
+
+    def get(self, port):
+        connection = HTTPConnection('127.0.0.1', port, timeout=5)
+        try:
+            connection.request('GET', '/')
+            response = connection.getresponse()
+            return response.status, response.read().decode()
+        finally:
+            connection.close()
+
+    def timed_requests(self, port, count):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=count) as clients:
+            responses = list(clients.map(lambda _: self.get(port), range(count)))
+        return time.perf_counter() - start, responses
+
+    def test_workers_handle_requests_concurrently(self):
+        elapsed, responses = self.timed_requests(self.serve(4), 4)
+
+        self.assertEqual({status for status, _ in responses}, {200})
+        self.assertEqual(len({name for _, name in responses}), 4)
+        self.assertLess(elapsed, 0.6)
+
+    def test_requests_beyond_the_pool_wait_for_a_worker(self):
+        elapsed, responses = self.timed_requests(self.serve(1), 3)
+
+        self.assertEqual([status for status, _ in responses], [200] * 3)
+        self.assertGreaterEqual(elapsed, 0.6)
+
+    def test_shared_resources_are_sized_for_the_workers(self):
+        self.serve(6)
+
+        self.assertEqual(serving.database_options, {'pool_size': 6, 'echo': False, 'replica': False})
+        self.assertEqual(serving.broker.max_subscribers, 3)
+        with self.assertRaises(ValueError):
+            make_pooled_server(slow_app, port=0, workers=0)
+
+    def test_a_single_worker_still_serves_an_event_stream(self):
+        self.serve(1)
+
+        self.assertEqual(serving.broker.max_subscribers, 1)
+
+if __name__ == '__main__':
+    unittest.main()
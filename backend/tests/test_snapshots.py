@@ -0,0 +1,111 @@
+import unittest
+from datetime import date, timedelta
+from unittest.mock import patch
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, DeltaEntry
+from backend.utils import insert_data_entries, get_age_distribution
+from backend.snapshots import load_snapshot_entries, ensure_full_storage, KEYFRAME_INTERVAL
+
+def make_snapshot(names):
+    return pd.DataFrame({
+        'hierarchical_structure': ['/1'] + [f'/1/{i}' for i in range(1, len(names))],
+        'name': names,
+        'role': ['Manager'] + ['Engineer'] * (len(names) - 1),
+        'person_id': [str(100 + i) for i in range(len(names))],
+        'birth_date': ['1980-01-01'] * len(names)
+    })
+
+class TestSnapshots(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        self.folder = Folder(name='Delta Folder', storage_mode='delta')
+        self.session.add(self.folder)
+        self.session.flush()
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def add_table(self, index, df, folder=None):
+        table = Table(name=f'snapshot_{index}.csv', folder_id=(folder or self.folder).id, upload_date=date(2024, 1, 1) + timedelta(days=30 * index))
+        self.session.add(table)
+        self.session.flush()
+        insert_data_entries(self.session, table.id, df)
+        self.session.flush()
+        self.session.expire_all()
+        return table
+
+    def rows_by_structure(self, table_id):
+        return {row.hierarchical_structure: row.name for row in load_snapshot_entries(self.session, table_id)}
+
+    def contents(self, rows):
+        return {row.hierarchical_structure: row._asdict() | {'id': None, 'table_id': None} for row in rows}
+
+    def test_delta_table_reconstructs_rows(self):
+        first = self.add_table(1, make_snapshot(['Alice', 'Bob', 'Carol', 'Dan', 'Eve']))
+        second = self.add_table(2, make_snapshot(['Alice', 'Bob', 'Carol', 'Dana']))
+
+        self.assertEqual(first.storage_mode, 'full')
+        self.assertEqual(second.storage_mode, 'delta')
+        self.assertEqual(self.session.query(DataEntry).filter_by(table_id=second.id).count(), 0)
+        self.assertEqual(self.session.query(DeltaEntry).filter_by(table_id=second.id).count(), 2)
+        self.assertEqual(self.rows_by_structure(second.id), {
+            '/1': 'Alice', '/1/1': 'Bob', '/1/2': 'Carol', '/1/3': 'Dana'
+        })
+
+    def test_keyframe_after_interval(self):
+        names = ['Alice', 'Bob', 'Carol', 'Dan', 'Eve']
+        tables = []
+        for index in range(1, KEYFRAME_INTERVAL + 3):
+            names[-1] = f'Eve {index}'
+            tables.append(self.add_table(index, make_snapshot(names)))
+
+        modes = [table.storage_mode for table in tables]
+        self.assertEqual(modes[0], 'full')
+        self.assertEqual(modes[1:KEYFRAME_INTERVAL + 1], ['delta'] * KEYFRAME_INTERVAL)
+        self.assertEqual(modes[KEYFRAME_INTERVAL + 1], 'full')
+        self.assertEqual(self.rows_by_structure(tables[-1].id)['/1/4'], f'Eve {KEYFRAME_INTERVAL + 2}')
+
+    def test_ensure_full_storage_keeps_dependents(self):
+        first = self.add_table(1, make_snapshot(['Alice', 'Bob', 'Carol']))
+        second = self.add_table(2, make_snapshot(['Alice', 'Bob', 'Carla']))
+
+        ensure_full_storage(self.session, first.id)
+        self.session.query(DataEntry).filter_by(table_id=first.id, hierarchical_structure='/1').update({'name': 'Alicia'})
+        self.session.expire_all()
+
+        self.assertEqual(second.storage_mode, 'full')
+        self.assertEqual(self.rows_by_structure(second.id)['/1'], 'Alice')
+        self.assertEqual(self.rows_by_structure(first.id)['/1'], 'Alicia')
+
+    def test_delta_and_full_storage_return_the_same_snapshot(self):
+        full_folder = Folder(name='Full Folder', storage_mode='full')
+        self.session.add(full_folder)
+        self.session.flush()
+        snapshots = [
+            make_snapshot(['Alice', 'Bob', 'Carol', 'Dan', 'Eve']),
+            make_snapshot(['Alice', 'Bob', 'Carol', 'Dana', 'Eve']),
+            make_snapshot(['Alice', 'Bob', 'Carla', 'Dana', 'Eve'])
+        ]
+        # Years apart, so the ages of unchanged rows depend on which upload_date they carry
+        pairs = [(self.add_table(365 * index, df), self.add_table(365 * index, df, full_folder)) for index, df in enumerate(snapshots)]
+        self.session.commit()
+
+        for delta, full in pairs[1:]:
+            self.assertEqual(delta.storage_mode, 'delta')
+            delta_rows = load_snapshot_entries(self.session, delta.id)
+            full_rows = load_snapshot_entries(self.session, full.id)
+            self.assertEqual(len({row.id for row in delta_rows}), len(delta_rows))
+            self.assertEqual(self.contents(delta_rows), self.contents(full_rows))
+            self.assertEqual({row.upload_date for row in delta_rows}, {delta.upload_date})
+            with patch('backend.utils.get_session', side_effect=self.Session):
+                self.assertEqual(get_age_distribution(delta.id), get_age_distribution(full.id))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from datetime import date
+from unittest.mock import patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry, TimeSeriesPoint
+from backend.timeseries import get_folder_timeseries, invalidate_table_points, compute_point
+from backend.change_log import record_node_changes
+
+class TestTimeSeries(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine('sqlite:///:memory:')
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        self.folder_id = folder.id
+
+    def tearDown(self):
+        self.session.close()
+        Base.metadata.drop_all(self.engine)
+
+    def add_table(self, upload_date, rows):
+        table = Table(name='snapshot.csv', folder_id=self.folder_id, upload_date=upload_date)
+        self.session.add(table)
+        self.session.flush()
+        for structure, person_id, department, rank in rows:
+            self.session.add(DataEntry(
+                table_id=table.id, hierarchical_structure=structure, upload_date=upload_date,
+                person_id=person_id, name=f'Person {person_id}', role='Staff', department=department, rank=rank
+            ))
+        self.session.commit()
+        return table.id
+
+    def test_series_across_snapshots(self):
+        self.add_table(date(2024, 1, 1), [('/1', '1', 'Eng', '1'), ('/1/1', '2', 'Eng', '1'), ('/1/2', '3', 'Ops', '1')])
+        self.add_table(date(2024, 2, 1), [('/1', '1', 'Eng', '1'), ('/1/1', '2', 'Eng', '2'), ('/1/2', '4', 'Sales', '1'),
+                                          ('/1/3', '5', None, '1')])
+
+        result = get_folder_timeseries(self.session, self.folder_id)
+
+        self.assertEqual(result['series']['headcount'], [3, 4])
+        self.assertEqual(result['series']['joins'], [None, 2])
+        self.assertEqual(result['series']['departures'], [None, 1])
+        self.assertEqual(result['series']['promotions'], [None, 1])
+        self.assertEqual(result['series']['department_sizes'], {'Eng': [2, 2], 'Ops': [1, 0], 'Sales': [0, 1]})
+        self.assertEqual(result['computed_points'], 2)
+
+    def test_appended_snapshot_reuses_points(self):
+        self.add_table(date(2024, 1, 1), [('/1', '1', 'Eng', '1')])
+        second = self.add_table(date(2024, 2, 1), [('/1', '1', 'Eng', '1'), ('/1/1', '2', 'Eng', '1')])
+        get_folder_timeseries(self.session, self.folder_id)
+
+        self.add_table(date(2024, 3, 1), [('/1', '1', 'Eng', '1')])
+        result = get_folder_timeseries(self.session, self.folder_id)
+
+        self.assertEqual((result['computed_points'], result['reused_points']), (1, 2))
+        self.assertEqual(result['series']['departures'], [None, 0, 1])
+
+        invalidate_table_points(self.session, second)
+        self.session.commit()
+
+        self.assertEqual(self.session.query(TimeSeriesPoint).count(), 1)
+        self.assertEqual(get_folder_timeseries(self.session, self.folder_id)['computed_points'], 2)
+
+    def test_point_computed_before_an_edit_is_not_stored(self):
+        table_id = self.add_table(date(2024, 1, 1), [('/1', '1', 'Eng', '1')])
+
+        def compute_while_edited(session, table_id, previous_table_id):
+            point = compute_point(session, table_id, previous_table_id)
+            # Another request edits the snapshot and drops its point before this one is stored
+            record_node_changes(session, [(table_id, '/1')], ['department'])
+            invalidate_table_points(session, table_id)
+            session.commit()
+            return point
+
+        with patch('backend.timeseries.compute_point', side_effect=compute_while_edited):
+            get_folder_timeseries(self.session, self.folder_id)
+
+        self.assertEqual(self.session.query(TimeSeriesPoint).count(), 0)
+        get_folder_timeseries(self.session, self.folder_id)
+        self.assertEqual(self.session.query(TimeSeriesPoint).filter_by(table_id=table_id).count(), 1)
+
+if __name__ == '__main__':
+    unittest.main()
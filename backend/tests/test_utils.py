@@ -1,6 +1,14 @@
+import os
+import tempfile
+import threading
 import unittest
+from datetime import date
 import pandas as pd
-from backend.utils import parse_org_data
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.models import Base, Folder, Table, DataEntry
+from backend.utils import parse_org_data, child_suffixes, next_child_structure, generate_hierarchical_structure
+from backend.relocations import relocate_across_tables
 
 class TestUtils(unittest.TestCase):
 
@@ -143,5 +151,94 @@ class TestUtils(unittest.TestCase):
         org_structure = parse_org_data(df)
         self.assertEqual(org_structure, {})
 
+
+class TestSlotAllocation(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.engine = create_engine(f"sqlite:///{os.path.join(self.directory.name, 'slots.db')}")
+        Base.metadata.create_all(self.engine)
+        self.Session = sessionmaker(bind=self.engine)
+        self.session = self.Session()
+        folder = Folder(name='Test Folder')
+        self.session.add(folder)
+        self.session.flush()
+        table = Table(name='snapshot.csv', folder_id=folder.id, upload_date=date(2024, 1, 1))
+        self.session.add(table)
+        self.session.flush()
+        self.table_id = table.id
+
+    def tearDown(self):
+        self.session.close()
+        self.engine.dispose()
+        self.directory.cleanup()
+
+    def add_structures(self, structures):
+        self.session.add_all([
+            DataEntry(table_id=self.table_id, hierarchical_structure=structure, upload_date=date(2024, 1, 1), name=structure)
+            for structure in structures
+        ])
+        self.session.commit()
+
+    def test_child_suffixes_skip_descendants(self):
+        structures = ['/1', '/1/1', '/1/1/1', '/1/1/1/5', '/1/10', '/1/10/2', '/1/2', '/1/2.5', '/1/9', '/1/A',
+                      '/1/Z/1', '/10', '/10/3', '/1x']
+        self.add_structures(structures)
+
+        for parent in ['/1', '/1/1', '/1/Z', '/10', '/2']:
+            with self.subTest(parent=parent):
+                expected = {structure[len(parent) + 1:].split('/')[0] for structure in structures
+                            if structure.startswith(parent + '/')}
+                suffixes = child_suffixes(self.session, [self.table_id], parent)[self.table_id]
+                self.assertEqual(sorted(suffixes), sorted(expected))
+
+    def test_child_suffixes_end_when_a_sibling_sorts_inside_a_subtree(self):
+        # '/1/2.5' sorts between '/1/2' and its child '/1/2/1'
+        self.add_structures(['/1', '/1/2', '/1/2.5', '/1/2/1', '/1/2.5/1', '/1/2-1', '/1/2 1/1', '/1/3'])
+
+        suffixes = child_suffixes(self.session, [self.table_id], '/1')[self.table_id]
+        self.assertEqual(sorted(suffixes), ['2', '2 1', '2-1', '2.5', '3'])
+        self.assertEqual(generate_hierarchical_structure(self.session, self.table_id, '/1/2'), '/1/2/2')
+
+    def test_next_child_structure_schemes(self):
+        self.assertEqual(next_child_structure('/1', []), '/1/1')
+        self.assertEqual(next_child_structure('/1', ['1', '10', '9']), '/1/11')
+        self.assertEqual(next_child_structure('/1', ['1', 'A']), '/1/B')
+        self.assertEqual(next_child_structure('/1', ['A', 'AB', 'C']), '/1/AC')
+        self.assertEqual(next_child_structure('/1', ['Z']), '/1/AA')
+        self.assertEqual(next_child_structure('/1', ['Z', 'AZ']), '/1/BA')
+        self.assertEqual(next_child_structure('/1', ['ZZ', 'Y']), '/1/AAA')
+        self.assertEqual(next_child_structure('/1', ['x']), '/1/A')
+
+    def test_generate_hierarchical_structure(self):
+        self.add_structures(['/1', '/1/1', '/1/1/7', '/1/3', '/1/3/1/1'])
+
+        self.assertEqual(generate_hierarchical_structure(self.session, self.table_id, '/1'), '/1/4')
+        self.assertEqual(generate_hierarchical_structure(self.session, self.table_id, '/1/1'), '/1/1/8')
+        self.assertEqual(generate_hierarchical_structure(self.session, self.table_id, '/1/3'), '/1/3/2')
+        with self.assertRaises(ValueError):
+            generate_hierarchical_structure(self.session, self.table_id, '')
+
+    def test_concurrent_creations_get_distinct_slots(self):
+        people = [f'/1/{index}' for index in range(1, 7)]
+        self.add_structures(['/1', '/2'] + people)
+        outcomes = {}
+
+        def create(structure):
+            session = self.Session()
+            try:
+                result, error = relocate_across_tables(session, [self.table_id], structure, 'create_new', '/2', 'Analyst')
+                outcomes[structure] = error or result[self.table_id]['changes']['new_node']['hierarchical_structure']
+            finally:
+                session.close()
+
+        threads = [threading.Thread(target=create, args=(structure,)) for structure in people]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(outcomes.values()), [f'/2/{index}' for index in range(1, 7)])
+
 if __name__ == '__main__':
     unittest.main()
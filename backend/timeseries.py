@@ -0,0 +1,148 @@
+from models import TimeSeriesPoint
+from snapshots import snapshot_select, folder_snapshots
+from comparison import diff_tables
+from report_cache import get_cached_report
+from change_log import tables_version, tables_version_select
+from sqlalchemy import select, insert, literal, func, or_
+from sqlalchemy.exc import OperationalError
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+def count_promotions(rank_changes):
+    # Same rule as the promotion rate of the comparison report
+    return sum(1 for change in rank_changes.values() if change["old"] < change["new"])
+
+def compute_point(session, table_id, previous_table_id):
+    """
+    Compute the metrics of one snapshot, relative to the snapshot before it.
+
+    Joins, departures and promotions come from the cached comparison report of the pair
+    when there is one, and from a keyed diff otherwise.
+
+    Args:
+    session (Session): The database session.
+    table_id (int): The ID of the snapshot.
+    previous_table_id (int): The ID of the previous snapshot, or None for the first one.
+
+    Returns:
+    dict: Headcount, department sizes, joins, departures and promotions.
+    """
+    snapshot = snapshot_select(session, table_id).subquery()
+    department_sizes = dict(session.execute(
+        select(snapshot.c.department, func.count()).group_by(snapshot.c.department)
+    ).all())
+
+    point = {
+        "headcount": sum(department_sizes.values()),
+        # Entries without a department only count towards the headcount
+        "department_sizes": {department: size for department, size in department_sizes.items() if department is not None},
+        "joins": None,
+        "departures": None,
+        "promotions": None
+    }
+    if previous_table_id is None:
+        return point
+
+    report = get_cached_report(session, previous_table_id, table_id)
+    changes = report["changes"] if report is not None else diff_tables(session, previous_table_id, table_id)
+    point.update({
+        "joins": len(changes["added"]),
+        "departures": len(changes["removed"]),
+        "promotions": count_promotions(changes["rank_changes"])
+    })
+    return point
+
+def point_tables(table_id, previous_table_id):
+    return [table_id] if previous_table_id is None else [table_id, previous_table_id]
+
+def store_point(session, table_id, previous_table_id, point, version):
+    """
+    Save a point in its own short write transaction, unless its snapshots changed since the
+    version read before it was computed; best effort, like store_report.
+    """
+    session.commit()
+    try:
+        stored = session.execute(insert(TimeSeriesPoint).prefix_with('OR REPLACE').from_select(
+            ['table_id', 'previous_table_id', 'metrics'],
+            select(literal(table_id), literal(previous_table_id), literal(json.dumps(point)))
+            .where(tables_version_select(point_tables(table_id, previous_table_id)) == version)
+        )).rowcount
+        session.commit()
+    except OperationalError as e:
+        session.rollback()
+        logger.warning(f"Could not store time series point for table {table_id}: {str(e)}")
+        return
+    if not stored:
+        logger.info(f"Time series point for table {table_id} not stored, its snapshots changed while it was computed")
+
+def get_folder_timeseries(session, folder_id):
+    """
+    Build the headcount and churn series of a folder, one point per snapshot.
+
+    Points are stored per snapshot together with the predecessor they were computed
+    against. Appending a snapshot only computes the new point; a point is recomputed
+    when its snapshot was edited or its predecessor changed.
+
+    Args:
+    session (Session): The database session.
+    folder_id (int): The ID of the folder.
+
+    Returns:
+    dict: The snapshots in upload order and the series aligned with them.
+    """
+    tables = folder_snapshots(session, folder_id)
+    snapshots = [{"id": t.id, "name": t.name, "upload_date": t.upload_date.isoformat()} for t in tables]
+    table_ids = [t.id for t in tables]
+
+    stored = {
+        point.table_id: point
+        for point in session.query(TimeSeriesPoint).filter(TimeSeriesPoint.table_id.in_(table_ids))
+    } if table_ids else {}
+
+    points = []
+    computed = 0
+    for position, table_id in enumerate(table_ids):
+        previous_table_id = table_ids[position - 1] if position > 0 else None
+        cached = stored.get(table_id)
+        if cached is not None and cached.previous_table_id == previous_table_id:
+            points.append(json.loads(cached.metrics))
+            continue
+
+        version = tables_version(session, point_tables(table_id, previous_table_id))
+        point = compute_point(session, table_id, previous_table_id)
+        store_point(session, table_id, previous_table_id, point, version)
+        points.append(point)
+        computed += 1
+
+    logger.info(f"Time series for folder {folder_id}: {computed} points computed, {len(points) - computed} reused")
+
+    departments = sorted({department for point in points for department in point["department_sizes"]})
+    return {
+        "snapshots": snapshots,
+        "series": {
+            "headcount": [point["headcount"] for point in points],
+            "joins": [point["joins"] for point in points],
+            "departures": [point["departures"] for point in points],
+            "promotions": [point["promotions"] for point in points],
+            "department_sizes": {
+                department: [point["department_sizes"].get(department, 0) for point in points]
+                for department in departments
+            }
+        },
+        "computed_points": computed,
+        "reused_points": len(points) - computed
+    }
+
+def invalidate_table_points(session, table_id):
+    """Drop the stored points that depend on the table. Call it in the transaction that edits the table."""
+    invalidate_tables_points(session, [table_id])
+
+def invalidate_tables_points(session, table_ids):
+    """Drop the stored points that depend on any of the tables, in one statement."""
+    deleted = session.query(TimeSeriesPoint).filter(
+        or_(TimeSeriesPoint.table_id.in_(table_ids), TimeSeriesPoint.previous_table_id.in_(table_ids))
+    ).delete(synchronize_session=False)
+    if deleted:
+        logger.info(f"Invalidated {deleted} time series points for tables {', '.join(map(str, table_ids))}")
@@ -1,9 +1,11 @@
 import pandas as pd
-from models import Table, DataEntry, get_session
+from models import DataEntry, get_session, analyze_data_entries
+from snapshots import load_snapshot_entries, load_snapshot_frame, snapshot_select, store_snapshot_records, folder_snapshots
+from change_log import record_table_reset
 import io
 import logging
 from datetime import datetime
-from sqlalchemy import func
+from sqlalchemy import func, select, text, bindparam
 from datetime import datetime
 import json
 import math
@@ -15,16 +17,15 @@ def check_continuation(folder_id, file_content, file_extension):
     session = get_session()
     try:
         # Get the most recent table for the folder
-        previous_table = session.query(Table).filter_by(folder_id=folder_id).order_by(Table.upload_date.desc()).first()
+        snapshots = folder_snapshots(session, folder_id)
+        previous_table = snapshots[-1] if snapshots else None
 
         # If there's no previous table, it's a valid continuation (initial upload)
         if not previous_table:
             return True
 
         # Get the data from the previous table
-        previous_data = session.query(DataEntry).filter_by(table_id=previous_table.id).all()
-        previous_df = pd.DataFrame([entry.__dict__ for entry in previous_data])
-        previous_df = previous_df.drop('_sa_instance_state', axis=1, errors='ignore')
+        previous_df = load_snapshot_frame(session, previous_table.id)
 
         # Parse the new file
         if file_extension == 'csv':
@@ -270,7 +271,7 @@ def process_excel_data(file_content, file_extension):
     return df
 
 
-def insert_data_entries(session, table_id, df):
+def build_entry_records(table_id, df):
     if table_id is None:
         raise ValueError("table_id cannot be None")
 
@@ -303,6 +304,7 @@ def insert_data_entries(session, table_id, df):
         'organization_id': 'organization_id'
     }
     
+    records = []
     for _, row in df.iterrows():
         # Prepare a dictionary with all fields
         data_entry_dict = {
@@ -316,16 +318,21 @@ def insert_data_entries(session, table_id, df):
                 value = row[df_col]
                 data_entry_dict[entry_attr] = value if pd.notna(value) else None
         
-        # Create the DataEntry object with the prepared dictionary
-        data_entry = DataEntry(**data_entry_dict)
-        session.add(data_entry)
+        records.append(data_entry_dict)
+
+    return records
+
+def insert_data_entries(session, table_id, df):
+    records = build_entry_records(table_id, df)
+    # The folder's storage mode decides whether rows are stored in full or as a delta
+    store_snapshot_records(session, table_id, records)
+    record_table_reset(session, table_id)
+    analyze_data_entries(session.connection())
 
 def get_org_chart(table_id):
     session = get_session()
     try:
-        data_entries = session.query(DataEntry).filter_by(table_id=table_id).all()
-        df = pd.DataFrame([entry.__dict__ for entry in data_entries])
-        df = df.drop('_sa_instance_state', axis=1, errors='ignore')
+        df = load_snapshot_frame(session, table_id)
         
         org_chart, log = parse_org_data(df)
         if log:
@@ -339,9 +346,9 @@ def get_org_chart(table_id):
 def get_department_structure(table_id, department):
     session = get_session()
     try:
-        entries = session.query(DataEntry).filter_by(table_id=table_id, department=department).all()
-        df = pd.DataFrame([entry.__dict__ for entry in entries])
-        df = df.drop('_sa_instance_state', axis=1, errors='ignore')
+        snapshot = snapshot_select(session, table_id).subquery()
+        entries = session.execute(select(snapshot).where(snapshot.c.department == department)).all()
+        df = pd.DataFrame(entries, columns=list(snapshot.c.keys()))
         
         return parse_org_data(df)
     finally:
@@ -350,8 +357,8 @@ def get_department_structure(table_id, department):
 def get_age_distribution(table_id):
     session = get_session()
     try:
-        entries = session.query(DataEntry).filter_by(table_id=table_id).all()
-        ages = [entry.age for entry in entries if entry.age is not None]
+        entries = load_snapshot_entries(session, table_id)
+        ages = [(entry.upload_date - entry.birth_date).days // 365 for entry in entries if entry.birth_date and entry.upload_date]
         return {
             'average': sum(ages) / len(ages) if ages else None,
             'min': min(ages) if ages else None,
@@ -362,7 +369,7 @@ def get_age_distribution(table_id):
         session.close()
         
 def export_excel_data(session, table_id):
-    data_entries = session.query(DataEntry).filter_by(table_id=table_id).all()
+    data_entries = load_snapshot_entries(session, table_id)
     
     df = pd.DataFrame([
         {
@@ -404,48 +411,103 @@ def generate_hierarchical_structure(session, table_id, parent_structure):
     if not parent_structure:
         raise ValueError("Parent structure cannot be empty")
 
-    # Find all direct children of the parent
-    children = session.query(DataEntry).filter(
-        DataEntry.table_id == table_id,
-        DataEntry.hierarchical_structure.like(f"{parent_structure}/%"),
-        ~DataEntry.hierarchical_structure.like(f"{parent_structure}/%/%")  # Exclude grandchildren
-    ).all()
+    return next_child_structure(parent_structure, child_suffixes(session, [table_id], parent_structure)[table_id])
+
+def child_segment_sql(column):
+    """Return SQL cutting a descendant's structure down to the parent's child it lies under."""
+    return (f"CASE WHEN instr(substr({column}, :segment_start), '/') > 0 "
+            f"THEN substr({column}, 1, :segment_start + instr(substr({column}, :segment_start), '/') - 2) ELSE {column} END")
+
+# Walks the children of a node in index order, one seek per child: after each row the scan
+# resumes at the next row below its child's own subtree (a sibling such as child.5 sorts
+# between child and child/), else past that subtree [child/, child0), since '0' follows '/'.
+# Each step seeks strictly past the row it found, so the walk always ends
+CHILD_STRUCTURES_SQL = f"""
+WITH RECURSIVE children(table_id, structure) AS (
+    SELECT tables.id, (SELECT min(hierarchical_structure) FROM data_entries
+                       WHERE table_id = tables.id AND hierarchical_structure > :low AND hierarchical_structure < :high)
+    FROM tables WHERE tables.id IN :table_ids
+    UNION ALL
+    SELECT table_id, coalesce(
+        (SELECT min(hierarchical_structure) FROM data_entries
+         WHERE data_entries.table_id = children.table_id
+         AND hierarchical_structure > children.structure
+         AND hierarchical_structure < {child_segment_sql('children.structure')} || '/'),
+        (SELECT min(hierarchical_structure) FROM data_entries
+         WHERE data_entries.table_id = children.table_id
+         AND hierarchical_structure >= {child_segment_sql('children.structure')} || '0'
+         AND hierarchical_structure < :high))
+    FROM children WHERE structure IS NOT NULL
+)
+SELECT DISTINCT table_id, {child_segment_sql('structure')} FROM children WHERE structure IS NOT NULL
+"""
+
+def child_suffixes(session, table_ids, parent_structure):
+    """
+    Return, for each table, the last part of the structure of every direct child of a node.
+
+    The children are found with index seeks on (table_id, hierarchical_structure) that
+    skip over each child's own descendants, so the cost grows with the number of children
+    rather than the size of the subtree, and no LIKE pattern is involved. A descendant
+    whose parent is missing still reserves the segment it lies under.
+
+    Args:
+    session (Session): The database session.
+    table_ids (list): The IDs of the tables.
+    parent_structure (str): The hierarchical structure of the parent node.
+
+    Returns:
+    dict: Table ID to the list of child suffixes, empty for tables without children.
+    """
+    suffixes = {table_id: [] for table_id in table_ids}
+    statement = text(CHILD_STRUCTURES_SQL).bindparams(bindparam('table_ids', expanding=True))
+    rows = session.execute(statement, {
+        "table_ids": list(table_ids),
+        "low": f"{parent_structure}/",
+        "high": f"{parent_structure}0",
+        "segment_start": len(parent_structure) + 2
+    })
+    for table_id, structure in rows:
+        suffixes[table_id].append(structure[len(parent_structure) + 1:])
+    return suffixes
+
+def next_child_structure(parent_structure, child_suffixes):
+    """
+    Return the hierarchical structure of a new child, given the last parts of its siblings' structures.
+
+    Args:
+    parent_structure (str): The hierarchical structure of the parent node.
+    child_suffixes (list): The last part of the structure of each existing child.
 
-    if not children:
+    Returns:
+    str: The new hierarchical structure.
+    """
+    if not child_suffixes:
         # If no children, add first child
         return f"{parent_structure}/1"
 
-    # Extract the last part from each child's structure
-    child_suffixes = [child.hierarchical_structure.split('/')[-1] for child in children]
-
     # Check if all suffixes are numeric
     if all(suffix.isdigit() for suffix in child_suffixes):
         # If all numeric, increment the highest number
         next_number = max(int(suffix) for suffix in child_suffixes) + 1
         return f"{parent_structure}/{next_number}"
     else:
-        # If non-numeric suffixes exist, use alphabetical ordering
-        alphabet = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
-        existing_letters = [suffix for suffix in child_suffixes if suffix in alphabet]
-        
-        if existing_letters:
-            # Find the next available letter
-            last_letter = max(existing_letters)
-            if last_letter != 'Z':
-                next_letter = alphabet[alphabet.index(last_letter) + 1]
-                return f"{parent_structure}/{next_letter}"
-            else:
-                # If we've reached 'Z', start with 'AA', 'AB', etc.
-                double_letters = [suffix for suffix in child_suffixes if len(suffix) == 2 and suffix.isalpha()]
-                if double_letters:
-                    last_double = max(double_letters)
-                    if last_double != 'ZZ':
-                        next_double = last_double[0] + alphabet[alphabet.index(last_double[1]) + 1]
-                        return f"{parent_structure}/{next_double}"
-                    else:
-                        return f"{parent_structure}/AAA"  # Start triple letters if 'ZZ' is reached
-                else:
-                    return f"{parent_structure}/AA"  # Start double letters if 'Z' is reached
-        else:
+        # If non-numeric suffixes exist, continue the letter sequence A..Z, AA..ZZ, AAA..
+        letters = [suffix for suffix in child_suffixes if suffix.isascii() and suffix.isalpha() and suffix.isupper()]
+        if not letters:
             # If no alphabetical suffixes exist, start with 'A'
-            return f"{parent_structure}/A"
\ No newline at end of file
+            return f"{parent_structure}/A"
+        # Shorter sequences come first, so the highest is the longest, then the last alphabetically
+        return f"{parent_structure}/{next_letter_suffix(max(letters, key=lambda suffix: (len(suffix), suffix)))}"
+
+def next_letter_suffix(suffix):
+    """Return the letter suffix after another one: 'B' after 'A', 'AA' after 'Z', 'BA' after 'AZ', 'AAA' after 'ZZ'."""
+    letters = list(suffix)
+    position = len(letters) - 1
+    while position >= 0 and letters[position] == 'Z':
+        letters[position] = 'A'
+        position -= 1
+    if position < 0:
+        return 'A' + ''.join(letters)
+    letters[position] = chr(ord(letters[position]) + 1)
+    return ''.join(letters)
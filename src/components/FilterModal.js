@@ -35,6 +35,11 @@ const AnimatedLogo = () => (
   </svg>
 );
 
+// Results are fetched in pages; "Load more" fetches the next one
+const PAGE_SIZE = 200;
+const FACET_FIELDS = ["department", "rank", "role"];
+const FACET_PREVIEW = 5;
+
 const columnTypes = [
   { key: "department", label: "Department", Icon: Briefcase },
   { key: "name", label: "Name", Icon: User },
@@ -59,32 +64,78 @@ const FilterModal = ({
   const [isResultsFetched, setIsResultsFetched] = useState(false);
   const [showColumnSelection, setShowColumnSelection] = useState(false);
   const [selectedColumns, setSelectedColumns] = useState([]);
+  const [activeSearch, setActiveSearch] = useState({ query: "", columns: [] });
+  const [nextCursor, setNextCursor] = useState(null);
+  const [totalResults, setTotalResults] = useState(0);
+  const [isTotalExact, setIsTotalExact] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
+  const [facets, setFacets] = useState(null);
+
+  const fetchPage = useCallback(
+    (query, columns, cursor) =>
+      axios.get(`http://localhost:5000/search/${folderId}/${tableId}`, {
+        params: {
+          query: query,
+          columns: columns.join(","),
+          limit: PAGE_SIZE,
+          // Facets cover the whole result, so only the first page asks for them
+          ...(cursor ? { cursor } : { facets: FACET_FIELDS.join(",") }),
+        },
+      }),
+    [folderId, tableId]
+  );
 
   const fetchResults = useCallback(
     async (query = "", columns = []) => {
       setIsLoading(true);
+      setActiveSearch({ query, columns });
       try {
-        const response = await axios.get(
-          `http://localhost:5000/search/${folderId}/${tableId}`,
-          {
-            params: {
-              query: query,
-              columns: columns.join(","),
-            },
-          }
-        );
+        const response = await fetchPage(query, columns, null);
         setResults(response.data.results);
+        setNextCursor(response.data.next_cursor);
+        setTotalResults(response.data.total_results);
+        setIsTotalExact(response.data.total_is_exact);
+        setFacets(response.data.facets || null);
         setIsResultsFetched(true);
       } catch (error) {
         console.error("Error fetching results:", error);
         setResults([]);
+        setNextCursor(null);
+        setTotalResults(0);
+        setIsTotalExact(true);
+        setFacets(null);
       } finally {
         setIsLoading(false);
       }
     },
-    [folderId, tableId]
+    [fetchPage]
   );
 
+  const handleLoadMore = async () => {
+    if (!nextCursor || isLoadingMore) {
+      return;
+    }
+    setIsLoadingMore(true);
+    try {
+      const response = await fetchPage(
+        activeSearch.query,
+        activeSearch.columns,
+        nextCursor
+      );
+      setResults((prev) => [...prev, ...response.data.results]);
+      setNextCursor(response.data.next_cursor);
+      if (response.data.total_is_exact) {
+        setTotalResults(response.data.total_results);
+        setIsTotalExact(true);
+      }
+    } catch (error) {
+      console.error("Error fetching more results:", error);
+      toast.error("Could not load more results", { autoClose: 2000 });
+    } finally {
+      setIsLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     if (isOpen) {
       fetchResults("");
@@ -100,6 +151,11 @@ const FilterModal = ({
       setIsResultsFetched(false);
       setShowColumnSelection(false);
       setSelectedColumns([]);
+      setActiveSearch({ query: "", columns: [] });
+      setNextCursor(null);
+      setTotalResults(0);
+      setIsTotalExact(true);
+      setFacets(null);
     };
 
     if (resetTrigger) {
@@ -172,6 +228,17 @@ const FilterModal = ({
             onSelect={toggleResultSelection}
           />
         ))}
+        {nextCursor && (
+          <div className="col-span-full flex justify-center mt-2">
+            <Button
+              onClick={handleLoadMore}
+              icon={ChevronDown}
+              variant="secondary"
+            >
+              {isLoadingMore ? "Loading..." : "Load more"}
+            </Button>
+          </div>
+        )}
       </div>
     );
   };
@@ -336,9 +403,38 @@ const FilterModal = ({
                       </span>
                     </div>
                     <span className="text-2xl font-bold text-blue-600">
-                      {results.length}
+                      {nextCursor
+                        ? `${results.length} of ${totalResults}${isTotalExact ? "" : "+"}`
+                        : results.length}
                     </span>
                   </motion.div>
+                  {facets && (
+                    <div className="mb-3 grid grid-cols-3 gap-2 text-xs">
+                      {FACET_FIELDS.map((field) => (
+                        <div
+                          key={field}
+                          className="p-2 bg-white bg-opacity-60 rounded-lg"
+                        >
+                          <div className="font-semibold text-blue-800 capitalize mb-1">
+                            {field}
+                          </div>
+                          {facets[field].values
+                            .slice(0, FACET_PREVIEW)
+                            .map(({ value, count }) => (
+                              <div
+                                key={String(value)}
+                                className="flex justify-between text-gray-700"
+                              >
+                                <span className="truncate mr-2">
+                                  {value ?? "—"}
+                                </span>
+                                <span className="font-semibold">{count}</span>
+                              </div>
+                            ))}
+                        </div>
+                      ))}
+                    </div>
+                  )}
                   {renderResults()}
                 </>
               ) : (
@@ -109,6 +109,9 @@ const UpdateHierarchicalInfoSection = ({ node, onBack, folderId, tableId, onUpda
         if (response.data && response.data.results) {
           const persons = response.data.results
             .filter(person => person.hierarchical_structure !== node.hierarchical_structure)
+            // A subtree cannot be moved under one of its own members
+            .filter(person => updateType?.value !== 'move_subtree' ||
+              !person.hierarchical_structure.startsWith(`${node.hierarchical_structure}/`))
             .map(person => ({
               value: person.hierarchical_structure,
               label: person.name,
@@ -216,7 +219,7 @@ const UpdateHierarchicalInfoSection = ({ node, onBack, folderId, tableId, onUpda
       case "Missing required parameters":
         toast.error("Missing required information. Please fill all fields.");
         break;
-      case "Invalid update type. Must be 'create_new' or 'override'":
+      case "Invalid update type. Must be 'create_new', 'override' or 'move_subtree'":
         toast.error("Invalid update type selected. Please try again.");
         break;
       case "New role must be provided for create_new operation":
@@ -243,7 +246,8 @@ const UpdateHierarchicalInfoSection = ({ node, onBack, folderId, tableId, onUpda
       <Select
         options={[
           { value: 'override', label: 'Override Existing Node' },
-          { value: 'create_new', label: 'Create New Node' }
+          { value: 'create_new', label: 'Create New Node' },
+          { value: 'move_subtree', label: 'Move With Subordinates' }
         ]}
         value={updateType}
         onChange={setUpdateType}
@@ -324,6 +328,8 @@ const UpdateHierarchicalInfoSection = ({ node, onBack, folderId, tableId, onUpda
         <span className="font-medium">Override:</span> Replace an existing node with this one.
         <br />
         <span className="font-medium">Create New:</span> Add this node as a child of another node.
+        <br />
+        <span className="font-medium">Move With Subordinates:</span> Move this node and everyone under it to another node.
       </motion.div>
     </div>
   );
@@ -493,18 +499,22 @@ const UpdateHierarchicalInfoSection = ({ node, onBack, folderId, tableId, onUpda
                   after={targetPerson?.label}
                   onChangeCount={handleChangeCount}
                 />
-                <ComparisonRow 
-                  label="Role"
-                  before={node.role}
-                  after={newRole}
-                  onChangeCount={handleChangeCount}
-                />
-                <ComparisonRow 
-                  label="Department"
-                  before={node.department}
-                  after={targetPerson?.department}
-                  onChangeCount={handleChangeCount}
-                />
+                {updateType?.value === 'create_new' && (
+                  <>
+                    <ComparisonRow 
+                      label="Role"
+                      before={node.role}
+                      after={newRole}
+                      onChangeCount={handleChangeCount}
+                    />
+                    <ComparisonRow 
+                      label="Department"
+                      before={node.department}
+                      after={targetPerson?.department}
+                      onChangeCount={handleChangeCount}
+                    />
+                  </>
+                )}
               </>
             )}
           </div>